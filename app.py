@@ -1,7 +1,6 @@
 from flask import (
     Flask,
     request,
-    jsonify,
     abort,
     render_template,
     redirect,
@@ -10,14 +9,40 @@ from flask import (
 
 import json
 from flask_cors import CORS
-
-from models import setup_db, Gnss, Signal
-from auth import AuthError, requires_auth
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import (
+    setup_db,
+    database_path,
+    db,
+    on_table_change,
+    validate_rows,
+    insert_rows,
+    rows_where,
+    update_rows,
+    delete_rows,
+    search_filter,
+    BATCH_MAX_ITEMS,
+    Gnss,
+    Signal)
+from auth import AuthError, authorize, requires_auth, token_cache
+from pagination import get_page_args, paginate
+from streaming import stream_list
+from fields import get_fields, only_fields
+from serializers import json_response, list_response, negotiate, JSON
+from conditional import conditional
+from response_cache import ResponseCache
+from compression import setup_compression
+from pool import pool_stats
+from replicas import read_only
+from metrics import setup_metrics
+from profiler import setup_profiler
 
 from six.moves.urllib.parse import urlencode
 
 import os
 import sys
+import time
 
 
 def create_app(test_config=None):
@@ -32,12 +57,41 @@ def create_app(test_config=None):
     AUTH0_BASE_URL = 'https://' + os.environ['AUTH0_DOMAIN']
     IDENTIFIER = os.environ['API_AUDIENCE']
 
-    setup_db(app)
+    # Settings of the tests (e.g. their SQLALCHEMY_DATABASE_URI)
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+
+    setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI', database_path))
+
+    # Prometheus metrics at /metrics (first: its after_request hook has
+    # to run after all the others)
+    setup_metrics(app)
+
+    # Server-Timing headers and slow query log (off by default)
+    setup_profiler(app)
+
+    # Serialized pages of the public gnss catalog (per worker)
+    gnss_cache = ResponseCache(
+        max_entries=int(os.environ.get('GNSS_CACHE_SIZE', 256)),
+        ttl=float(os.environ.get('GNSS_CACHE_TTL', 300)))
+
+    @on_table_change
+    def invalidate_gnss_cache(table_names):
+        '''Drops the cached catalog as soon as this worker changes it.'''
+
+        # Pages of ?expand=signals also embed the signals
+        if 'gnss' in table_names or 'signal' in table_names:
+            gnss_cache.clear()
+
+    app.extensions['gnss_cache'] = gnss_cache
 
     # Note: Use caution when using CORS:
     # https://www.pivotpointsecurity.com/blog/cross-origin-resource-sharing-security/
     CORS(app)
 
+    # gzip/brotli responses, precompressed static files
+    setup_compression(app)
+
     # -----------------------------------------------------------------------------------------------------------
 
     @app.after_request
@@ -124,46 +178,173 @@ def create_app(test_config=None):
 
     # -----------------------------------------------------------------------------------------------------------
 
-    @app.route('/gnss')
+    def get_expand():
+        ''' Reads the ?expand= list (comma separated) of GET /gnss.
+            Aborts with a 400 on unknown names.  Embedding the signals
+            needs the get:signals permission, like GET /gnss-signals. '''
+
+        expand = [name for name in request.args.get('expand', '').split(',')
+                  if name]
+
+        if any(name not in ('signals',) for name in expand):
+            abort(400)
+
+        # Same checks and errors as @requires_auth('get:signals')
+        if 'signals' in expand:
+            authorize('get:signals')
+
+        return expand
+
+    def gnss_tables():
+        ''' Tables read by GET /gnss, checked (with the permissions)
+            before a cached or 304 response is sent. '''
+
+        if 'signals' in get_expand():
+            return ('gnss', 'signal')
+
+        return ('gnss',)
+
+    @app.route('/health/db')
     # Does not need @requires_auth decoartor as it is a public endpoint
+    def health_db():
+        ''' Checks the db connection, returns the connection pool and
+            cache metrics (of this worker). '''
+
+        if request.method != 'GET':
+            abort(405)
+
+        start = time.perf_counter()
+
+        try:
+            db.session.execute('SELECT 1')
+        except SQLAlchemyError:
+            abort(500)
+        finally:
+            db.session.close()
+
+        return json_response({'success': True,
+                              'ping_seconds': time.perf_counter() - start,
+                              'pool': pool_stats(db.engine),
+                              'replicas': [pool_stats(engine) for engine
+                                           in app.extensions['replicas']],
+                              'caches': {'gnss': gnss_cache.stats(),
+                                         'token': token_cache.stats()}})
+
+    # -----------------------------------------------------------------------------------------------------------
+
+    @app.route('/gnss')
+    # Public endpoint, except for ?expand=signals (see get_expand())
+    @read_only
+    @conditional(cache=gnss_cache, tables=gnss_tables)
     def get_gnss():
-        '''Gets a GNSS API.'''
+        '''Gets a GNSS API (one page, see ?limit=, ?cursor= and
+        ?expand=signals).'''
 
         if request.method != 'GET':
             abort(405)
 
-        all_gnss_from_db = Gnss.query.all()
+        limit, after_id = get_page_args()
+
+        expand = get_expand()
 
-        if len(all_gnss_from_db) == 0:
+        fields = get_fields(Gnss)
+
+        query = only_fields(Gnss.query, fields)
+        query = query.options(*Gnss.expand_options(expand))
+
+        gnss_from_db, next_cursor = paginate(query, Gnss.id,
+                                             limit, after_id)
+
+        if len(gnss_from_db) == 0 and after_id is None:
             abort(404)
 
         result = {}
         result['success'] = True
-        result['gnss'] = [gnss.format() for gnss in all_gnss_from_db]
+        result['gnss'] = [gnss.format(expand, fields)
+                          for gnss in gnss_from_db]
+        result['next_cursor'] = next_cursor
 
-        return jsonify(result)
+        return list_response(result, 'gnss')
 
     # -----------------------------------------------------------------------------------------------------------
 
     @app.route('/gnss-signals')
+    @read_only
     @requires_auth('get:signals')
+    @conditional('signal')
     def get_gnss_signals(payload):
-        '''Gets GNSS signals API.'''
+        '''Gets GNSS signals API (one page, see ?limit= and ?cursor=,
+        or all of them with ?stream=true).'''
+
+        if request.method != 'GET':
+            abort(405)
+
+        fields = get_fields(Signal)
+
+        # Whole table, written out while it is read (JSON only)
+        if request.args.get('stream', '').lower() in ('1', 'true'):
+            if negotiate() != JSON:
+                abort(406)
+
+            response = stream_list(
+                'signal',
+                only_fields(Signal.query, fields).order_by(Signal.id),
+                fields=fields)
+
+            if response is None:
+                abort(404)
+
+            return response
+
+        limit, after_id = get_page_args()
+
+        gnss_signals_from_db, next_cursor = paginate(
+            only_fields(Signal.query, fields), Signal.id, limit, after_id)
+
+        if len(gnss_signals_from_db) == 0 and after_id is None:
+            abort(404)
+
+        result = {}
+        result['success'] = True
+        result['signal'] = [signal.format(fields=fields)
+                            for signal in gnss_signals_from_db]
+        result['next_cursor'] = next_cursor
+
+        return list_response(result, 'signal')
+
+    # -----------------------------------------------------------------------------------------------------------
+
+    @app.route('/gnss/<int:gnss_id>/signals')
+    @read_only
+    @requires_auth('get:signals')
+    @conditional('gnss', 'signal')
+    def get_signals_of_gnss(payload, gnss_id):
+        '''Gets the signals of one GNSS (one page, see ?limit= and
+        ?cursor=), read with a range scan of ix_signal_gnss_id.'''
 
         if request.method != 'GET':
             abort(405)
 
-        all_gnss_signals_from_db = Signal.query.all()
+        limit, after_id = get_page_args()
+        fields = get_fields(Signal)
 
-        if len(all_gnss_signals_from_db) == 0:
+        gnss_signals_from_db, next_cursor = paginate(
+            only_fields(Signal.query, fields)
+            .filter(Signal.gnss_id == gnss_id),
+            Signal.id, limit, after_id)
+
+        # An empty first page is fine, as long as the gnss exists
+        if len(gnss_signals_from_db) == 0 and after_id is None and \
+                Gnss.query.get(gnss_id) is None:
             abort(404)
 
         result = {}
         result['success'] = True
-        result['signal'] = [signal.format()
-                            for signal in all_gnss_signals_from_db]
+        result['signal'] = [signal.format(fields=fields)
+                            for signal in gnss_signals_from_db]
+        result['next_cursor'] = next_cursor
 
-        return jsonify(result)
+        return list_response(result, 'signal')
 
     # -----------------------------------------------------------------------------------------------------------
 
@@ -197,7 +378,8 @@ def create_app(test_config=None):
             abort(422)
 
         else:
-            return jsonify({'success': True, 'gnss': [new_gnss.format()]})
+            return json_response({'success': True,
+                                  'gnss': [new_gnss.format()]})
 
     # -----------------------------------------------------------------------------------------------------------
 
@@ -231,8 +413,200 @@ def create_app(test_config=None):
             abort(422)
 
         else:
-            return jsonify({'success': True,
-                            'signal': [new_gnss_signal.format()]})
+            return json_response({'success': True,
+                                  'signal': [new_gnss_signal.format()]})
+
+    # -----------------------------------------------------------------------------------------------------------
+
+    def create_batch(model, key):
+        '''Validates a batch of new rows, inserts them and commits once.'''
+
+        rows = request.get_json()
+
+        if not rows or not isinstance(rows, list):
+            abort(400)
+
+        if len(rows) > BATCH_MAX_ITEMS:
+            abort(413)
+
+        errors = validate_rows(model, rows)
+
+        # Nothing is inserted unless every row is valid
+        if any(errors):
+            return json_response({'success': False,
+                                  'error': 422,
+                                  'message': 'Not processable',
+                                  'results': [{'index': index,
+                                               'success': not problems,
+                                               'errors': problems}
+                                              for index, problems
+                                              in enumerate(errors)]}), 422
+
+        error = False
+
+        try:
+            created = insert_rows(model, rows)
+            db.session.commit()
+
+        except SQLAlchemyError as e:
+            error = True
+            db.session.rollback()
+            print(sys.exc_info())
+            print(e)
+
+        if error:
+            abort(422)
+
+        else:
+            return json_response({'success': True,
+                                  key: created,
+                                  'results': [{'index': index,
+                                               'success': True,
+                                               'id': row['id']}
+                                              for index, row
+                                              in enumerate(created)]})
+
+    @app.route('/gnss/batch', methods=['POST'])
+    @requires_auth('post:gnss')
+    def create_gnss_batch(payload):
+        '''Creates up to BATCH_MAX_ITEMS new GNSS in one transaction.'''
+
+        if request.method != 'POST':
+            abort(405)
+
+        return create_batch(Gnss, 'gnss')
+
+    @app.route('/gnss-signals/batch', methods=['POST'])
+    @requires_auth('post:signal')
+    def create_gnss_signal_batch(payload):
+        '''Creates up to BATCH_MAX_ITEMS new GNSS signals in one
+        transaction.'''
+
+        if request.method != 'POST':
+            abort(405)
+
+        return create_batch(Signal, 'signal')
+
+    # -----------------------------------------------------------------------------------------------------------
+
+    def batch_where(model, batch_data):
+        '''Returns the WHERE clause of the rows a batch request targets.'''
+
+        if not isinstance(batch_data, dict):
+            abort(400)
+
+        ids = batch_data.get('ids')
+
+        if isinstance(ids, list) and len(ids) > BATCH_MAX_ITEMS:
+            abort(413)
+
+        try:
+            return rows_where(model, ids, batch_data.get('filter'))
+        except ValueError:
+            abort(400)
+
+    def update_batch(model, key):
+        '''Applies the same changes to a set of rows with one UPDATE.'''
+
+        batch_data = request.get_json()
+        where = batch_where(model, batch_data)
+        changes = batch_data.get('changes')
+
+        if not changes or not isinstance(changes, dict):
+            abort(400)
+
+        problems = validate_rows(model, [changes], partial=True)[0]
+
+        if problems:
+            return json_response({'success': False,
+                                  'error': 422,
+                                  'message': 'Not processable',
+                                  'errors': problems}), 422
+
+        error = False
+
+        try:
+            updated = update_rows(model, where, changes)
+            db.session.commit()
+
+        except SQLAlchemyError as e:
+            error = True
+            db.session.rollback()
+            print(sys.exc_info())
+            print(e)
+
+        if error:
+            abort(422)
+
+        if not updated:
+            abort(404)
+
+        return json_response({'success': True, key: updated})
+
+    def delete_batch(model):
+        '''Deletes a set of rows with one DELETE.'''
+
+        where = batch_where(model, request.get_json())
+
+        error = False
+
+        try:
+            deleted = delete_rows(model, where)
+            db.session.commit()
+
+        except SQLAlchemyError as e:
+            error = True
+            db.session.rollback()
+            print(sys.exc_info())
+            print(e)
+
+        if error:
+            abort(422)
+
+        if not deleted:
+            abort(404)
+
+        return json_response({'success': True, 'delete': deleted})
+
+    @app.route('/gnss/batch', methods=['PATCH'])
+    @requires_auth('patch:gnss')
+    def update_gnss_batch(payload):
+        '''Updates a set of existing GNSS (by ids and/or filter).'''
+
+        if request.method != 'PATCH':
+            abort(405)
+
+        return update_batch(Gnss, 'gnss')
+
+    @app.route('/gnss-signals/batch', methods=['PATCH'])
+    @requires_auth('patch:signal')
+    def update_gnss_signal_batch(payload):
+        '''Updates a set of existing GNSS signals (by ids and/or filter).'''
+
+        if request.method != 'PATCH':
+            abort(405)
+
+        return update_batch(Signal, 'signal')
+
+    @app.route('/gnss/batch', methods=['DELETE'])
+    @requires_auth('delete:gnss')
+    def delete_gnss_batch(payload):
+        '''Deletes a set of existing GNSS (by ids and/or filter).'''
+
+        if request.method != 'DELETE':
+            abort(405)
+
+        return delete_batch(Gnss)
+
+    @app.route('/gnss-signals/batch', methods=['DELETE'])
+    @requires_auth('delete:signal')
+    def delete_gnss_signal_batch(payload):
+        '''Deletes a set of existing GNSS signals (by ids and/or filter).'''
+
+        if request.method != 'DELETE':
+            abort(405)
+
+        return delete_batch(Signal)
 
     # -----------------------------------------------------------------------------------------------------------
 
@@ -270,6 +644,8 @@ def create_app(test_config=None):
             if 'num_frequencies' in gnss_data:
                 gnss_from_db.num_frequencies = gnss_data['num_frequencies']
 
+            gnss_from_db.update()
+
         except SQLAlchemyError as e:
             error = True
             gnss_from_db.cancel()
@@ -281,7 +657,8 @@ def create_app(test_config=None):
             abort(422)
 
         else:
-            return jsonify({'success': True, 'gnss': [gnss_from_db.format()]})
+            return json_response({'success': True,
+                                  'gnss': [gnss_from_db.format()]})
 
     # -----------------------------------------------------------------------------------------------------------
 
@@ -313,10 +690,12 @@ def create_app(test_config=None):
             if 'gnss_id' in signal_data:
                 gnss_signal_from_db.gnss_id = signal_data['gnss_id']
 
+            gnss_signal_from_db.update()
+
         except SQLAlchemyError as e:
             error = True
-            gnss_from_db.cancel()
-            gnss_from_db.close()
+            gnss_signal_from_db.cancel()
+            gnss_signal_from_db.close()
             print(sys.exc_info())
             print(e)
 
@@ -324,8 +703,8 @@ def create_app(test_config=None):
             abort(422)
 
         else:
-            return jsonify({'success': True,
-                            'signal': [gnss_signal_from_db.format()]})
+            return json_response({'success': True,
+                                  'signal': [gnss_signal_from_db.format()]})
 
     # -----------------------------------------------------------------------------------------------------------
 
@@ -356,7 +735,7 @@ def create_app(test_config=None):
             if error:
                 abort(422)
             else:
-                return jsonify({'success': True, 'delete': gnss_id})
+                return json_response({'success': True, 'delete': gnss_id})
 
         else:
             abort(404)
@@ -390,14 +769,61 @@ def create_app(test_config=None):
             if error:
                 abort(422)
             else:
-                return jsonify({'success': True, 'delete': signal_id})
+                return json_response({'success': True, 'delete': signal_id})
 
         else:
             abort(404)
 
     # -----------------------------------------------------------------------------------------------------------
 
-    # TODO: Implement search method
+    def search(model, key):
+        '''Returns one page of the rows matching the ?q= search.'''
+
+        query = request.args.get('q', '').strip()
+        match = request.args.get('match', 'contains')
+
+        if not query or match not in ('prefix', 'contains'):
+            abort(400)
+
+        limit, after_id = get_page_args()
+        fields = get_fields(model)
+
+        rows, next_cursor = paginate(
+            only_fields(model.query, fields)
+            .filter(search_filter(model, query, match)),
+            model.id, limit, after_id)
+
+        if len(rows) == 0 and after_id is None:
+            abort(404)
+
+        return list_response({'success': True,
+                              key: [row.format(fields=fields)
+                                    for row in rows],
+                              'next_cursor': next_cursor}, key)
+
+    @app.route('/gnss/search')
+    # Does not need @requires_auth decoartor as it is a public endpoint
+    @read_only
+    @conditional('gnss')
+    def search_gnss():
+        '''Searches the GNSS by name and owner.'''
+
+        if request.method != 'GET':
+            abort(405)
+
+        return search(Gnss, 'gnss')
+
+    @app.route('/gnss-signals/search')
+    @read_only
+    @requires_auth('get:signals')
+    @conditional('signal')
+    def search_gnss_signals(payload):
+        '''Searches the GNSS signals by signal name.'''
+
+        if request.method != 'GET':
+            abort(405)
+
+        return search(Signal, 'signal')
 
     # -----------------------------------------------------------------------------------------------------------
 
@@ -405,49 +831,66 @@ def create_app(test_config=None):
     def bad_request(error):
         '''Provides the response for a 400 error.'''
 
-        return jsonify({'success': False,
-                        'error': 400,
-                        'message': 'Bad request'}), 400
+        return json_response({'success': False,
+                              'error': 400,
+                              'message': 'Bad request'}), 400
 
     @app.errorhandler(404)
     def not_found(error):
         '''Provides the response for a 404 error.'''
 
-        return jsonify({'success': False,
-                        'error': 404,
-                        'message': 'Not found'}), 404
+        return json_response({'success': False,
+                              'error': 404,
+                              'message': 'Not found'}), 404
 
     @app.errorhandler(405)
     def method_not_allowed(error):
         '''Provides the response for a 405 error.'''
 
-        return jsonify({'success': False,
-                        'error': 405,
-                        'message': 'Method not allowed'}), 405
+        return json_response({'success': False,
+                              'error': 405,
+                              'message': 'Method not allowed'}), 405
+
+    @app.errorhandler(406)
+    def not_acceptable(error):
+        '''Provides the response for a 406 error.'''
+
+        return json_response({'success': False,
+                              'error': 406,
+                              'message': 'Not acceptable'}), 406
+
+    @app.errorhandler(413)
+    def payload_too_large(error):
+        '''Provides the response for a 413 error.'''
+
+        return json_response({'success': False,
+                              'error': 413,
+                              'message': 'Payload too large'}), 413
 
     @app.errorhandler(422)
     def unprocessable(error):
         '''Provides the response for a 422 error.'''
 
-        return jsonify({'success': False,
-                        'error': 422,
-                        'message': 'Not processable'}), 422
+        return json_response({'success': False,
+                              'error': 422,
+                              'message': 'Not processable'}), 422
 
     @app.errorhandler(500)
     def internal_server_error(error):
         '''Provides the response for a 500 error.'''
 
-        return jsonify({'success': False,
-                        'error': 500,
-                        'message': 'Internal server error'}), 500
+        return json_response({'success': False,
+                              'error': 500,
+                              'message': 'Internal server error'}), 500
 
     @app.errorhandler(AuthError)
     def auth_error(e):
         '''Provides the response for an authentication error.'''
 
-        return jsonify({'success': False,
-                        'error': e.status_code,
-                        'message': e.error['description']}), e.status_code
+        return json_response({'success': False,
+                              'error': e.status_code,
+                              'message': e.error['description']}), \
+            e.status_code
 
     # -----------------------------------------------------------------------------------------------------------
 
@@ -0,0 +1,416 @@
+''' Async (ASGI) serving mode of the API.
+
+    The hot read endpoints (GET /gnss, GET /gnss-signals and
+    GET /gnss/<gnss_id>/signals) are answered by coroutines reading the
+    db through an async driver (asyncpg, or aiosqlite for local tests),
+    so a worker keeps serving other requests while it waits on the db
+    or on a JWKS fetch.  Every other request, and any request the async
+    handlers do not answer exactly like the Flask app (errors, ?stream,
+    ?expand, other formats, browsers sending an Origin or a session
+    cookie...), is passed to the Flask app of create_app(), run in a
+    thread pool.  Both share the same RBAC checks, ETags and caches.
+
+    Usage: gunicorn -k uvicorn.workers.UvicornWorker 'asgi:create_asgi_app()'
+    or     uvicorn asgi:app (with ASGI_APP=1) '''
+
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import select
+from urllib.parse import parse_qsl
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header, parse_etags
+import asyncio
+import databases
+import os
+import random
+import re
+import time
+
+from app import create_app
+from auth import verify_decode_jwt, check_permissions
+from compression import ENCODINGS, COMPRESS_MIN_SIZE, compress
+from conditional import make_etag
+from fields import parse_fields
+from metrics import REQUEST_SECONDS, RESPONSE_BYTES, DB_QUERIES, DB_SECONDS
+from models import database_path, Gnss, Signal, TableVersion
+from pagination import parse_page_args, encode_cursor
+from pool import async_pool_options, async_pool_size
+from profiler import (
+    RequestProfile,
+    log_slow_query,
+    profiling_enabled,
+    SQL_PROFILE
+)
+from replicas import DATABASE_REPLICA_URLS, subject_wrote_recently
+from serializers import dumps, MIMETYPES, JSON
+
+# Threads running the Flask app for the requests it answers
+WSGI_THREADS = int(os.environ.get('WSGI_THREADS', 10))
+
+# Headers every API response gets from flask_cors and after_request()
+CORS_HEADERS = [
+    (b'access-control-allow-headers', b'Content-Type, Authorization'),
+    (b'access-control-allow-methods', b'GET, POST, PATCH, DELETE, OPTIONS'),
+    (b'access-control-allow-origin', b'*')
+]
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+class Delegate(Exception):
+    '''Raised by an async endpoint to let the Flask app answer instead.'''
+
+
+class ListRoute:
+    ''' A paginated list endpoint served asynchronously.
+
+        rule: the Flask route (the endpoint label of the metrics)
+        model: Gnss or Signal
+        key: name of the list in the response
+        tables: tables the ETag is built from
+        permission: permission required (None for public endpoints)
+        parent: column filtered on the id in the path, if any
+        cache: name of the ResponseCache of the Flask app, if any '''
+
+    def __init__(self, pattern, rule, model, key, tables, permission=None,
+                 parent=None, cache=None):
+        '''Constructor for the ListRoute class.'''
+
+        self.pattern = re.compile(pattern)
+        self.rule = rule
+        self.model = model
+        self.key = key
+        self.tables = tables
+        self.permission = permission
+        self.parent = parent
+        self.cache = cache
+
+
+ROUTES = [
+    ListRoute(r'^/gnss$', '/gnss', Gnss, 'gnss', ('gnss',),
+              cache='gnss_cache'),
+    ListRoute(r'^/gnss-signals$', '/gnss-signals', Signal, 'signal',
+              ('signal',), permission='get:signals'),
+    ListRoute(r'^/gnss/(\d+)/signals$', '/gnss/<int:gnss_id>/signals',
+              Signal, 'signal', ('gnss', 'signal'),
+              permission='get:signals', parent='gnss_id')
+]
+
+# Query parameters the async endpoints understand
+PARAMS = {'limit', 'cursor', 'fields'}
+
+
+def async_url(url):
+    '''Returns the url of a db for the async drivers.'''
+
+    return re.sub(r'^postgres(ql)?(\+\w+)?://', 'postgresql://', url)
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+class AsyncApi:
+    ''' ASGI application: async list endpoints in front of the Flask app
+        (see the module docstring). '''
+
+    def __init__(self, flask_app, database_url=database_path,
+                 replica_urls=DATABASE_REPLICA_URLS):
+        '''Constructor for the AsyncApi class.'''
+
+        self.flask_app = flask_app
+        self.wsgi = WSGIMiddleware(flask_app, workers=WSGI_THREADS)
+
+        self.primary = self.make_database(database_url)
+        self.replicas = [self.make_database(url) for url in replica_urls]
+
+        self._connect_lock = None
+
+    @staticmethod
+    def make_database(url):
+        '''Returns the (not yet connected) async database of url.'''
+
+        url = async_url(url)
+
+        # Sized and set up like the sync pools, see pool.py
+        return databases.Database(url, **async_pool_options(url))
+
+    async def connect(self):
+        '''Connects the databases (once).'''
+
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+
+        async with self._connect_lock:
+            for database in [self.primary] + self.replicas:
+                if not database.is_connected:
+                    await database.connect()
+
+    async def disconnect(self):
+        '''Closes the connections of the databases.'''
+
+        for database in [self.primary] + self.replicas:
+            if database.is_connected:
+                await database.disconnect()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            for route in ROUTES:
+                match = route.pattern.match(scope['path'])
+
+                if match is None:
+                    continue
+
+                start = time.perf_counter()
+                stats = {'queries': 0, 'seconds': 0.0, 'path': scope['path']}
+
+                if SQL_PROFILE:
+                    stats['profile'] = RequestProfile()
+
+                try:
+                    response = await self.list_endpoint(scope, route, match,
+                                                        stats)
+                except Delegate:
+                    break
+
+                if SQL_PROFILE:
+                    response[1].extend(
+                        (name.lower().encode(), value.encode())
+                        for name, value in stats['profile'].headers(
+                            time.perf_counter() - start))
+
+                await self.send_response(send, *response)
+
+                # Same metrics as metrics.record_request()
+                REQUEST_SECONDS.labels(route.rule, 'GET', str(response[0])) \
+                    .observe(time.perf_counter() - start)
+                RESPONSE_BYTES.labels(route.rule, 'GET') \
+                    .observe(len(response[2]))
+                DB_QUERIES.labels(route.rule, 'GET').observe(stats['queries'])
+                DB_SECONDS.labels(route.rule, 'GET').observe(stats['seconds'])
+
+                return
+
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        '''Connects the databases on startup, disconnects on shutdown.'''
+
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                await self.connect()
+                await send({'type': 'lifespan.startup.complete'})
+
+            elif message['type'] == 'lifespan.shutdown':
+                await self.disconnect()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def send_response(send, status, headers, body):
+        '''Sends a complete response.'''
+
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    # -----------------------------------------------------------------------------------------------------------
+
+    async def authorize(self, headers, permission):
+        ''' Verifies the bearer token (in a thread: it may have to fetch
+            the JWKS) and its permission, like @requires_auth.  Failures
+            are answered by the Flask app, with the same error (any
+            exception: see authorize() in auth.py). '''
+
+        auth_headers = headers.get('authorization', '').split(' ')
+
+        if len(auth_headers) != 2 or auth_headers[0].lower() != 'bearer':
+            raise Delegate()
+
+        loop = asyncio.get_running_loop()
+
+        try:
+            payload = await loop.run_in_executor(None, verify_decode_jwt,
+                                                 auth_headers[1])
+            check_permissions(permission, payload)
+        except Exception:
+            # Not only AuthErrors: an unreachable or stale JWKS or an odd
+            # kid raise others, which @requires_auth turns into a 401
+            raise Delegate()
+
+    @staticmethod
+    async def fetch_all(database, query, stats):
+        '''Runs query, counting it in the stats of the request.'''
+
+        start = time.perf_counter()
+
+        try:
+            return await database.fetch_all(query)
+        finally:
+            seconds = time.perf_counter() - start
+            stats['queries'] += 1
+            stats['seconds'] += seconds
+
+            # Same as the profiler of the Flask app
+            if profiling_enabled():
+                compiled = query.compile()
+
+                if 'profile' in stats:
+                    stats['profile'].record(compiled, seconds)
+
+                log_slow_query(compiled, compiled.params, seconds,
+                               endpoint=stats['path'])
+
+    async def table_versions(self, database, names, stats):
+        '''Async get_table_versions().'''
+
+        table = TableVersion.__table__
+        rows = await self.fetch_all(
+            database,
+            select([table.c.name, table.c.version])
+            .where(table.c.name.in_(names)), stats)
+
+        versions = dict.fromkeys(names, 0)
+        versions.update((row['name'], row['version']) for row in rows)
+
+        return versions
+
+    async def list_endpoint(self, scope, route, match, stats):
+        ''' Answers a list endpoint like the Flask app does, counting its
+            queries in stats.  Returns (status, headers, body), raises
+            Delegate for the requests it leaves to the Flask app. '''
+
+        headers = {name.decode('latin-1'): value.decode('latin-1')
+                   for name, value in scope['headers']}
+
+        # flask_cors echoes the Origin, sessions carry the replica
+        # stickiness: both are handled by the Flask app
+        if 'origin' in headers or 'cookie' in headers:
+            raise Delegate()
+
+        query = parse_qsl(scope['query_string'].decode('latin-1'),
+                          keep_blank_values=True)
+        args = dict(query)
+
+        if len(args) != len(query) or not set(args) <= PARAMS:
+            raise Delegate()
+
+        accept = parse_accept_header(headers.get('accept'), MIMEAccept)
+
+        if accept.best_match(MIMETYPES, default=JSON) != JSON:
+            raise Delegate()
+
+        try:
+            limit, after_id = parse_page_args(args)
+            fields = parse_fields(route.model, args.get('fields'))
+        except ValueError:
+            raise Delegate()
+
+        if route.permission is not None:
+            await self.authorize(headers, route.permission)
+
+        await self.connect()
+
+        # Same as read_only(): a client that just wrote (through the
+        # Flask app of this worker) reads from the primary
+        if self.replicas and not subject_wrote_recently(
+                headers.get('authorization', '')):
+            database = random.choice(self.replicas)
+        else:
+            database = self.primary
+
+        etag = make_etag(await self.table_versions(database, route.tables,
+                                                   stats))
+        response_headers = [(b'content-type', b'application/json')]
+
+        if parse_etags(headers.get('if-none-match')).contains_weak(etag):
+            return 304, [(b'etag', f'"{etag}"'.encode()),
+                         (b'vary', b'Accept')] + CORS_HEADERS, b''
+
+        cache = self.flask_app.extensions.get(route.cache)
+        cache_key = (scope['path'], tuple(sorted(query)), JSON)
+        cached = cache.get(cache_key, etag) if cache is not None else None
+
+        if cached is not None:
+            body = cached[0]
+            response_headers.append((b'x-cache', b'HIT'))
+
+        else:
+            body = await self.fetch_page(database, route, match, limit,
+                                         after_id, fields, stats)
+
+            if cache is not None:
+                cache.put(cache_key, etag, body, JSON)
+                response_headers.append((b'x-cache', b'MISS'))
+
+        # Same as compression.compress_response()
+        encoding = parse_accept_header(headers.get('accept-encoding')) \
+            .best_match(ENCODINGS)
+
+        if encoding is not None and len(body) >= COMPRESS_MIN_SIZE:
+            body = compress(body, encoding)
+            response_headers.append((b'content-encoding', encoding.encode()))
+            etag_header = f'W/"{etag}"'
+        else:
+            etag_header = f'"{etag}"'
+
+        return 200, response_headers + [
+            (b'content-length', str(len(body)).encode()),
+            (b'etag', etag_header.encode()),
+            (b'vary', b'Accept, Accept-Encoding')
+        ] + CORS_HEADERS, body
+
+    async def fetch_page(self, database, route, match, limit, after_id,
+                         fields, stats):
+        ''' Returns the serialized page (the same bytes as the Flask
+            app), raises Delegate for an empty first page. '''
+
+        table = route.model.__table__
+        names = fields or table.columns.keys()
+
+        columns = [table.c[name] for name in names]
+
+        if 'id' not in names:
+            columns.append(table.c.id)
+
+        query = select(columns)
+
+        if route.parent is not None:
+            query = query.where(table.c[route.parent] == int(match.group(1)))
+
+        if after_id is not None:
+            query = query.where(table.c.id > after_id)
+
+        rows = await self.fetch_all(
+            database, query.order_by(table.c.id).limit(limit + 1), stats)
+
+        # 404, or an empty page of an existing gnss
+        if not rows and after_id is None:
+            raise Delegate()
+
+        next_cursor = None
+
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['id'])
+
+        return dumps({
+            'success': True,
+            route.key: [{name: row[name] for name in names} for row in rows],
+            'next_cursor': next_cursor
+        }) + b'\n'
+
+
+def create_asgi_app(test_config=None):
+    '''Returns the ASGI application of the API.'''
+
+    # The sync pools leave the share of the async pools of the worker
+    config = dict(test_config or {}, DB_POOL_RESERVED=async_pool_size())
+
+    return AsyncApi(create_app(config))
+
+
+if os.environ.get('ASGI_APP'):
+    app = create_asgi_app()
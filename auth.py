@@ -1,14 +1,41 @@
-import json
 from flask import request
 from functools import wraps
-from jose import jwt
-from urllib.request import urlopen
+import base64
+import json
 import os
+import time
+
+from jwks import JwksKeyStore, DEFAULT_TTL
+from metrics import JWT_VERIFY_SECONDS
+from token_cache import TokenCache, DEFAULT_SIZE
 
 AUTH0_DOMAIN = os.environ['AUTH0_DOMAIN']
 ALGORITHMS = os.environ['ALGORITHMS']
 API_AUDIENCE = os.environ['API_AUDIENCE']
 
+# ALGORITHMS may list several algorithms (i.e. 'RS256,ES256')
+ALGORITHM_LIST = ALGORITHMS.replace(',', ' ').split()
+
+# Crypto backend used to verify the tokens: 'cryptography' or 'jose'
+JWT_BACKEND = os.environ.get('JWT_BACKEND', 'cryptography')
+
+# The JWKS url can point at a local file (file:///...) or stub server
+JWKS_URL = os.environ.get('JWKS_URL',
+                          f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+
+# Public keys of Auth0, shared by all requests of this worker
+# Note for mac users: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
+jwks_store = JwksKeyStore(
+    JWKS_URL,
+    default_ttl=int(os.environ.get('JWKS_CACHE_TTL', DEFAULT_TTL)),
+    min_refetch_interval=int(os.environ.get('JWKS_MIN_REFETCH_INTERVAL',
+                                            30)),
+    max_stale=int(os.environ.get('JWKS_MAX_STALE', 86400)))
+
+# Payloads of already verified tokens (0 disables the cache)
+token_cache = TokenCache(int(os.environ.get('TOKEN_CACHE_SIZE',
+                                            DEFAULT_SIZE)))
+
 
 class AuthError(Exception):
     ''' AuthError Exception
@@ -89,108 +116,382 @@ def check_permissions(permission, payload):
 # -----------------------------------------------------------------------------------------------------------
 
 
-def verify_decode_jwt(token):
-    ''' @INPUTS
-        token: a json web token (string), it is an Auth0 token with
-        key id (kid).
+def _b64decode(segment):
+    '''Decodes a base64url segment of a JWT (padding is optional).'''
 
-        Verifies the token using Auth0 /.well-known/jwks.json
-        Decodes the payload from the token and validates the claims.
-        Returns the decoded payload. '''
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
 
-    # Get the public key from Auth0
-    # Note for mac users: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
 
-    # Get the data in the header
-    unverified_header = jwt.get_unverified_header(token)
+def _unparsable():
+    '''Returns the AuthError for a token that cannot be verified.'''
 
-    # Choose the proper key
-    rsa_key = {}
+    return AuthError({
+        'code': 'invalid_header',
+        'description': 'Unable to parse authentication token.'
+    }, 400)
 
-    if 'kid' not in unverified_header:
-        raise AuthError({
-            'code': 'invalid_header',
-            'description': 'Authorization malformed.'
-        }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+def _invalid_claims():
+    '''Returns the AuthError for a token with unexpected claims.'''
+
+    return AuthError({
+        'code': 'invalid_claims',
+        'description': 'Incorrect claims. ' +
+                       'Please, check the audience and issuer.'
+    }, 401)
+
+
+class JwtVerifier:
+    ''' Verifies and decodes JWTs signed by the keys of a JwksKeyStore.
+
+        Each JWK is turned into a ready-to-use public key object once and
+        kept, indexed by kid and alg, until the key store hands out a
+        different JWK for that kid (key rotation).  Subclasses provide
+        the crypto backend: key_from_jwk() and verify_signature().
+        Raises the same AuthErrors as jose.jwt.decode did. '''
+
+    name = None
+
+    def __init__(self, store, algorithms, audience, issuer):
+        '''Constructor for the JwtVerifier class.'''
+
+        self.store = store
+        self.algorithms = algorithms
+        self.audience = audience
+        self.issuer = issuer
+
+        # (kid, alg) -> (jwk, public key object)
+        self._keys = {}
+
+    def key_from_jwk(self, jwk, alg):
+        '''Returns the public key object of a JWK (dict).'''
 
-    # Verify the key
-    if rsa_key:
+        raise NotImplementedError
+
+    def verify_signature(self, key, alg, signing_input, signature):
+        '''Returns True if signature is valid for signing_input.'''
+
+        raise NotImplementedError
+
+    def get_key(self, jwk, alg):
+        '''Returns the (cached) public key object of a JWK.'''
+
+        entry = self._keys.get((jwk['kid'], alg))
+
+        if entry is None or entry[0] is not jwk:
+            entry = (jwk, self.key_from_jwk(jwk, alg))
+            self._keys[(jwk['kid'], alg)] = entry
+
+        return entry[1]
+
+    def validate_claims(self, claims):
+        ''' Validates the registered claims like jose does (iat, nbf,
+            exp, aud, iss in this order). '''
+
+        now = int(time.time())
 
         try:
-            # Use the key to verify the jwt
-            payload = jwt.decode(
-                token,
-                rsa_key,
-                algorithms=ALGORITHMS,
-                audience=API_AUDIENCE,
-                issuer='https://' + AUTH0_DOMAIN + '/'
-            )
-
-            return payload
-
-        except jwt.ExpiredSignatureError:
+            if 'iat' in claims:
+                int(claims['iat'])
+
+            if 'nbf' in claims and int(claims['nbf']) > now:
+                raise _invalid_claims()
+
+            expired = 'exp' in claims and int(claims['exp']) < now
+
+        except (TypeError, ValueError):
+            raise _invalid_claims()
+
+        if expired:
             raise AuthError({
                 'code': 'token_expired',
                 'description': 'Token expired.'
             }, 401)
 
-        except jwt.JWTClaimsError:
+        if 'aud' in claims:
+            audiences = claims['aud']
+
+            if isinstance(audiences, str):
+                audiences = [audiences]
+
+            if not isinstance(audiences, list) or \
+                    not all(isinstance(a, str) for a in audiences) or \
+                    self.audience not in audiences:
+                raise _invalid_claims()
+
+        if claims.get('iss') != self.issuer:
+            raise _invalid_claims()
+
+    def decode(self, token):
+        ''' @INPUTS
+            token: a json web token (string) with a key id (kid).
+
+            Verifies the signature of the token and validates its claims.
+            Returns the decoded payload. '''
+
+        try:
+            signing_input, signature = token.rsplit('.', 1)
+            header_segment, payload_segment = signing_input.split('.')
+            header = json.loads(_b64decode(header_segment))
+
+        except Exception:
+            raise _unparsable()
+
+        if not isinstance(header, dict) or 'kid' not in header:
             raise AuthError({
-                'code': 'invalid_claims',
-                'description': 'Incorrect claims. ' +
-                               'Please, check the audience and issuer.'
+                'code': 'invalid_header',
+                'description': 'Authorization malformed.'
             }, 401)
 
-        except Exception:
+        # Get the public key from Auth0 (cached)
+        jwk = self.store.get_key(header['kid'])
+
+        if not jwk:
             raise AuthError({
                 'code': 'invalid_header',
-                'description': 'Unable to parse authentication token.'
+                'description': 'Unable to find the appropriate key.'
             }, 400)
 
-    raise AuthError({
-        'code': 'invalid_header',
-        'description': 'Unable to find the appropriate key.'
-    }, 400)
+        try:
+            alg = header.get('alg')
+
+            if alg not in self.algorithms:
+                raise ValueError(f'Algorithm {alg} not allowed.')
+
+            key = self.get_key(jwk, alg)
+
+            if not self.verify_signature(key, alg,
+                                         signing_input.encode('ascii'),
+                                         _b64decode(signature)):
+                raise ValueError('Signature verification failed.')
+
+            payload = json.loads(_b64decode(payload_segment))
+
+            if not isinstance(payload, dict):
+                raise ValueError('Invalid payload.')
+
+        except Exception:
+            raise _unparsable()
+
+        self.validate_claims(payload)
+
+        return payload
+
+
+class JoseVerifier(JwtVerifier):
+    '''Verifies JWTs with python-jose key objects.'''
+
+    name = 'jose'
+
+    def __init__(self, *args, **kwargs):
+        '''Constructor for the JoseVerifier class.'''
+
+        super().__init__(*args, **kwargs)
+
+        # Imported here so that jose is only loaded when it is used
+        from jose import jwk as jose_jwk
+        self._construct = jose_jwk.construct
+
+    def key_from_jwk(self, jwk, alg):
+        '''Returns the jose key object of a JWK (dict).'''
+
+        return self._construct(jwk, alg)
+
+    def verify_signature(self, key, alg, signing_input, signature):
+        '''Returns True if signature is valid for signing_input.'''
 
+        return key.verify(signing_input, signature)
+
+
+class CryptographyVerifier(JwtVerifier):
+    ''' Verifies JWTs with the cryptography package directly
+        (RS256/384/512 and ES256/384/512). '''
+
+    name = 'cryptography'
+
+    def __init__(self, *args, **kwargs):
+        '''Constructor for the CryptographyVerifier class.'''
+
+        super().__init__(*args, **kwargs)
+
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import (
+            ec, padding, rsa, utils)
+
+        self._invalid_signature = InvalidSignature
+        self._ec = ec
+        self._padding = padding
+        self._rsa = rsa
+        self._utils = utils
+        self._hashes = {'256': hashes.SHA256,
+                        '384': hashes.SHA384,
+                        '512': hashes.SHA512}
+        self._curves = {'P-256': ec.SECP256R1,
+                        'P-384': ec.SECP384R1,
+                        'P-521': ec.SECP521R1}
+
+    def key_from_jwk(self, jwk, alg):
+        '''Returns the cryptography public key of a JWK (dict).'''
+
+        def number(name):
+            return int.from_bytes(_b64decode(jwk[name]), 'big')
+
+        if jwk['kty'] == 'RSA' and alg.startswith('RS'):
+            return self._rsa.RSAPublicNumbers(
+                number('e'), number('n')).public_key()
+
+        if jwk['kty'] == 'EC' and alg.startswith('ES'):
+            return self._ec.EllipticCurvePublicNumbers(
+                number('x'), number('y'),
+                self._curves[jwk['crv']]()).public_key()
+
+        raise ValueError(f'Key type {jwk["kty"]} cannot verify {alg}.')
+
+    def verify_signature(self, key, alg, signing_input, signature):
+        '''Returns True if signature is valid for signing_input.'''
+
+        hash_algorithm = self._hashes[alg[2:]]()
+
+        try:
+            if alg.startswith('RS'):
+                key.verify(signature, signing_input,
+                           self._padding.PKCS1v15(), hash_algorithm)
+
+            else:
+                # JWS uses the raw r || s form, cryptography wants DER
+                size = (key.curve.key_size + 7) // 8
+
+                if len(signature) != 2 * size:
+                    return False
+
+                r = int.from_bytes(signature[:size], 'big')
+                s = int.from_bytes(signature[size:], 'big')
+
+                key.verify(self._utils.encode_dss_signature(r, s),
+                           signing_input, self._ec.ECDSA(hash_algorithm))
+
+        except self._invalid_signature:
+            return False
+
+        return True
+
+
+VERIFIERS = {verifier.name: verifier
+             for verifier in (JoseVerifier, CryptographyVerifier)}
+
+
+def make_verifier(backend, store=None):
+    ''' @INPUTS
+        backend: name of the crypto backend ('jose' or 'cryptography')
+        store: JwksKeyStore of the signing keys (default: jwks_store)
+
+        Returns a JwtVerifier for the Auth0 audience and issuer.
+        Falls back to jose if the backend cannot be imported. '''
+
+    args = (store or jwks_store, ALGORITHM_LIST, API_AUDIENCE,
+            'https://' + AUTH0_DOMAIN + '/')
+
+    try:
+        return VERIFIERS[backend](*args)
+
+    except ImportError:
+        return JoseVerifier(*args)
+
+
+# A typo in JWT_BACKEND fails the boot, not every request
+if JWT_BACKEND not in VERIFIERS:
+    raise ValueError(f'JWT_BACKEND must be one of {", ".join(VERIFIERS)}, '
+                     f'not {JWT_BACKEND!r}')
+
+# Verifies the tokens of all requests of this worker, made by the first
+# one (so the crypto backend is not imported at boot)
+verifier = None
+
+
+def get_verifier():
+    '''Returns the verifier of this worker, made on first use.'''
+
+    global verifier
+
+    if verifier is None:
+        verifier = make_verifier(JWT_BACKEND)
+
+    return verifier
 
 # -----------------------------------------------------------------------------------------------------------
 
-def requires_auth(permission=''):
+
+@JWT_VERIFY_SECONDS.time()
+def verify_decode_jwt(token):
+    ''' @INPUTS
+        token: a json web token (string), it is an Auth0 token with
+        key id (kid).
+
+        Verifies the token using Auth0 /.well-known/jwks.json
+        (cached by jwks_store, see the verifier for the crypto).
+        Decodes the payload from the token and validates the claims.
+        Returns the decoded payload (cached by token_cache until
+        the token expires). '''
+
+    if token_cache.is_revoked(token):
+        raise AuthError({
+            'code': 'token_revoked',
+            'description': 'Token revoked.'
+        }, 401)
+
+    # Already verified and not expired yet
+    payload = token_cache.get(token)
+
+    if payload is not None:
+        return payload
+
+    payload = get_verifier().decode(token)
+
+    token_cache.put(token, payload)
+
+    return payload
+
+
+# -----------------------------------------------------------------------------------------------------------
+
+def authorize(permission=''):
     ''' @INPUTS
         permission: string permission (i.e. 'get:signal')
 
         Uses the get_token_auth_header method to get the token.
-        Uses the verify_decode_jwt method to decode the jwt.
+        Uses the verify_decode_jwt method to decode the jwt (any failure
+        to verify it is a 401).
         Uses the check_permissions method validate claims and
         check the requested permission.
+        Returns the decoded payload. '''
+
+    token = get_token_auth_header()
+    try:
+        payload = verify_decode_jwt(token)
+    except Exception:
+
+        raise AuthError({
+            'code': 'invalid_jwt_payload',
+            'description': 'Unauthorized.'
+        }, 401)
+
+    check_permissions(permission, payload)
+    return payload
+
+
+def requires_auth(permission=''):
+    ''' @INPUTS
+        permission: string permission (i.e. 'get:signal')
+
+        Uses the authorize method to get the decoded payload of the
+        request with the requested permission.
         Returns the decorator which passes the decoded payload
         to the decorated method. '''
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            try:
-                payload = verify_decode_jwt(token)
-            except Exception:
-
-                raise AuthError({
-                    'code': 'invalid_jwt_payload',
-                    'description': 'Unauthorized.'
-                }, 401)
-
-            check_permissions(permission, payload)
+            payload = authorize(permission)
             return f(payload, *args, **kwargs)
 
         return wrapper
@@ -0,0 +1,341 @@
+''' Benchmark of every endpoint of the API on a synthetic dataset.
+
+    Builds the app with create_app() against a local database (a
+    temporary SQLite file, or --database-url), seeds it with 32 gnss and
+    --signals signals (1,000 to 10,000,000), then sends --requests
+    requests to every endpoint through the Flask test client: the public
+    ones and the RBAC ones, with a token signed locally and verified
+    against a file JWKS instead of Auth0.  The writes create, update and
+    delete their own rows.
+
+    Prints (or writes to --output) the throughput and the latency
+    percentiles of every endpoint as JSON, with the commit they were
+    measured at.  --baseline compares them with the output of a previous
+    run (i.e. of another commit).
+
+    Usage: python -m benchmarks.bench_api [--signals 100000]
+           [--requests 200] [--database-url URL] [--output FILE]
+           [--baseline FILE] '''
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Every permission of the API (the director role)
+PERMISSIONS = ['get:signals', 'post:gnss', 'post:signal', 'patch:gnss',
+               'patch:signal', 'delete:gnss', 'delete:signal']
+
+GNSS = 32
+SEED_CHUNK_SIZE = 10000
+
+# Rows per batch request
+BATCH_SIZE = 100
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def seed(app, signals, chunk_size=SEED_CHUNK_SIZE):
+    ''' Recreates the tables of app with GNSS gnss and the given number
+        of signals, inserted chunk_size rows per executemany. '''
+
+    from models import db, Gnss, Signal
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        db.session.execute(Gnss.__table__.insert(), [
+            {'name': f'GNSS {i}', 'owner': 'bench', 'num_satellites': 30,
+             'num_frequencies': 3} for i in range(GNSS)])
+
+        for start in range(0, signals, chunk_size):
+            db.session.execute(Signal.__table__.insert(), [
+                {'signal': f'S{i}', 'gnss_id': i % GNSS + 1}
+                for i in range(start, min(start + chunk_size, signals))])
+
+        db.session.commit()
+
+
+def signal_count(app):
+    '''Returns the number of signals in the database of app.'''
+
+    from models import db, Signal
+
+    with app.app_context():
+        return db.session.query(Signal.id).count()
+
+
+def make_cases(signals, state):
+    ''' Returns the (endpoint, request) cases, in order: request(i)
+        returns the (method, url, json body) of the i-th request.  The
+        writes record the rows they create in state for the next cases
+        to update and delete. '''
+
+    from pagination import encode_cursor
+
+    middle = encode_cursor(signals // 2)
+
+    return [
+        ('GET /', lambda i: ('GET', '/', None)),
+        ('GET /login', lambda i: ('GET', '/login', None)),
+        ('GET /logout', lambda i: ('GET', '/logout', None)),
+        ('GET /loggedin', lambda i: ('GET', '/loggedin', None)),
+        ('GET /loggedout', lambda i: ('GET', '/loggedout', None)),
+        ('GET /gnss', lambda i: ('GET', '/gnss?limit=100', None)),
+        ('GET /gnss?expand=signals',
+         lambda i: ('GET', '/gnss?limit=10&expand=signals', None)),
+        ('GET /gnss/search',
+         lambda i: ('GET', '/gnss/search?q=GNSS%201', None)),
+        ('GET /gnss-signals',
+         lambda i: ('GET', '/gnss-signals?limit=100', None)),
+        ('GET /gnss-signals (middle page)',
+         lambda i: ('GET', f'/gnss-signals?limit=100&cursor={middle}',
+                    None)),
+        ('GET /gnss-signals?fields=id,signal',
+         lambda i: ('GET', '/gnss-signals?limit=100&fields=id,signal',
+                    None)),
+        ('GET /gnss/<id>/signals',
+         lambda i: ('GET', f'/gnss/{i % GNSS + 1}/signals?limit=100', None)),
+        ('GET /gnss-signals/search',
+         lambda i: ('GET', '/gnss-signals/search?q=S1&limit=100', None)),
+        ('GET /health/db', lambda i: ('GET', '/health/db', None)),
+        ('GET /metrics', lambda i: ('GET', '/metrics', None)),
+        ('POST /gnss',
+         lambda i: ('POST', '/gnss', {'name': f'bench {i}', 'owner': 'b',
+                                      'num_satellites': 1,
+                                      'num_frequencies': 1})),
+        ('POST /gnss-signals',
+         lambda i: ('POST', '/gnss-signals',
+                    {'signal': f'bench {i}', 'gnss_id': 1})),
+        ('POST /gnss/batch',
+         lambda i: ('POST', '/gnss/batch',
+                    [{'name': f'batch {i} {n}', 'owner': 'b',
+                      'num_satellites': 1, 'num_frequencies': 1}
+                     for n in range(BATCH_SIZE)])),
+        ('POST /gnss-signals/batch',
+         lambda i: ('POST', '/gnss-signals/batch',
+                    [{'signal': f'batch {i}', 'gnss_id': 2}] * BATCH_SIZE)),
+        ('PATCH /gnss/<id>',
+         lambda i: ('PATCH', f'/gnss/{state["gnss"][i]}',
+                    {'num_satellites': 2})),
+        ('PATCH /gnss-signals/<id>',
+         lambda i: ('PATCH', f'/gnss-signals/{state["signal"][i]}',
+                    {'signal': f'patched {i}'})),
+        ('PATCH /gnss/batch',
+         lambda i: ('PATCH', '/gnss/batch',
+                    {'ids': state['gnss_batch'][i],
+                     'changes': {'num_satellites': 2}})),
+        ('PATCH /gnss-signals/batch',
+         lambda i: ('PATCH', '/gnss-signals/batch',
+                    {'ids': state['batch'][i], 'changes': {'gnss_id': 3}})),
+        ('DELETE /gnss-signals/<id>',
+         lambda i: ('DELETE', f'/gnss-signals/{state["signal"][i]}', None)),
+        ('DELETE /gnss-signals/batch',
+         lambda i: ('DELETE', '/gnss-signals/batch',
+                    {'ids': state['batch'][i]})),
+        ('DELETE /gnss/<id>',
+         lambda i: ('DELETE', f'/gnss/{state["gnss"][i]}', None)),
+        ('DELETE /gnss/batch',
+         lambda i: ('DELETE', '/gnss/batch',
+                    {'ids': state['gnss_batch'][i]}))
+    ]
+
+
+def remember(endpoint, data, state):
+    '''Records the ids of the rows a write case created.'''
+
+    if endpoint == 'POST /gnss':
+        state['gnss'].append(data['gnss'][0]['id'])
+
+    elif endpoint == 'POST /gnss-signals':
+        state['signal'].append(data['signal'][0]['id'])
+
+    elif endpoint == 'POST /gnss/batch':
+        state['gnss_batch'].append([result['id']
+                                    for result in data['results']])
+
+    elif endpoint == 'POST /gnss-signals/batch':
+        state['batch'].append([result['id'] for result in data['results']])
+
+
+def measure(client, headers, request, requests, on_response=None):
+    ''' Sends requests requests and returns their latencies (seconds),
+        the total time and the number of errors.  Bodies are read in
+        full (streamed ones included). '''
+
+    latencies = []
+    errors = 0
+    total = time.perf_counter()
+
+    for i in range(requests):
+        method, url, body = request(i)
+
+        start = time.perf_counter()
+        response = client.open(url, method=method, headers=headers,
+                               json=body)
+        response.get_data()
+        latencies.append(time.perf_counter() - start)
+
+        if response.status_code >= 400:
+            errors += 1
+        elif on_response is not None:
+            on_response(response.get_json())
+
+    return latencies, time.perf_counter() - total, errors
+
+
+def summary(endpoint, latencies, seconds, errors):
+    '''Returns the results of an endpoint.'''
+
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return round(latencies[min(int(len(latencies) * p / 100),
+                                   len(latencies) - 1)] * 1000, 3)
+
+    return {'endpoint': endpoint, 'requests': len(latencies),
+            'errors': errors,
+            'requests_per_second': round(len(latencies) / seconds, 1),
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+            'p50_ms': percentile(50), 'p90_ms': percentile(90),
+            'p99_ms': percentile(99), 'max_ms': round(latencies[-1] * 1000, 3)}
+
+
+def git_commit():
+    '''Returns the commit of the working tree, or None.'''
+
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    '''Prints the ratios of results to a previous run (stderr).'''
+
+    previous = {r['endpoint']: r for r in baseline['results']}
+
+    print(f'{"endpoint":<36} {"req/s":>9} {"p50 ms":>9} {"p99 ms":>9}  '
+          f'(vs {baseline.get("commit")})', file=sys.stderr)
+
+    for r in results['results']:
+        old = previous.get(r['endpoint'])
+
+        if old is None:
+            continue
+
+        rate = r['requests_per_second'] / old['requests_per_second']
+
+        print(f'{r["endpoint"]:<36} {rate:>8.2f}x '
+              f'{r["p50_ms"] / old["p50_ms"]:>8.2f}x '
+              f'{r["p99_ms"] / old["p99_ms"]:>8.2f}x', file=sys.stderr)
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def main():
+    '''Runs the benchmark and prints the results.'''
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--signals', type=int, default=100000,
+                        help='signals seeded in the database')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests per endpoint')
+    parser.add_argument('--stream-requests', type=int, default=3,
+                        help='requests of the whole table (?stream=true)')
+    parser.add_argument('--warmup', type=int, default=10,
+                        help='unmeasured requests per read endpoint')
+    parser.add_argument('--database-url',
+                        help='database to benchmark (default: a temporary '
+                             'SQLite file); its tables are recreated')
+    parser.add_argument('--no-seed', action='store_true',
+                        help='reuse the data of --database-url')
+    parser.add_argument('--output', help='file to write the results to')
+    parser.add_argument('--baseline',
+                        help='results of a previous run to compare with')
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    jwks_path = os.path.join(folder, 'jwks.json')
+
+    os.environ['DATABASE_URL'] = args.database_url or \
+        f'sqlite:///{os.path.join(folder, "gnss.db")}'
+    os.environ['JWKS_URL'] = f'file://{jwks_path}'
+    os.environ.setdefault('APP_SECRET_KEY', 'bench')
+    os.environ.setdefault('CLIENT_ID', 'bench')
+
+    sys.path.insert(0, ROOT)
+
+    # Sets the AUTH0_DOMAIN, ALGORITHMS and API_AUDIENCE defaults
+    from benchmarks.bench_jwt import make_keys, sign
+
+    private_keys, store = make_keys()
+
+    with open(jwks_path, 'w') as f:
+        json.dump({'keys': list(store.keys.values())}, f)
+
+    headers = {'Authorization':
+               f'Bearer {sign(private_keys["RS256"], "RS256", PERMISSIONS)}'}
+
+    from app import create_app
+
+    app = create_app()
+
+    start = time.perf_counter()
+
+    if not args.no_seed:
+        seed(app, args.signals)
+
+    signals = signal_count(app)
+    seed_seconds = time.perf_counter() - start
+
+    client = app.test_client()
+    state = {'gnss': [], 'signal': [], 'batch': [], 'gnss_batch': []}
+    results = []
+
+    for endpoint, request in make_cases(signals, state):
+        if endpoint.startswith('GET'):
+            measure(client, headers, request, args.warmup)
+
+        latencies, seconds, errors = measure(
+            client, headers, request, args.requests,
+            lambda data, endpoint=endpoint: remember(endpoint, data, state))
+        results.append(summary(endpoint, latencies, seconds, errors))
+
+    def stream(i):
+        return 'GET', '/gnss-signals?stream=true', None
+
+    results.append(summary('GET /gnss-signals?stream=true',
+                           *measure(client, headers, stream,
+                                    args.stream_requests)))
+
+    output = {'commit': git_commit(),
+              'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(),
+              'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0],
+              'gnss': GNSS, 'signals': signals,
+              'seed_seconds': round(seed_seconds, 1),
+              'results': results}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    else:
+        print(json.dumps(output, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(output, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
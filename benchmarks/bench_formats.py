@@ -0,0 +1,111 @@
+''' Size and serialization time of the response formats of the list
+    endpoints (see serializers.py).
+
+    Serializes a page of synthetic /gnss-signals rows with Flask's
+    jsonify, with the JSON engine of serializers.py, as columnar JSON
+    and as MessagePack, and prints the body size (raw and gzipped) and
+    the time per serialization.
+
+    Usage: python -m benchmarks.bench_formats [--rows 10000] [--json] '''
+
+import argparse
+import gzip
+import json
+import time
+
+from flask import Flask, jsonify
+
+from serializers import (
+    list_response,
+    msgpack,
+    JSON,
+    JSON_ENGINE,
+    COLUMNAR,
+    MSGPACK
+)
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def make_result(rows):
+    '''Returns a /gnss-signals document of the given number of rows.'''
+
+    names = ['L1 C/A', 'L1C', 'L2 P(Y)', 'L2C', 'L5', 'E1', 'E5A', 'E5B']
+
+    return {'success': True,
+            'signal': [{'id': i + 1, 'signal': names[i % len(names)],
+                        'gnss_id': i % 32 + 1} for i in range(rows)],
+            'next_cursor': None}
+
+
+def measure(app, render, mimetype, repeat):
+    ''' Returns (body, seconds per serialization) of the response made
+        by render() for a request accepting mimetype. '''
+
+    with app.test_request_context(headers={'Accept': mimetype}):
+        body = render().get_data()
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            render().get_data()
+        seconds = (time.perf_counter() - start) / repeat
+
+    return body, seconds
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def main():
+    '''Runs the benchmark and prints the results.'''
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=10000,
+                        help='rows in the serialized page')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='serializations per measurement')
+    parser.add_argument('--json', action='store_true',
+                        help='print machine-readable results')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    result = make_result(args.rows)
+
+    formats = {'json (jsonify)': JSON, f'json ({JSON_ENGINE})': JSON,
+               'columnar json': COLUMNAR}
+
+    if msgpack is not None:
+        formats['msgpack'] = MSGPACK
+
+    results = []
+
+    for name, mimetype in formats.items():
+        if name == 'json (jsonify)':
+            def render():
+                return jsonify(result)
+        else:
+            def render():
+                return list_response(result, 'signal')
+
+        body, seconds = measure(app, render, mimetype, args.repeat)
+
+        results.append({'format': name, 'rows': args.rows,
+                        'bytes': len(body),
+                        'gzip_bytes': len(gzip.compress(body)),
+                        'ms': round(seconds * 1000, 3)})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    baseline = results[0]
+
+    print(f'{"format":<16} {"bytes":>10} {"gzip bytes":>11} {"ms":>9} '
+          f'{"size":>6} {"time":>6}')
+    for r in results:
+        print(f'{r["format"]:<16} {r["bytes"]:>10,} {r["gzip_bytes"]:>11,} '
+              f'{r["ms"]:>9.3f} {r["bytes"] / baseline["bytes"]:>6.2f} '
+              f'{r["ms"] / baseline["ms"]:>6.2f}')
+
+
+if __name__ == '__main__':
+    main()
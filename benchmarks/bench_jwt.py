@@ -0,0 +1,154 @@
+''' Microbenchmark of JWT verification throughput per core.
+
+    Compares the verifier backends of auth.py (and the original
+    jose.jwt.decode call that rebuilt the key on every request) for
+    RS256 and ES256 tokens.  Runs single threaded, so the numbers are
+    verifications per second per core.
+
+    Usage: python -m benchmarks.bench_jwt [--seconds 2] [--json] '''
+
+import argparse
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault('AUTH0_DOMAIN', 'example.auth0.com')
+os.environ.setdefault('ALGORITHMS', 'RS256,ES256')
+os.environ.setdefault('API_AUDIENCE', 'gnss')
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa, utils
+
+from auth import VERIFIERS, ALGORITHM_LIST, API_AUDIENCE, AUTH0_DOMAIN
+from test_auth import b64, b64int, StaticKeyStore
+
+ISSUER = f'https://{AUTH0_DOMAIN}/'
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def make_keys():
+    '''Returns the signing keys and a key store with their JWKs.'''
+
+    rsa_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    ec_key = ec.generate_private_key(ec.SECP256R1())
+
+    rsa_numbers = rsa_key.public_key().public_numbers()
+    ec_numbers = ec_key.public_key().public_numbers()
+
+    store = StaticKeyStore([
+        {'kid': 'rsa', 'kty': 'RSA', 'use': 'sig', 'alg': 'RS256',
+         'n': b64int(rsa_numbers.n), 'e': b64int(rsa_numbers.e)},
+        {'kid': 'ec', 'kty': 'EC', 'use': 'sig', 'alg': 'ES256',
+         'crv': 'P-256',
+         'x': b64(ec_numbers.x.to_bytes(32, 'big')),
+         'y': b64(ec_numbers.y.to_bytes(32, 'big'))}])
+
+    return {'RS256': rsa_key, 'ES256': ec_key}, store
+
+
+def sign(private_key, alg, permissions=('get:signals',)):
+    '''Returns a valid token signed with private_key.'''
+
+    kid = 'rsa' if alg == 'RS256' else 'ec'
+    header = {'alg': alg, 'typ': 'JWT', 'kid': kid}
+    claims = {'iss': ISSUER, 'aud': API_AUDIENCE, 'sub': 'bench',
+              'iat': int(time.time()), 'exp': int(time.time()) + 3600,
+              'permissions': list(permissions)}
+
+    signing_input = (b64(json.dumps(header).encode()) + '.' +
+                     b64(json.dumps(claims).encode())).encode()
+
+    if alg == 'RS256':
+        signature = private_key.sign(signing_input, padding.PKCS1v15(),
+                                     hashes.SHA256())
+    else:
+        r, s = utils.decode_dss_signature(
+            private_key.sign(signing_input, ec.ECDSA(hashes.SHA256())))
+        signature = r.to_bytes(32, 'big') + s.to_bytes(32, 'big')
+
+    return signing_input.decode() + '.' + b64(signature)
+
+
+def measure(decode, token, seconds):
+    '''Returns the number of decode(token) calls per second.'''
+
+    # Warm up (builds the cached key objects)
+    decode(token)
+
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+
+    while True:
+        for _ in range(50):
+            decode(token)
+        count += 50
+
+        now = time.perf_counter()
+        if now >= deadline:
+            return count / (now - start)
+
+
+def jose_per_request(store):
+    '''Returns the original verification: jose.jwt.decode with a JWK.'''
+
+    from jose import jwt
+
+    def decode(token):
+        kid = jwt.get_unverified_header(token)['kid']
+        return jwt.decode(token, dict(store.get_key(kid)),
+                          algorithms=ALGORITHM_LIST, audience=API_AUDIENCE,
+                          issuer=ISSUER)
+
+    return decode
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def main():
+    '''Runs the benchmark and prints the results.'''
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--seconds', type=float, default=2.0,
+                        help='time spent on each measurement')
+    parser.add_argument('--json', action='store_true',
+                        help='print machine-readable results')
+    args = parser.parse_args()
+
+    private_keys, store = make_keys()
+
+    engines = {'jose (per request)': jose_per_request(store)}
+
+    for name, backend in VERIFIERS.items():
+        engines[name] = backend(store, ALGORITHM_LIST, API_AUDIENCE,
+                                ISSUER).decode
+
+    results = []
+
+    for alg, private_key in private_keys.items():
+        token = sign(private_key, alg)
+
+        for name, decode in engines.items():
+            try:
+                rate = measure(decode, token, args.seconds)
+            except Exception as e:
+                print(f'{name} {alg}: {e!r}', file=sys.stderr)
+                continue
+
+            results.append({'engine': name, 'alg': alg,
+                            'verifications_per_second': round(rate, 1)})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f'{"engine":<22} {"alg":<6} {"verifications/s/core":>22}')
+    for result in results:
+        print(f'{result["engine"]:<22} {result["alg"]:<6} '
+              f'{result["verifications_per_second"]:>22,.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+''' Benchmark of the startup of a worker: the time from the spawn of a
+    new process until it has answered its first request.
+
+    Every run spawns a fresh Python process that imports app, calls
+    create_app() and sends GET /gnss through the Flask test client.  The
+    process reports the time of each phase; the total is measured from
+    the spawn, so the interpreter startup is the rest.  With --gunicorn,
+    every run starts gunicorn with one worker instead (without
+    --preload, so the worker does the whole boot) and measures until
+    GET /gnss is first answered over HTTP.
+
+    The database (a temporary SQLite file seeded with 1,000 signals, or
+    --database-url, which is not changed) is set up before the runs,
+    like the database of a deployment that was already migrated.
+
+    Usage: python -m benchmarks.bench_startup [--runs 20] [--gunicorn]
+           [--database-url URL] [--output FILE] '''
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PHASES = ['interpreter', 'imports', 'create_app', 'first_request']
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def boot():
+    ''' Boots the app in this (new) process and prints the time of each
+        phase as JSON. '''
+
+    start = time.perf_counter()
+
+    from app import create_app
+
+    imported = time.perf_counter()
+
+    app = create_app()
+
+    created = time.perf_counter()
+
+    response = app.test_client().get('/gnss')
+    response.get_data()
+
+    answered = time.perf_counter()
+
+    print(json.dumps({'status': response.status_code,
+                      'imports': imported - start,
+                      'create_app': created - imported,
+                      'first_request': answered - created}), flush=True)
+
+
+def time_process():
+    ''' Spawns a process booting the app and returns the time of its
+        phases (seconds), with the total from the spawn. '''
+
+    start = time.perf_counter()
+
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.bench_startup', '--boot'],
+        cwd=ROOT, env=os.environ, stdout=subprocess.PIPE)
+    line = process.stdout.readline()
+    total = time.perf_counter() - start
+
+    process.wait()
+    result = json.loads(line)
+
+    if result.pop('status') != 200:
+        raise RuntimeError('GET /gnss failed')
+
+    result['total'] = total
+    result['interpreter'] = total - sum(result[phase]
+                                        for phase in PHASES[1:])
+
+    return result
+
+
+def time_gunicorn(port):
+    ''' Starts gunicorn with one worker and returns the time (seconds)
+        until it answers GET /gnss. '''
+
+    start = time.perf_counter()
+
+    process = subprocess.Popen(
+        ['gunicorn', 'app:create_app()', '-w', '1',
+         '-b', f'127.0.0.1:{port}', '--chdir', ROOT,
+         '--log-level', 'warning'], env=os.environ)
+
+    try:
+        deadline = start + 30
+
+        while time.perf_counter() < deadline:
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port)
+                connection.request('GET', '/gnss')
+                status = connection.getresponse().status
+                connection.close()
+
+                if status == 200:
+                    return {'total': time.perf_counter() - start}
+
+            except OSError:
+                time.sleep(0.005)
+
+        raise RuntimeError('gunicorn did not start')
+
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait()
+
+
+def summary(runs):
+    '''Returns the median, min and max (ms) of every timing of runs.'''
+
+    return {name: {'median_ms': round(statistics.median(values) * 1000, 1),
+                   'min_ms': round(min(values) * 1000, 1),
+                   'max_ms': round(max(values) * 1000, 1)}
+            for name, values in ((name, [run[name] for run in runs])
+                                 for name in runs[0])}
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def main():
+    '''Runs the benchmark and prints the results.'''
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=20,
+                        help='workers booted')
+    parser.add_argument('--gunicorn', action='store_true',
+                        help='boot gunicorn workers and time them over HTTP')
+    parser.add_argument('--database-url',
+                        help='database of the app (default: a temporary '
+                             'SQLite file)')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--output', help='file to write the results to')
+    parser.add_argument('--boot', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.boot:
+        return boot()
+
+    folder = tempfile.mkdtemp()
+
+    os.environ['DATABASE_URL'] = args.database_url or \
+        f'sqlite:///{os.path.join(folder, "gnss.db")}'
+    os.environ['JWKS_URL'] = f'file://{os.path.join(folder, "jwks.json")}'
+    os.environ.setdefault('APP_SECRET_KEY', 'bench')
+    os.environ.setdefault('CLIENT_ID', 'bench')
+    os.environ.setdefault('AUTH0_DOMAIN', 'bench.auth0.com')
+    os.environ.setdefault('ALGORITHMS', 'RS256')
+    os.environ.setdefault('API_AUDIENCE', 'bench')
+
+    sys.path.insert(0, ROOT)
+
+    from app import create_app
+    from benchmarks.bench_api import git_commit, seed
+
+    # Creates the schema (and the data of the temporary database)
+    app = create_app()
+
+    if not args.database_url:
+        seed(app, 1000)
+
+    if args.gunicorn:
+        runs = [time_gunicorn(args.port) for _ in range(args.runs)]
+    else:
+        runs = [time_process() for _ in range(args.runs)]
+
+    output = {'commit': git_commit(),
+              'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(),
+              'mode': 'gunicorn' if args.gunicorn else 'process',
+              'runs': args.runs,
+              'results': summary(runs)}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    else:
+        print(json.dumps(output, indent=2))
+
+
+if __name__ == '__main__':
+    main()
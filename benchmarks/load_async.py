@@ -0,0 +1,199 @@
+''' Load test of the async serving mode (see asgi.py) against the sync
+    gunicorn workers of the Procfile.
+
+    Seeds a database, then for each server (sync: gunicorn sync workers
+    running app.py, async: gunicorn uvicorn workers running asgi.py, with
+    the same number of workers) and each concurrency level, keeps that
+    many keep-alive clients requesting the list endpoints (with a locally
+    signed JWT, verified against a file JWKS) and prints the throughput
+    and latency percentiles as JSON.
+
+    The gain of the async mode grows with the time requests spend
+    waiting (db round trips, JWKS fetches), so run it against the
+    Postgres of the deployment (--database-url) for realistic numbers.
+
+    Usage: python -m benchmarks.load_async [--workers 2]
+           [--concurrency 1 16 64] [--seconds 10] [--database-url URL] '''
+
+import argparse
+import http.client
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    'sync': ['app:create_app()', '--preload'],
+    'async': ['asgi:create_asgi_app()', '-k', 'uvicorn.workers.UvicornWorker']
+}
+
+PATHS = ['/gnss?limit=100', '/gnss-signals?limit=100',
+         '/gnss/1/signals?limit=100']
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def start_server(name, port, workers):
+    '''Starts a server and waits until it answers.'''
+
+    process = subprocess.Popen(
+        ['gunicorn'] + SERVERS[name] +
+        ['-w', str(workers), '-b', f'127.0.0.1:{port}', '--chdir', ROOT,
+         '--log-level', 'warning'],
+        env=os.environ)
+
+    deadline = time.time() + 30
+
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            connection.request('GET', '/gnss')
+            connection.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+
+    process.kill()
+    raise RuntimeError(f'{name} server did not start')
+
+
+def load(port, token, concurrency, seconds):
+    ''' Returns the latencies (seconds) of the requests made by
+        concurrency clients in seconds, and the number of errors. '''
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client(offset):
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        headers = {'Authorization': f'Bearer {token}'}
+        own = []
+        i = offset
+
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+
+            try:
+                connection.request('GET', PATHS[i % len(PATHS)],
+                                   headers=headers)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port)
+                ok = False
+
+            if ok:
+                own.append(time.perf_counter() - start)
+            else:
+                with lock:
+                    errors[0] += 1
+
+            i += 1
+
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client, args=(n,))
+               for n in range(concurrency)]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return latencies, errors[0]
+
+
+def percentile(values, p):
+    '''Returns the p-th percentile of the sorted values.'''
+
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def main():
+    '''Runs the load test and prints the results.'''
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, default=2,
+                        help='worker processes of every server')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 16, 64], help='concurrent clients')
+    parser.add_argument('--seconds', type=float, default=10.0,
+                        help='duration of every measurement')
+    parser.add_argument('--signals', type=int, default=10000,
+                        help='signals seeded in the database')
+    parser.add_argument('--database-url',
+                        help='database to seed and serve (default: a '
+                             'temporary SQLite file)')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    jwks_path = os.path.join(folder, 'jwks.json')
+
+    os.environ['DATABASE_URL'] = args.database_url or \
+        f'sqlite:///{os.path.join(folder, "gnss.db")}'
+    os.environ['JWKS_URL'] = f'file://{jwks_path}'
+    os.environ.setdefault('APP_SECRET_KEY', 'bench')
+    os.environ.setdefault('CLIENT_ID', 'bench')
+    os.environ['WEB_CONCURRENCY'] = str(args.workers)
+
+    sys.path.insert(0, ROOT)
+
+    # Sets the AUTH0_DOMAIN, ALGORITHMS and API_AUDIENCE defaults
+    from benchmarks.bench_jwt import make_keys, sign
+
+    private_keys, store = make_keys()
+
+    with open(jwks_path, 'w') as f:
+        json.dump({'keys': list(store.keys.values())}, f)
+
+    token = sign(private_keys['RS256'], 'RS256')
+
+    from app import create_app
+    from benchmarks.bench_api import seed
+
+    seed(create_app(), args.signals)
+
+    results = []
+
+    for name in SERVERS:
+        process = start_server(name, args.port, args.workers)
+
+        try:
+            for concurrency in args.concurrency:
+                latencies, errors = load(args.port, token, concurrency,
+                                         args.seconds)
+                latencies.sort()
+
+                results.append({
+                    'server': name, 'workers': args.workers,
+                    'concurrency': concurrency, 'requests': len(latencies),
+                    'errors': errors,
+                    'requests_per_second': round(
+                        len(latencies) / args.seconds, 1),
+                    'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+                    'p90_ms': round(percentile(latencies, 90) * 1000, 2),
+                    'p99_ms': round(percentile(latencies, 99) * 1000, 2)
+                })
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+from flask import request, send_from_directory, safe_join
+import mimetypes
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Smaller bodies go out as they are (not worth the CPU and the header)
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+
+# zlib level of gzip (1-9) and quality of brotli (0-11) per request
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 4))
+
+# Content types worth compressing
+COMPRESS_MIMETYPES = {
+    'application/json',
+    'application/vnd.gnss-api.columnar+json',
+    'application/msgpack',
+    'text/html',
+    'text/css',
+    'application/javascript'
+}
+
+# Content codings in order of preference, with the file extension of the
+# precompressed static files
+ENCODINGS = (['br'] if brotli is not None else []) + ['gzip']
+EXTENSIONS = {'br': '.br', 'gzip': '.gz'}
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def choose_encoding():
+    ''' Returns the content coding the Accept-Encoding header of the
+        request prefers ('br' or 'gzip'), or None for no compression. '''
+
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+def compressor(encoding, level=None):
+    ''' Returns a (compress(data), flush(), finish()) tuple of functions
+        of a new gzip or brotli stream. '''
+
+    if encoding == 'br':
+        stream = brotli.Compressor(
+            quality=BROTLI_QUALITY if level is None else level)
+
+        return stream.process, stream.flush, stream.finish
+
+    # wbits 31: zlib stream with a gzip header and trailer
+    stream = zlib.compressobj(COMPRESS_LEVEL if level is None else level,
+                              zlib.DEFLATED, 31)
+
+    return (stream.compress,
+            lambda: stream.flush(zlib.Z_SYNC_FLUSH),
+            stream.flush)
+
+
+def compress(data, encoding, level=None):
+    '''Returns data compressed with encoding ('br' or 'gzip').'''
+
+    process, flush, finish = compressor(encoding, level)
+
+    return process(data) + finish()
+
+
+def compress_chunks(chunks, encoding):
+    ''' Compresses a streamed body chunk by chunk.  Every chunk is
+        flushed, so the client still gets the rows as they are read. '''
+
+    process, flush, finish = compressor(encoding)
+
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+
+        data = process(chunk) + flush()
+
+        if data:
+            yield data
+
+    yield finish()
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def compress_response(response):
+    ''' after_request hook compressing the body of a response with the
+        content coding the client prefers:
+        - only for compressible content types, and bodies of at least
+          COMPRESS_MIN_SIZE bytes (streamed 200 bodies always)
+        - files sent by send_file are left alone (see send_static)
+        The ETag becomes weak, as the compressed bytes differ from the
+        uncompressed ones (If-None-Match still matches it). '''
+
+    if response.status_code < 200 or response.status_code in (204, 304) \
+            or response.direct_passthrough \
+            or 'Content-Encoding' in response.headers \
+            or response.mimetype not in COMPRESS_MIMETYPES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    encoding = choose_encoding()
+
+    if encoding is None:
+        return response
+
+    # Error pages are iterables too, they are small enough to buffer
+    if response.is_streamed and response.status_code == 200:
+        response.response = compress_chunks(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+
+    else:
+        data = response.get_data()
+
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+
+        response.set_data(compress(data, encoding))
+
+    response.headers['Content-Encoding'] = encoding
+
+    etag, weak = response.get_etag()
+
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+    return response
+
+
+def send_static(app):
+    ''' Returns the view of /static/<filename> that sends the
+        precompressed .br or .gz copy of a file (see precompress()) when
+        the client accepts it, so static files are never compressed per
+        request. '''
+
+    def static(filename):
+        encoding = choose_encoding()
+
+        if encoding is not None:
+            path = safe_join(app.static_folder, filename)
+            compressed = path + EXTENSIONS[encoding]
+
+            # Stale copies (older than the file) are ignored
+            if os.path.isfile(compressed) and os.path.isfile(path) and \
+                    os.path.getmtime(compressed) >= os.path.getmtime(path):
+                response = send_from_directory(
+                    app.static_folder, filename + EXTENSIONS[encoding],
+                    mimetype=mimetypes.guess_type(filename)[0],
+                    cache_timeout=app.get_send_file_max_age(filename))
+                response.headers['Content-Encoding'] = encoding
+                response.vary.add('Accept-Encoding')
+                return response
+
+        response = app.send_static_file(filename)
+        response.vary.add('Accept-Encoding')
+        return response
+
+    return static
+
+
+def setup_compression(app):
+    ''' Compresses the responses of app (see compress_response()) and
+        serves its static files precompressed (see send_static()). '''
+
+    app.after_request(compress_response)
+    app.view_functions['static'] = send_static(app)
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def precompress(folder, min_size=COMPRESS_MIN_SIZE):
+    ''' @INPUTS
+        folder: folder of the static files (i.e. app.static_folder)
+        min_size: files smaller than this are skipped
+
+        Writes a .gz (and, with brotli installed, a .br) copy of every
+        compressible file of folder next to it, at the highest levels
+        since this runs once at build time.  Copies that would not be
+        smaller than the file are not written.
+        Returns the list of files written. '''
+
+    written = []
+
+    for root, dirs, files in os.walk(folder):
+        for name in files:
+            if name.endswith(tuple(EXTENSIONS.values())):
+                continue
+
+            if mimetypes.guess_type(name)[0] not in COMPRESS_MIMETYPES:
+                continue
+
+            path = os.path.join(root, name)
+
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            if len(data) < min_size:
+                continue
+
+            for encoding in ENCODINGS:
+                level = 11 if encoding == 'br' else 9
+                compressed = compress(data, encoding, level)
+
+                if len(compressed) >= len(data):
+                    continue
+
+                with open(path + EXTENSIONS[encoding], 'wb') as f:
+                    f.write(compressed)
+
+                written.append(path + EXTENSIONS[encoding])
+
+    return written
+
+
+if __name__ == '__main__':
+    # Build step (see bin/post_compile): python compression.py [folder]
+    import sys
+
+    for path in precompress(sys.argv[1] if len(sys.argv) > 1 else 'static'):
+        print(path)
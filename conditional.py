@@ -0,0 +1,87 @@
+from flask import request, make_response, Response
+from functools import wraps
+
+from models import get_table_versions
+from serializers import negotiate, VARIANTS
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def make_etag(versions, variant=''):
+    ''' @INPUTS
+        versions: dict of table name -> change version
+        variant: name of the representation, '' for JSON
+
+        Returns the (unquoted) strong ETag of data read from the tables. '''
+
+    etag = '-'.join(f'{name}.{version}'
+                    for name, version in sorted(versions.items()))
+
+    return f'{etag};{variant}' if variant else etag
+
+
+def cache_key():
+    '''Returns the response cache key of the current request.'''
+
+    return (request.path, tuple(sorted(request.args.items(multi=True))),
+            negotiate())
+
+
+def conditional(*table_names, cache=None, tables=None):
+    ''' @INPUTS
+        table_names: names of the tables the endpoint reads
+        cache: optional ResponseCache of the endpoint's responses
+        tables: optional function returning the names of the tables read
+        by the current request, for endpoints whose query parameters
+        change what they read (overrides table_names)
+
+        Returns a decorator for GET endpoints that tags 200 responses with
+        a strong ETag built from the change versions of the tables, and
+        answers a matching If-None-Match with a 304 after a single
+        version lookup, without running the endpoint (no ORM query, no
+        serialization).  With a cache, other requests are answered with
+        the response bytes cached for the current version, if any.
+        Put it below @requires_auth so the RBAC check still happens
+        first. '''
+
+    def conditional_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            names = tables() if tables is not None else table_names
+            etag = make_etag(get_table_versions(*names),
+                             VARIANTS[negotiate()])
+
+            # Weak comparison: the ETag is weak once compressed
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+                response.set_etag(etag)
+                response.vary.add('Accept')
+                return response
+
+            if cache is not None:
+                key = cache_key()
+                cached = cache.get(key, etag)
+
+                if cached is not None:
+                    body, mimetype = cached
+                    response = Response(body, mimetype=mimetype)
+                    response.set_etag(etag)
+                    response.vary.add('Accept')
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+            response = make_response(f(*args, **kwargs))
+
+            if response.status_code == 200:
+                response.set_etag(etag)
+                response.vary.add('Accept')
+
+                if cache is not None and not response.is_streamed:
+                    cache.put(key, etag, response.get_data(),
+                              response.mimetype)
+                    response.headers['X-Cache'] = 'MISS'
+
+            return response
+
+        return wrapper
+    return conditional_decorator
@@ -0,0 +1,51 @@
+from flask import request, abort
+from sqlalchemy.orm import load_only
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def parse_fields(model, fields):
+    ''' @INPUTS
+        model: Gnss or Signal
+        fields: value of the ?fields= query parameter (comma separated
+        column names, i.e. fields=id,name), or None
+
+        Raises a ValueError if a name is not a column of the model.
+        Returns the list of fields in request order, or None for all. '''
+
+    if fields is None:
+        return None
+
+    columns = model.__table__.columns.keys()
+    selected = []
+
+    for field in fields.split(','):
+        field = field.strip()
+
+        if field not in columns:
+            raise ValueError(f'Unknown field: {field}')
+
+        if field not in selected:
+            selected.append(field)
+
+    return selected
+
+
+def get_fields(model):
+    ''' Reads the ?fields= query parameter of the request, see
+        parse_fields().  Aborts with a 400 on unknown fields. '''
+
+    try:
+        return parse_fields(model, request.args.get('fields'))
+    except ValueError:
+        abort(400)
+
+
+def only_fields(query, fields):
+    ''' Returns the query loading only the given columns (the primary
+        key is always loaded by the ORM, the others are not selected). '''
+
+    if not fields:
+        return query
+
+    return query.options(load_only(*fields))
@@ -0,0 +1,31 @@
+''' gunicorn settings (read from the working directory by gunicorn).
+
+    The workers share their Prometheus metrics (see metrics.py) through
+    the files of PROMETHEUS_MULTIPROC_DIR, so that GET /metrics answered
+    by any worker reports the totals of all of them. '''
+
+import os
+import shutil
+import tempfile
+
+# Must be set before prometheus_client is imported, i.e. before the app
+# is loaded (by the master with --preload)
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                      os.path.join(tempfile.gettempdir(), 'gnss-api-metrics'))
+
+# Name read by prometheus_client < 0.10
+os.environ.setdefault('prometheus_multiproc_dir',
+                      os.environ['PROMETHEUS_MULTIPROC_DIR'])
+
+# Empties the files left over by a previous master (this file is read
+# once by the master, before it loads the app)
+shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'])
+
+
+def child_exit(server, worker):
+    '''Drops the live values (gauges) of a dead worker.'''
+
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
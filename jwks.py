@@ -0,0 +1,218 @@
+import json
+import re
+import threading
+import time
+from urllib.request import urlopen
+
+# Bounds applied to the TTL advertised by the identity provider
+DEFAULT_TTL = 600
+MIN_TTL = 60
+MAX_TTL = 86400
+
+# Fraction of the TTL after which a background refresh is started
+REFRESH_AHEAD = 0.8
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def parse_max_age(cache_control):
+    ''' @INPUTS
+        cache_control: value of a Cache-Control response header (or None)
+
+        Returns the number of seconds the document may be cached for,
+        0 if the document must not be cached, or None if the header
+        does not say. '''
+
+    if not cache_control:
+        return None
+
+    directives = [d.strip().lower() for d in cache_control.split(',')]
+
+    if 'no-store' in directives or 'no-cache' in directives:
+        return 0
+
+    # s-maxage wins over max-age for shared caches, like this one
+    for name in ('s-maxage', 'max-age'):
+        for directive in directives:
+            match = re.fullmatch(name + r'\s*=\s*"?(\d+)"?', directive)
+            if match:
+                return int(match.group(1))
+
+    return None
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+class JwksKeyStore:
+    ''' Caches the signing keys published at a JWKS url.
+
+        The document is fetched once and kept for the TTL advertised in
+        its Cache-Control header (clamped to [min_ttl, max_ttl]).
+        Shortly before it expires, a background thread refreshes it while
+        requests keep using the current keys.  An unknown key id triggers
+        an immediate refetch, at most once per min_refetch_interval, so
+        key rotation is picked up without letting bad tokens hammer the
+        identity provider.  If a refresh fails, the last good keys are
+        served for up to max_stale seconds past their expiry. '''
+
+    def __init__(self, url, default_ttl=DEFAULT_TTL, min_ttl=MIN_TTL,
+                 max_ttl=MAX_TTL, min_refetch_interval=30, max_stale=86400,
+                 timeout=5, opener=urlopen, clock=time.monotonic):
+        '''Constructor for the JwksKeyStore class.'''
+
+        self.url = url
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.min_refetch_interval = min_refetch_interval
+        self.max_stale = max_stale
+        self.timeout = timeout
+        self.opener = opener
+        self.clock = clock
+
+        self._keys = None
+        self._fetched_at = None
+        self._expires_at = None
+        self._last_attempt = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _fetch(self):
+        '''Downloads the JWKS document, returns (keys by kid, ttl).'''
+
+        response = self.opener(self.url, timeout=self.timeout)
+
+        try:
+            jwks = json.loads(response.read())
+            headers = getattr(response, 'headers', None)
+            cache_control = headers.get('Cache-Control') if headers else None
+            age = headers.get('Age') if headers else None
+        finally:
+            response.close()
+
+        keys = {key['kid']: key for key in jwks['keys'] if 'kid' in key}
+
+        ttl = parse_max_age(cache_control)
+
+        if ttl is None:
+            ttl = self.default_ttl
+
+        # Time already spent in an upstream cache counts against the TTL
+        if age and age.isdigit():
+            ttl -= int(age)
+
+        ttl = min(max(ttl, self.min_ttl), self.max_ttl)
+
+        return keys, ttl
+
+    def refresh(self):
+        ''' Fetches the JWKS document and replaces the cached keys.
+            Returns True on success.  Raises if the fetch fails and
+            there are no keys to fall back on. '''
+
+        with self._lock:
+            self._last_attempt = self.clock()
+
+        try:
+            keys, ttl = self._fetch()
+
+        except Exception:
+            with self._lock:
+                if self._keys is None:
+                    raise
+            return False
+
+        now = self.clock()
+
+        with self._lock:
+            self._keys = keys
+            self._fetched_at = now
+            self._expires_at = now + ttl
+
+        return True
+
+    def _background_refresh(self):
+        '''Runs refresh() on a daemon thread (one at a time).'''
+
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name='jwks-refresh', daemon=True).start()
+
+    def _claim_refetch(self, now):
+        ''' Whether the refetch rate limit allows another fetch now.
+            Claims the slot, so concurrent callers do not all fetch. '''
+
+        with self._lock:
+            if self._last_attempt is not None and \
+                    now - self._last_attempt < self.min_refetch_interval:
+                return False
+
+            self._last_attempt = now
+            return True
+
+    def get_keys(self):
+        ''' Returns the cached keys indexed by kid, fetching them if
+            needed.  Raises if the keys cannot be fetched and no usable
+            stale copy exists. '''
+
+        now = self.clock()
+
+        if self._keys is None:
+            self.refresh()
+            return self._keys
+
+        if now >= self._expires_at:
+
+            # Expired: try to refresh in line, rate limited so an outage
+            # does not add a blocking fetch to every request
+            if self._claim_refetch(now):
+                self.refresh()
+
+            if self.clock() >= self._expires_at + self.max_stale:
+                raise RuntimeError(f'JWKS from {self.url} is too stale.')
+
+        elif now >= self._fetched_at + \
+                (self._expires_at - self._fetched_at) * REFRESH_AHEAD:
+
+            # Nearly expired: refresh off the request path
+            if self._claim_refetch(now):
+                self._background_refresh()
+
+        return self._keys
+
+    def get_key(self, kid):
+        ''' @INPUTS
+            kid: key id from the header of a JWT
+
+            Returns the JWK (dict) with the given kid, refetching the
+            document once (rate limited) if the kid is unknown.
+            Returns None if no such key exists. '''
+
+        keys = self.get_keys()
+
+        if kid in keys:
+            return keys[kid]
+
+        if self._claim_refetch(self.clock()):
+            self.refresh()
+
+        return self._keys.get(kid)
+
+    def clear(self):
+        '''Drops the cached keys so the next lookup fetches them again.'''
+
+        with self._lock:
+            self._keys = None
+            self._fetched_at = None
+            self._expires_at = None
+            self._last_attempt = None
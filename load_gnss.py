@@ -0,0 +1,394 @@
+''' Bulk loader of the gnss catalog.
+
+    Loads gnss and signals from CSV (with a header line), JSON (an array
+    of objects) or JSON Lines (.jsonl, one object per line) files:
+    - gnss: name, owner, num_satellites, num_frequencies.  A gnss is
+      matched by name: new ones are inserted, the others updated.
+    - signals: signal, gnss (the name of its gnss, resolved to gnss_id
+      by the database).  Signals already in the database (same gnss and
+      signal name) and repeated ones are skipped.
+    so loading the same files again changes nothing.
+
+    The signals are streamed into a temporary table, batch_size rows at
+    a time (COPY FROM STDIN on Postgres, executemany elsewhere), then
+    inserted with a single INSERT ... SELECT.  Everything runs in one
+    transaction: on any error, nothing is loaded.
+
+    Usage: python load_gnss.py [--gnss data/gnss.csv]
+           [--signals data/signals.csv] [--batch-size 10000] [--quiet] '''
+
+from flask import Flask
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    and_,
+    bindparam,
+    exists,
+    func,
+    select
+)
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+from models import db, setup_db, bump_version, Gnss, Signal
+
+# Rows sent to the database at a time
+LOAD_BATCH_SIZE = int(os.environ.get('LOAD_BATCH_SIZE', 10000))
+
+GNSS_COLUMNS = {'name': str, 'owner': str, 'num_satellites': int,
+                'num_frequencies': int}
+SIGNAL_COLUMNS = {'signal': str, 'gnss': str}
+
+# Longest strings of the String(16) columns
+MAX_LENGTH = 16
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def read_records(path, columns):
+    ''' Yields the values of columns (tuple, None when missing) of every
+        row of a .csv, .json or .jsonl file. '''
+
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+
+            if not set(columns) <= set(header):
+                raise ValueError(f'{path}: the header needs the columns '
+                                 f'{", ".join(columns)}')
+
+            indexes = [header.index(name) for name in columns]
+            width = max(indexes) + 1
+
+            for record in reader:
+                if len(record) < width:
+                    record += [None] * (width - len(record))
+
+                yield tuple(record[index] for index in indexes)
+
+        return
+
+    if path.endswith(('.jsonl', '.ndjson')):
+        with open(path, encoding='utf-8') as f:
+            rows = (json.loads(line) for line in f if line.strip())
+
+            yield from (tuple(row.get(name) for name in columns)
+                        if isinstance(row, dict) else row for row in rows)
+
+        return
+
+    with open(path, encoding='utf-8') as f:
+        rows = json.load(f)
+
+    if not isinstance(rows, list):
+        raise ValueError(f'{path}: expected an array of objects')
+
+    yield from (tuple(row.get(name) for name in columns)
+                if isinstance(row, dict) else row for row in rows)
+
+
+def clean_record(record, columns, path, number):
+    ''' Returns the values of a record converted to the types of columns
+        (CSV values are strings).  Raises a ValueError naming the file
+        and row on a missing or invalid value. '''
+
+    if not isinstance(record, tuple):
+        raise ValueError(f'{path} row {number}: expected an object')
+
+    cleaned = []
+
+    for value, (name, kind) in zip(record, columns.items()):
+        if value is None or value == '':
+            raise ValueError(f'{path} row {number}: missing {name}')
+
+        if kind is int:
+            try:
+                if isinstance(value, (bool, float)):
+                    raise ValueError()
+                value = int(value)
+            except ValueError:
+                raise ValueError(f'{path} row {number}: {name} must be '
+                                 f'an int')
+
+        else:
+            value = str(value)
+
+            if len(value) > MAX_LENGTH:
+                raise ValueError(f'{path} row {number}: {name} longer '
+                                 f'than {MAX_LENGTH} characters')
+
+        cleaned.append(value)
+
+    return tuple(cleaned)
+
+
+def batches(rows, size):
+    '''Yields the rows in lists of up to size rows.'''
+
+    batch = []
+
+    for row in rows:
+        batch.append(row)
+
+        if len(batch) == size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+class Progress:
+    '''Reports the rows loaded so far (stderr), at most once a second.'''
+
+    def __init__(self, label, quiet=False):
+        '''Constructor for the Progress class.'''
+
+        self.label = label
+        self.quiet = quiet
+        self.count = 0
+        self.start = time.perf_counter()
+        self.reported = self.start
+
+    def add(self, rows):
+        '''Counts rows more rows.'''
+
+        self.count += rows
+        now = time.perf_counter()
+
+        if now - self.reported >= 1:
+            self.reported = now
+            self.report()
+
+    def report(self, done=''):
+        '''Prints the count and the rate.'''
+
+        if self.quiet:
+            return
+
+        seconds = max(time.perf_counter() - self.start, 1e-9)
+
+        print(f'{self.label}: {self.count:,} rows read '
+              f'({self.count / seconds:,.0f} rows/s){done}', file=sys.stderr)
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def load_gnss(path, batch_size=LOAD_BATCH_SIZE, quiet=False):
+    ''' Inserts the new gnss of the file and updates the others.
+        Returns (inserted, updated). '''
+
+    table = Gnss.__table__
+    progress = Progress(path, quiet)
+
+    # The catalog of gnss is small: the last row of a name wins
+    catalog = {}
+
+    for number, record in enumerate(read_records(path, GNSS_COLUMNS), 1):
+        row = dict(zip(GNSS_COLUMNS,
+                       clean_record(record, GNSS_COLUMNS, path, number)))
+        catalog[row['name']] = row
+        progress.add(1)
+
+    progress.report(', done')
+
+    existing = {row['name']: dict(row) for row in db.session.execute(
+        select([table.c[name] for name in ['id'] + list(GNSS_COLUMNS)]))}
+
+    new = [row for name, row in catalog.items() if name not in existing]
+    changed = [dict(row, old_name=name) for name, row in catalog.items()
+               if name in existing and
+               any(existing[name][key] != value
+                   for key, value in row.items())]
+
+    for batch in batches(new, batch_size):
+        db.session.execute(table.insert(), batch)
+
+    for batch in batches(changed, batch_size):
+        db.session.execute(
+            table.update().where(table.c.name == bindparam('old_name')),
+            batch)
+
+    return len(new), len(changed)
+
+
+def copy_records(table, records):
+    '''Sends records (tuples) to table with COPY FROM STDIN (Postgres).'''
+
+    data = io.StringIO()
+    csv.writer(data).writerows(records)
+    data.seek(0)
+
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(f'COPY {table.name} FROM STDIN WITH (FORMAT csv)',
+                       data)
+    cursor.close()
+
+
+def insert_records(table, records):
+    ''' Sends records (tuples) to table with one executemany of the
+        driver (no per row work in SQLAlchemy). '''
+
+    connection = db.session.connection()
+
+    # sqlite3 takes ? placeholders, the other drivers (MySQL) %s
+    placeholder = '?' if connection.dialect.paramstyle == 'qmark' else '%s'
+
+    cursor = connection.connection.cursor()
+    cursor.executemany(f'INSERT INTO {table.name} VALUES '
+                       f'({", ".join([placeholder] * len(table.c))})',
+                       records)
+    cursor.close()
+
+
+def load_signals(path, batch_size=LOAD_BATCH_SIZE, quiet=False):
+    ''' Inserts the signals of the file that are not in the db yet.
+        Returns (inserted, skipped, unknown): unknown counts the rows
+        whose gnss does not exist (they are not inserted). '''
+
+    connection = db.session.connection()
+    postgresql = connection.dialect.name == 'postgresql'
+
+    staging = Table('signal_staging', MetaData(),
+                    Column('seq', Integer, nullable=False),
+                    Column('signal', String(MAX_LENGTH), nullable=False),
+                    Column('gnss', String(MAX_LENGTH), nullable=False),
+                    prefixes=['TEMPORARY'])
+    staging.create(connection)
+
+    progress = Progress(path, quiet)
+
+    def records():
+        for number, record in enumerate(
+                read_records(path, SIGNAL_COLUMNS), 1):
+            # Fast path of the valid rows
+            if type(record) is tuple and len(record) == 2 and \
+                    type(record[0]) is str and type(record[1]) is str and \
+                    0 < len(record[0]) <= MAX_LENGTH and \
+                    0 < len(record[1]) <= MAX_LENGTH:
+                yield (number,) + record
+            else:
+                yield (number,) + clean_record(record, SIGNAL_COLUMNS,
+                                               path, number)
+
+    for batch in batches(records(), batch_size):
+        if postgresql:
+            copy_records(staging, batch)
+        else:
+            insert_records(staging, batch)
+
+        progress.add(len(batch))
+
+    progress.report(', done')
+
+    gnss = Gnss.__table__
+    signal = Signal.__table__
+
+    unknown = connection.execute(
+        select([func.count()]).select_from(staging).where(
+            ~exists().where(gnss.c.name == staging.c.gnss))).scalar()
+
+    # First occurrence of every (signal, gnss) of the file, with the
+    # gnss_id of its gnss, unless it is in the db already; in file order
+    first = select([func.min(staging.c.seq)]) \
+        .group_by(staging.c.signal, staging.c.gnss)
+    new = select([staging.c.signal, gnss.c.id]) \
+        .select_from(staging.join(gnss, gnss.c.name == staging.c.gnss)) \
+        .where(staging.c.seq.in_(first)) \
+        .where(~exists().where(and_(signal.c.gnss_id == gnss.c.id,
+                                    signal.c.signal == staging.c.signal))) \
+        .order_by(staging.c.seq)
+
+    inserted = connection.execute(
+        signal.insert().from_select(['signal', 'gnss_id'], new)).rowcount
+
+    staging.drop(connection)
+
+    return inserted, progress.count - inserted - unknown, unknown
+
+
+def load(gnss_path=None, signals_path=None, batch_size=LOAD_BATCH_SIZE,
+         quiet=False):
+    ''' @INPUTS
+        gnss_path: file of gnss to load (or None)
+        signals_path: file of signals to load (or None)
+        batch_size: rows sent to the database at a time
+        quiet: True to not report the progress
+
+        Loads the files in one transaction (the gnss first, so the
+        signals can refer to them), then bumps the versions of the
+        changed tables.  Returns the counts of the loaded rows. '''
+
+    stats = {}
+
+    try:
+        if gnss_path is not None:
+            stats['gnss'] = dict(zip(
+                ['inserted', 'updated'],
+                load_gnss(gnss_path, batch_size, quiet)))
+
+        if signals_path is not None:
+            stats['signals'] = dict(zip(
+                ['inserted', 'skipped', 'unknown_gnss'],
+                load_signals(signals_path, batch_size, quiet)))
+
+        if any(stats.get('gnss', {}).values()):
+            bump_version('gnss')
+
+        if stats.get('signals', {}).get('inserted'):
+            bump_version('signal')
+
+        db.session.commit()
+
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return stats
+
+
+def main(argv=None):
+    '''Parses the command line, loads the files and prints the counts.'''
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--gnss', help='.csv, .json or .jsonl file of gnss')
+    parser.add_argument('--signals',
+                        help='.csv, .json or .jsonl file of signals')
+    parser.add_argument('--batch-size', type=int, default=LOAD_BATCH_SIZE,
+                        help='rows sent to the database at a time')
+    parser.add_argument('--quiet', action='store_true',
+                        help='do not report the progress')
+    args = parser.parse_args(argv)
+
+    if args.gnss is None and args.signals is None:
+        parser.error('nothing to load: give --gnss and/or --signals')
+
+    app = Flask(__name__)
+    setup_db(app)
+
+    start = time.perf_counter()
+
+    try:
+        stats = load(args.gnss, args.signals, args.batch_size, args.quiet)
+    except (OSError, ValueError) as e:
+        print(f'Nothing loaded: {e}', file=sys.stderr)
+        return 1
+
+    stats['seconds'] = round(time.perf_counter() - start, 2)
+
+    print(json.dumps(stats))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
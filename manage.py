@@ -3,6 +3,7 @@ from flask_migrate import Migrate, MigrateCommand
 
 from app import create_app
 from models import db
+from compression import precompress
 
 
 app = create_app(test_config=None)
@@ -11,5 +12,14 @@ migrate = Migrate(app, db)
 manager = Manager(app)
 manager.add_command('db', MigrateCommand)
 
+
+@manager.command
+def precompress_static():
+    '''Writes the .gz/.br copies of the static files served to browsers.'''
+
+    for path in precompress(app.static_folder):
+        print(path)
+
+
 if __name__ == '__main__':
     manager.run()
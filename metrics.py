@@ -0,0 +1,156 @@
+from flask import Response, g, has_request_context, request
+from prometheus_client import (
+    CollectorRegistry,
+    Histogram,
+    REGISTRY,
+    CONTENT_TYPE_LATEST,
+    generate_latest
+)
+from prometheus_client.multiprocess import MultiProcessCollector
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import os
+import time
+
+# Folder where every gunicorn worker writes its metrics (see
+# gunicorn.conf.py), None when the app runs in a single process
+METRICS_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR',
+                             os.environ.get('prometheus_multiproc_dir'))
+
+# Label of the requests matching no route (i.e. 404s), so that random
+# urls do not create new time series
+UNMATCHED = '<unmatched>'
+
+REQUEST_SECONDS = Histogram(
+    'gnss_api_request_duration_seconds',
+    'Time spent answering requests (until the body starts streaming).',
+    ['endpoint', 'method', 'status'])
+
+RESPONSE_BYTES = Histogram(
+    'gnss_api_response_size_bytes',
+    'Size of the response bodies as sent (compressed if they were).',
+    ['endpoint', 'method'],
+    buckets=(100, 1000, 10000, 100000, 1000000, 10000000, float('inf')))
+
+JWT_VERIFY_SECONDS = Histogram(
+    'gnss_api_jwt_verify_duration_seconds',
+    'Time spent in verify_decode_jwt (token cache hits included).',
+    buckets=(.0001, .0005, .001, .0025, .005, .01, .025, .05, .1, .5,
+             float('inf')))
+
+DB_QUERIES = Histogram(
+    'gnss_api_db_queries_per_request',
+    'Number of database queries run by a request.',
+    ['endpoint', 'method'],
+    buckets=(0, 1, 2, 3, 5, 10, 25, 100, float('inf')))
+
+DB_SECONDS = Histogram(
+    'gnss_api_db_duration_seconds_per_request',
+    'Time a request spent running database queries.',
+    ['endpoint', 'method'])
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context,
+                      executemany):
+    '''Records the start of a query (of any engine: primary or replica).'''
+
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_query_timer(conn, cursor, statement, parameters, context,
+                     executemany):
+    '''Adds a finished query to the counters of the request.'''
+
+    seconds = time.perf_counter() - conn.info['query_start'].pop()
+
+    if has_request_context() and 'db_queries' in g:
+        g.db_queries += 1
+        g.db_seconds += seconds
+
+
+@event.listens_for(Engine, 'handle_error')
+def drop_query_timer(context):
+    ''' Drops the start of a query that raised (after_cursor_execute is
+        not called), or it would stay in the info of the pooled
+        connection for good. '''
+
+    if context.connection is not None:
+        starts = context.connection.info.get('query_start')
+
+        if starts:
+            starts.pop()
+
+
+def endpoint_label():
+    '''Returns the route of the request (i.e. /gnss/<int:gnss_id>).'''
+
+    rule = request.url_rule
+
+    return rule.rule if rule is not None else UNMATCHED
+
+
+def start_request():
+    '''before_request hook starting the counters of the request.'''
+
+    g.request_start = time.perf_counter()
+    g.db_queries = 0
+    g.db_seconds = 0.0
+
+
+def record_request(response):
+    ''' after_request hook recording the metrics of the request.
+        Registered before the other hooks, so it runs last and sees the
+        final (compressed) response.  The size of streamed bodies is
+        unknown, only their duration until the first chunk is recorded. '''
+
+    if 'request_start' not in g:
+        return response
+
+    endpoint = endpoint_label()
+    method = request.method
+
+    REQUEST_SECONDS.labels(endpoint, method, str(response.status_code)) \
+        .observe(time.perf_counter() - g.request_start)
+
+    if not response.is_streamed:
+        RESPONSE_BYTES.labels(endpoint, method) \
+            .observe(response.calculate_content_length() or 0)
+
+    DB_QUERIES.labels(endpoint, method).observe(g.db_queries)
+    DB_SECONDS.labels(endpoint, method).observe(g.db_seconds)
+
+    return response
+
+
+def metrics_registry():
+    ''' Returns the registry to expose: the metrics of all the gunicorn
+        workers (read from METRICS_DIR) or of this process. '''
+
+    if METRICS_DIR is None:
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry, path=METRICS_DIR)
+
+    return registry
+
+
+def metrics():
+    '''Endpoint exposing the metrics in the Prometheus text format.'''
+
+    return Response(generate_latest(metrics_registry()),
+                    mimetype=CONTENT_TYPE_LATEST)
+
+
+def setup_metrics(app):
+    ''' Records the metrics of the requests of app and exposes them at
+        GET /metrics.  Call it before the other after_request hooks are
+        registered (they run in reverse order). '''
+
+    app.before_request(start_request)
+    app.after_request(record_request)
+    app.add_url_rule('/metrics', 'metrics', metrics)
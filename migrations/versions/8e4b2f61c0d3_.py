@@ -0,0 +1,49 @@
+"""empty message
+
+Revision ID: 8e4b2f61c0d3
+Revises: 3c1d9e5a7b42
+Create Date: 2026-10-17 21:12:40.902117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4b2f61c0d3'
+down_revision = '3c1d9e5a7b42'
+branch_labels = None
+depends_on = None
+
+# Columns of the case-insensitive search of /gnss/search and
+# /gnss-signals/search (same as models.SEARCH_COLUMNS)
+SEARCH_COLUMNS = {'gnss': ['name', 'owner'], 'signal': ['signal']}
+
+
+def upgrade():
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+
+    # Trigram GIN indexes serve both the prefix and the substring search
+    if postgresql:
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    for table, columns in SEARCH_COLUMNS.items():
+        for column in columns:
+            if postgresql:
+                op.create_index(f'ix_{table}_{column}_trgm', table,
+                                [sa.text(f'lower("{column}") gin_trgm_ops')],
+                                postgresql_using='gin')
+            else:
+                # Serves the prefix search only, run as a range on
+                # lower(column) (see models.search_filter)
+                op.create_index(f'ix_{table}_{column}_lower', table,
+                                [sa.text(f'lower("{column}")')])
+
+
+def downgrade():
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+
+    for table, columns in SEARCH_COLUMNS.items():
+        for column in columns:
+            suffix = 'trgm' if postgresql else 'lower'
+            op.drop_index(f'ix_{table}_{column}_{suffix}', table_name=table)
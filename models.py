@@ -1,7 +1,20 @@
-from sqlalchemy import Column, String, Integer, create_engine
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from sqlalchemy import (
+    Column,
+    String,
+    Integer,
+    MetaData,
+    Table,
+    create_engine,
+    select,
+    event
+)
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import selectinload
 import os
+import sys
+
+from pool import engine_options
+from replicas import RoutingSQLAlchemy, setup_replicas
 
 dev = False
 
@@ -11,7 +24,20 @@ if dev:
 else:
     database_path = os.environ['DATABASE_URL']
 
-db = SQLAlchemy()
+# Sessions send the queries of read only endpoints to the replicas
+db = RoutingSQLAlchemy()
+
+# Largest number of rows accepted by the batch endpoints
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 1000))
+
+# Alembic revision of the schema of these models: the head of
+# migrations/versions (update it with every new migration)
+SCHEMA_REVISION = '2f6c8a1d9b47'
+
+# The table where Alembic records the revision of the db (not a model,
+# so create_all and drop_all leave it alone)
+alembic_version = Table('alembic_version', MetaData(),
+                        Column('version_num', String(32), primary_key=True))
 
 # -----------------------------------------------------------------------------------------------------------
 
@@ -21,19 +47,177 @@ def setup_db(app, database_path=database_path):
 
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # Pool sized per gunicorn worker, see pool.py (less the connections
+    # of the async pool in async mode, see asgi.py)
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS",
+                          engine_options(database_path, reserved=app.config
+                                         .get('DB_POOL_RESERVED', 0)))
     db.app = app
     db.init_app(app)
+    setup_replicas(app)
 
     if dev:
+        # Imported here: alembic takes longer to import than the app
+        from flask_migrate import Migrate
+
         migrate = Migrate(app, db)
         # Commented out as will be using flask migrate to sync the db models
         # The commnad "flask db migrate" in cmd replaces this db.create_all()
         # db.create_all()
     else:
-        db.create_all()
+        check_schema(app)
+
+        # gunicorn --preload runs this in the master: close its
+        # connections so the forked workers do not share them
+        db.get_engine(app).dispose()
 
     return db
 
+
+def get_schema_revision(engine):
+    ''' Returns the Alembic revision of the db (a single row read), or
+        None if it has none (no alembic_version table). '''
+
+    try:
+        with engine.connect() as connection:
+            return connection.scalar(select([alembic_version.c.version_num]))
+    except DBAPIError:
+        return None
+
+
+def check_schema(app):
+    ''' Checks that the db of app is at SCHEMA_REVISION with one query,
+        instead of looking up every table at every boot (create_all).
+        Only a db at another revision or without one runs create_all:
+        an empty db gets all the tables and is stamped at
+        SCHEMA_REVISION, so the next boots take the fast path.  A db
+        with tables but no revision is left unstamped (its tables may be
+        older than SCHEMA_REVISION) with a warning on every boot. '''
+
+    engine = db.get_engine(app)
+    revision = get_schema_revision(engine)
+
+    if revision == SCHEMA_REVISION:
+        return
+
+    if revision is not None:
+        app.logger.warning(f'The db schema is at revision {revision}, '
+                           f'not {SCHEMA_REVISION}: run "flask db upgrade"')
+
+    # Tables created by create_all only are not at any revision
+    empty = revision is None and not engine.table_names()
+
+    if revision is None and not empty:
+        app.logger.warning('The db schema has no revision, so every boot '
+                           'runs create_all: once its tables match the '
+                           'models, run "flask db stamp head" once (or '
+                           '"flask db upgrade" if they are older)')
+
+    db.create_all(app=app)
+
+    if empty:
+        with engine.begin() as connection:
+            alembic_version.create(connection, checkfirst=True)
+            connection.execute(
+                alembic_version.insert().values(version_num=SCHEMA_REVISION))
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+class TableVersion(db.Model):
+    ''' A model for holding the change version of a table.
+        Bumped in the same transaction as every write to the table,
+        so all workers see a new version once the write commits. '''
+
+    __tablename__ = 'table_version'
+
+    name = Column(db.String(32), primary_key=True)
+    version = Column(db.BigInteger, nullable=False, default=0)
+
+
+# Tables whose changes are versioned (see bump_version())
+VERSIONED_TABLES = ('gnss', 'signal')
+
+
+def seed_table_versions(table, connection, **kw):
+    ''' Inserts the VERSIONED_TABLES at version 0 (after_create hook of
+        create_all, the migrations do the same), so that their writes
+        only ever UPDATE their row: two concurrent first writes would
+        both INSERT it, and one would fail. '''
+
+    connection.execute(table.insert(), [{'name': name, 'version': 0}
+                                        for name in VERSIONED_TABLES])
+
+
+event.listen(TableVersion.__table__, 'after_create', seed_table_versions)
+
+
+# Callbacks run with the set of changed table names after each commit
+table_change_listeners = []
+
+
+def on_table_change(callback):
+    ''' Registers callback(table_names) to be called after a commit
+        that changed versioned tables (in this worker). '''
+
+    table_change_listeners.append(callback)
+
+    return callback
+
+
+@event.listens_for(db.session, 'after_commit')
+def notify_table_change(session):
+    '''Calls the table change listeners once the writes are committed.'''
+
+    changed = session.info.pop('changed_tables', None)
+
+    if changed:
+        for callback in table_change_listeners:
+            callback(changed)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def forget_table_change(session, previous_transaction):
+    '''Rolled back writes did not change anything.'''
+
+    if previous_transaction.parent is None:
+        session.info.pop('changed_tables', None)
+
+
+def bump_version(*table_names):
+    ''' Increments the change version of the given tables as part of
+        the current (not yet committed) db session transaction. '''
+
+    db.session.info.setdefault('changed_tables', set()).update(table_names)
+
+    table = TableVersion.__table__
+
+    for name in table_names:
+        result = db.session.execute(
+            table.update()
+                 .where(table.c.name == name)
+                 .values(version=table.c.version + 1))
+
+        # Only in a db created before the rows were seeded at creation
+        if result.rowcount == 0:
+            db.session.execute(table.insert().values(name=name, version=1))
+
+
+def get_table_versions(*table_names):
+    ''' Returns the change version of the given tables (dict),
+        with a single primary key lookup (no ORM objects). '''
+
+    table = TableVersion.__table__
+
+    rows = db.session.execute(
+        select([table.c.name, table.c.version])
+        .where(table.c.name.in_(table_names)))
+
+    versions = dict.fromkeys(table_names, 0)
+    versions.update((name, version) for name, version in rows)
+
+    return versions
+
 # -----------------------------------------------------------------------------------------------------------
 
 
@@ -48,23 +232,28 @@ class Gnss(db.Model):
     num_satellites = Column(db.Integer, nullable=False)
     num_frequencies = Column(db.Integer, nullable=False)
 
-    signals = db.relationship('Signal', backref='gnss', lazy=True)
+    signals = db.relationship('Signal', backref='gnss', lazy=True,
+                              order_by='Signal.id')
 
     def insert(self):
         '''Inserts the new row into the db.'''
 
         db.session.add(self)
+        bump_version('gnss')
         db.session.commit()
 
     def update(self):
         '''Updates the db via committing the session.'''
 
+        bump_version('gnss')
         db.session.commit()
 
     def delete(self):
         '''Deletes the row from the db.'''
 
         db.session.delete(self)
+        # The signals of the gnss lose their gnss_id
+        bump_version('gnss', 'signal')
         db.session.commit()
 
     def cancel(self):
@@ -77,16 +266,38 @@ class Gnss(db.Model):
 
         db.session.close()
 
-    def format(self):
-        '''Formats the attributes for the API.'''
+    def format(self, expand=(), fields=None):
+        ''' Formats the attributes for the API.
+            With 'signals' in expand, the signals of the gnss are nested
+            (load them with expand_options() to avoid a query per gnss).
+            With fields, only those columns are read and formatted. '''
 
-        return {
-            'id': self.id,
-            'name': self.name,
-            'owner': self.owner,
-            'num_satellites': self.num_satellites,
-            'num_frequencies': self.num_frequencies
-        }
+        if fields:
+            result = {field: getattr(self, field) for field in fields}
+        else:
+            result = {
+                'id': self.id,
+                'name': self.name,
+                'owner': self.owner,
+                'num_satellites': self.num_satellites,
+                'num_frequencies': self.num_frequencies
+            }
+
+        if 'signals' in expand:
+            result['signals'] = [signal.format() for signal in self.signals]
+
+        return result
+
+    @staticmethod
+    def expand_options(expand):
+        ''' Returns the query options eager loading the relationships of
+            expand: one extra SELECT ... WHERE gnss_id IN (...) for the
+            signals of the whole page instead of one per gnss. '''
+
+        if 'signals' in expand:
+            return [selectinload(Gnss.signals)]
+
+        return []
 
 # -----------------------------------------------------------------------------------------------------------
 
@@ -98,21 +309,31 @@ class Signal(db.Model):
     signal = Column(db.String(16), nullable=False)
     gnss_id = Column(db.Integer, db.ForeignKey('gnss.id'))
 
+    # Signals of one gnss, in id order (GET /gnss/<gnss_id>/signals),
+    # and the lookup of a signal by gnss and name (load_gnss.py)
+    __table_args__ = (
+        db.Index('ix_signal_gnss_id', 'gnss_id', 'id'),
+        db.Index('ix_signal_gnss_id_signal', 'gnss_id', 'signal')
+    )
+
     def insert(self):
         '''Inserts the new row into the db.'''
 
         db.session.add(self)
+        bump_version('signal')
         db.session.commit()
 
     def update(self):
         '''Updates the db via committing the session.'''
 
+        bump_version('signal')
         db.session.commit()
 
     def delete(self):
         '''Deletes the row from the db.'''
 
         db.session.delete(self)
+        bump_version('signal')
         db.session.commit()
 
     def cancel(self):
@@ -125,8 +346,12 @@ class Signal(db.Model):
 
         db.session.close()
 
-    def format(self):
-        '''Formats the attributes for the API.'''
+    def format(self, fields=None):
+        ''' Formats the attributes for the API.
+            With fields, only those columns are read and formatted. '''
+
+        if fields:
+            return {field: getattr(self, field) for field in fields}
 
         return {
             'id': self.id,
@@ -135,3 +360,340 @@ class Signal(db.Model):
         }
 
 # -----------------------------------------------------------------------------------------------------------
+
+
+# Columns of each table matched by the search endpoints
+SEARCH_COLUMNS = {'gnss': ['name', 'owner'], 'signal': ['signal']}
+
+
+def create_search_indexes(table, connection, **kw):
+    ''' Creates the indexes backing the case-insensitive search of a
+        table (after_create hook of create_all, the migrations do the
+        same).  On Postgres, a trigram GIN index on lower(column) serves
+        both the prefix and the substring LIKE; other backends get a
+        plain index on lower(column), which serves the prefix search
+        only, as a range (see search_filter). '''
+
+    postgresql = connection.dialect.name == 'postgresql'
+    quote = connection.dialect.identifier_preparer.quote
+
+    if postgresql:
+        connection.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    for column in SEARCH_COLUMNS[table.name]:
+        if postgresql:
+            connection.execute(
+                f'CREATE INDEX IF NOT EXISTS ix_{table.name}_{column}_trgm '
+                f'ON {quote(table.name)} '
+                f'USING gin (lower({quote(column)}) gin_trgm_ops)')
+        else:
+            connection.execute(
+                f'CREATE INDEX IF NOT EXISTS ix_{table.name}_{column}_lower '
+                f'ON {quote(table.name)} (lower({quote(column)}))')
+
+
+event.listen(Gnss.__table__, 'after_create', create_search_indexes)
+event.listen(Signal.__table__, 'after_create', create_search_indexes)
+
+
+def prefix_bounds(prefix):
+    ''' Returns the range [low, high) of the strings starting with prefix
+        (high is None when there is no upper bound). '''
+
+    high = prefix
+
+    # The last character that has a next code point is incremented
+    while high and ord(high[-1]) == sys.maxunicode:
+        high = high[:-1]
+
+    if not high:
+        return prefix, None
+
+    return prefix, high[:-1] + chr(ord(high[-1]) + 1)
+
+
+def search_filter(model, query, match='contains'):
+    ''' @INPUTS
+        model: Gnss or Signal
+        query: text to look for (str)
+        match: 'prefix' or 'contains'
+
+        Returns the WHERE clause matching the rows whose search columns
+        start with (or contain) query, ignoring case, written so the
+        search indexes apply: lower(column) LIKE lower(pattern) on
+        Postgres (trigram indexes), and a prefix search as the range
+        low <= lower(column) < high elsewhere, since the plain index on
+        lower(column) serves no LIKE (the substring search scans). '''
+
+    table = model.__table__
+    columns = [db.func.lower(table.c[column])
+               for column in SEARCH_COLUMNS[table.name]]
+
+    if match == 'prefix' and \
+            db.session.get_bind().dialect.name != 'postgresql':
+        low, high = prefix_bounds(query.lower())
+
+        return db.or_(*[db.and_(column >= low, column < high)
+                        if high is not None else column >= low
+                        for column in columns])
+
+    # The LIKE wildcards of the query are matched literally
+    escaped = query.lower().replace('\\', '\\\\') \
+                           .replace('%', '\\%').replace('_', '\\_')
+
+    pattern = escaped + '%' if match == 'prefix' else '%' + escaped + '%'
+
+    return db.or_(*[column.like(pattern, escape='\\')
+                    for column in columns])
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def validate_rows(model, rows, partial=False):
+    ''' @INPUTS
+        model: Gnss or Signal
+        rows: list of dicts of column values for new rows
+        partial: True for the changes of an update (missing keys are
+        allowed, unique columns are left to the db)
+
+        Checks every row against the model columns (unknown or missing
+        keys, types, string lengths), unique columns (against the db and
+        the other rows) and foreign keys (against the db), with one
+        query per unique / foreign key column for the whole batch.
+        Returns a list with the problems (list of str) of each row. '''
+
+    table = model.__table__
+    columns = [column for column in table.columns if column.key != 'id']
+    errors = [[] for row in rows]
+
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors[index].append('Expected an object.')
+            continue
+
+        for key in row:
+            if key not in table.columns or key == 'id':
+                errors[index].append(f'Unknown field: {key}.')
+
+        for column in columns:
+            value = row.get(column.key)
+
+            if value is None:
+                if not column.nullable and \
+                        (column.key in row or not partial):
+                    errors[index].append(f'Missing field: {column.key}.')
+                continue
+
+            if isinstance(column.type, db.Integer):
+                if not isinstance(value, int) or isinstance(value, bool):
+                    errors[index].append(f'{column.key} must be an int.')
+
+            elif isinstance(column.type, db.String):
+                if not isinstance(value, str):
+                    errors[index].append(f'{column.key} must be a str.')
+                elif column.type.length and \
+                        len(value) > column.type.length:
+                    errors[index].append(f'{column.key} is longer than '
+                                         f'{column.type.length}.')
+
+    def column_values(column):
+        return {row[column.key] for row, problems in zip(rows, errors)
+                if not problems and row.get(column.key) is not None}
+
+    for column in columns:
+        if column.unique and not partial:
+            existing = {value for value, in db.session.execute(
+                select([column]).where(column.in_(column_values(column))))}
+            seen = set()
+
+            for row, problems in zip(rows, errors):
+                value = None if problems else row.get(column.key)
+
+                if value in existing or value in seen:
+                    problems.append(f'{column.key} {value} already exists.')
+                elif value is not None:
+                    seen.add(value)
+
+        for foreign_key in column.foreign_keys:
+            target = foreign_key.column
+            existing = {value for value, in db.session.execute(
+                select([target]).where(target.in_(column_values(column))))}
+
+            for row, problems in zip(rows, errors):
+                value = None if problems else row.get(column.key)
+
+                if value is not None and value not in existing:
+                    problems.append(f'{target.table.name} {value} '
+                                    'does not exist.')
+
+    return errors
+
+
+def insert_rows(model, rows, chunk_size=500):
+    ''' @INPUTS
+        model: Gnss or Signal
+        rows: list of validated dicts of column values
+
+        Inserts the rows as part of the current db session transaction
+        (the caller commits once): multi-row INSERT ... RETURNING
+        statements of chunk_size rows on Postgres, elsewhere row by row
+        (one INSERT each, for the id of every new row), and bumps the
+        table version.
+        Returns the formatted new rows, in the order of rows. '''
+
+    table = model.__table__
+    keys = [column.key for column in table.columns]
+    rows = [{key: row.get(key) for key in keys if key != 'id'}
+            for row in rows]
+
+    inserted = []
+
+    if db.session.get_bind().dialect.name == 'postgresql':
+        for start in range(0, len(rows), chunk_size):
+            result = db.session.execute(
+                table.insert().values(rows[start:start + chunk_size])
+                              .returning(*table.columns))
+            inserted += [dict(zip(keys, values)) for values in result]
+
+        # The rows come back with their values: match them to the input
+        # (identical rows are interchangeable)
+        ids = {}
+
+        for row in inserted:
+            ids.setdefault(tuple(row[key] for key in keys if key != 'id'),
+                           []).append(row['id'])
+
+        for row in rows:
+            row['id'] = ids[tuple(row[key] for key in keys
+                                  if key != 'id')].pop(0)
+
+    else:
+        for row in rows:
+            result = db.session.execute(table.insert(), row)
+            row['id'] = result.inserted_primary_key[0]
+
+    bump_version(table.name)
+
+    return [model(**row).format() for row in rows]
+
+
+def rows_where(model, ids=None, filters=None):
+    ''' @INPUTS
+        model: Gnss or Signal
+        ids: list of ids (int) of the rows
+        filters: dict of column name -> value the rows must equal
+
+        Returns the WHERE clause selecting the rows (ids and filters
+        combined with AND).  Raises a ValueError for malformed ids,
+        unknown columns or if neither ids nor filters are given. '''
+
+    table = model.__table__
+    clauses = []
+
+    if ids is not None:
+        if not isinstance(ids, list) or not ids or \
+                not all(isinstance(i, int) and not isinstance(i, bool)
+                        for i in ids):
+            raise ValueError('ids must be a non-empty list of int.')
+
+        clauses.append(table.c.id.in_(ids))
+
+    if filters is not None:
+        if not isinstance(filters, dict) or not filters:
+            raise ValueError('filter must be a non-empty object.')
+
+        for key, value in filters.items():
+            if key not in table.columns:
+                raise ValueError(f'Unknown field: {key}.')
+
+            clauses.append(table.c[key] == value)
+
+    if not clauses:
+        raise ValueError('Either ids or filter is required.')
+
+    return db.and_(*clauses)
+
+
+def update_rows(model, where, changes):
+    ''' @INPUTS
+        model: Gnss or Signal
+        where: WHERE clause of the rows (see rows_where)
+        changes: validated dict of new column values
+
+        Updates all the rows with a single UPDATE statement as part of
+        the current db session transaction (the caller commits) and
+        bumps the table version.
+        Returns the formatted updated rows. '''
+
+    table = model.__table__
+    keys = [column.key for column in table.columns]
+    statement = table.update().where(where).values(**changes)
+
+    if db.session.get_bind().dialect.name == 'postgresql':
+        result = db.session.execute(statement.returning(*table.columns))
+        updated = [dict(zip(keys, values)) for values in result]
+
+    else:
+        # Without RETURNING, read the rows back in the same transaction
+        ids = [row_id for row_id, in db.session.execute(
+            select([table.c.id]).where(where))]
+        db.session.execute(statement)
+        updated = [dict(zip(keys, values)) for values in db.session.execute(
+            select(table.columns).where(table.c.id.in_(ids)))]
+
+    if updated:
+        bump_version(table.name)
+
+    return [model(**row).format()
+            for row in sorted(updated, key=lambda row: row['id'])]
+
+
+def delete_rows(model, where):
+    ''' @INPUTS
+        model: Gnss or Signal
+        where: WHERE clause of the rows (see rows_where)
+
+        Deletes all the rows with a single DELETE statement as part of
+        the current db session transaction (the caller commits) and
+        bumps the table version.  Like Gnss.delete(), the rows that
+        referenced the deleted rows (i.e. their signals) are kept with a
+        null foreign key, with one UPDATE per referencing column.
+        Returns the ids of the deleted rows. '''
+
+    table = model.__table__
+    postgresql = db.session.get_bind().dialect.name == 'postgresql'
+
+    if postgresql:
+        deleted = select([table.c.id]).where(where)
+    else:
+        deleted = [row_id for row_id, in db.session.execute(
+            select([table.c.id]).where(where))]
+
+    changed = [table.name]
+
+    for other in db.metadata.sorted_tables:
+        for foreign_key in other.foreign_keys:
+            if foreign_key.column.table is table:
+                result = db.session.execute(
+                    other.update()
+                         .where(foreign_key.parent.in_(deleted))
+                         .values({foreign_key.parent.key: None}))
+
+                if result.rowcount:
+                    changed.append(other.name)
+
+    if postgresql:
+        result = db.session.execute(
+            table.delete().where(where).returning(table.c.id))
+        ids = sorted(row_id for row_id, in result)
+
+    else:
+        db.session.execute(table.delete().where(table.c.id.in_(deleted)))
+        ids = sorted(deleted)
+
+    if ids:
+        bump_version(*changed)
+
+    return ids
+
+# -----------------------------------------------------------------------------------------------------------
@@ -0,0 +1,97 @@
+from flask import request, abort
+import base64
+import binascii
+import json
+import os
+
+# Page size when the client sends no limit, and the largest allowed
+DEFAULT_LIMIT = int(os.environ.get('PAGE_DEFAULT_LIMIT', 100))
+MAX_LIMIT = int(os.environ.get('PAGE_MAX_LIMIT', 1000))
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def encode_cursor(last_id):
+    '''Returns the opaque cursor of the page after the row last_id.'''
+
+    data = json.dumps({'id': last_id}, separators=(',', ':')).encode()
+
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def decode_cursor(cursor):
+    ''' Returns the id encoded in a cursor.
+        Raises a ValueError if the cursor is malformed. '''
+
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        last_id = json.loads(data)['id']
+
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ValueError(f'Malformed cursor: {cursor}')
+
+    if not isinstance(last_id, int) or isinstance(last_id, bool):
+        raise ValueError(f'Malformed cursor: {cursor}')
+
+    return last_id
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def parse_page_args(args):
+    ''' @INPUTS
+        args: query parameters of the request (dict-like)
+
+        Raises a ValueError if limit or cursor are malformed.
+        Returns (limit, id after which the page starts or None). '''
+
+    limit = int(args.get('limit', DEFAULT_LIMIT))
+
+    if limit < 1:
+        raise ValueError(f'Invalid limit: {limit}')
+
+    limit = min(limit, MAX_LIMIT)
+
+    cursor = args.get('cursor')
+
+    if cursor is None:
+        return limit, None
+
+    return limit, decode_cursor(cursor)
+
+
+def get_page_args():
+    ''' Reads the limit and cursor query parameters of the request.
+        Aborts with a 400 if they are malformed.
+        Returns (limit, id after which the page starts or None). '''
+
+    try:
+        return parse_page_args(request.args)
+    except ValueError:
+        abort(400)
+
+
+def paginate(query, id_column, limit, after_id=None):
+    ''' @INPUTS
+        query: SQLAlchemy query of the rows to page through
+        id_column: unique, indexed column the rows are ordered by
+        limit: maximum number of rows in the page
+        after_id: value of id_column of the last row of the previous
+        page (None for the first page)
+
+        Seeks past after_id with a WHERE on the (indexed) id column
+        instead of an OFFSET, so every page costs the same.
+        Returns (rows of the page, cursor of the next page or None). '''
+
+    if after_id is not None:
+        query = query.filter(id_column > after_id)
+
+    # One extra row tells whether there is a next page
+    rows = query.order_by(id_column).limit(limit + 1).all()
+
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+
+    return rows, encode_cursor(getattr(rows[-1], id_column.key))
@@ -0,0 +1,208 @@
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+import os
+import threading
+import time
+
+# 'queue': a pool of connections per worker (default)
+# 'external': no pool in the app, every checkout opens a connection to an
+# external pooler such as pgbouncer in transaction mode
+DB_POOL_MODE = os.environ.get('DB_POOL_MODE', 'queue')
+
+# gunicorn workers and threads per worker (WEB_CONCURRENCY is set by
+# Heroku and read by gunicorn)
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 1))
+
+# Connections the database accepts from this app, shared by all workers
+DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', 20))
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+class PoolStats:
+    ''' Checkout counters of a connection pool, shared by the pools an
+        engine recreates (on dispose or invalidation). '''
+
+    def __init__(self):
+        '''Constructor for the PoolStats class.'''
+
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+        self._lock = threading.Lock()
+
+    def record(self, wait, timeout=False):
+        '''Records one checkout that waited wait seconds.'''
+
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timeout
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def snapshot(self):
+        '''Returns the counters as a dict.'''
+
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds_total': self.wait_total,
+                'wait_seconds_max': self.wait_max,
+                'wait_seconds_avg': (self.wait_total / self.checkouts
+                                     if self.checkouts else 0.0)
+            }
+
+
+class TimedQueuePool(QueuePool):
+    ''' A QueuePool that measures how long every checkout waits for a
+        connection (opening it, or for another thread to return one) and
+        counts the checkouts that time out, see pool_stats(). '''
+
+    def __init__(self, *args, **kwargs):
+        '''Constructor for the TimedQueuePool class.'''
+
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        '''Checks out a connection, timing the wait.'''
+
+        start = time.perf_counter()
+
+        try:
+            connection = super()._do_get()
+        except TimeoutError:
+            self.stats.record(time.perf_counter() - start, timeout=True)
+            raise
+
+        self.stats.record(time.perf_counter() - start)
+
+        return connection
+
+    def recreate(self):
+        '''Returns the new pool replacing this one, with the same stats.'''
+
+        pool = super().recreate()
+        pool.stats = self.stats
+
+        return pool
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def worker_share(workers=WEB_CONCURRENCY, max_connections=DB_MAX_CONNECTIONS):
+    '''Returns the connections of max_connections each worker may open.'''
+
+    return max(max_connections // max(workers, 1), 1)
+
+
+def engine_options(database_uri, mode=DB_POOL_MODE,
+                   workers=WEB_CONCURRENCY, threads=WEB_THREADS,
+                   max_connections=DB_MAX_CONNECTIONS, reserved=0):
+    ''' @INPUTS
+        database_uri: SQLALCHEMY_DATABASE_URI of the app
+        mode: 'queue' or 'external' (see DB_POOL_MODE)
+        workers: gunicorn worker processes
+        threads: threads per worker
+        max_connections: connections allowed for all the workers
+        reserved: connections of the share of a worker kept for its
+        async pool (see async_pool_options())
+
+        Returns the SQLALCHEMY_ENGINE_OPTIONS of the app.  In queue mode
+        every worker keeps one connection per thread (a sync worker only
+        ever uses one) and may open overflow connections up to its share
+        of max_connections.  DB_POOL_SIZE and DB_MAX_OVERFLOW override
+        the sizes.  SQLite is left to Flask-SQLAlchemy. '''
+
+    if make_url(database_uri).drivername.startswith('sqlite'):
+        return {}
+
+    if mode == 'external':
+        # The pooler owns the connections, a connection is only held for
+        # the duration of a transaction
+        return {'poolclass': NullPool}
+
+    if mode != 'queue':
+        raise ValueError(f'Unknown DB_POOL_MODE: {mode}')
+
+    share = max(worker_share(workers, max_connections) - reserved, 1)
+    pool_size = int(os.environ.get('DB_POOL_SIZE', min(threads, share)))
+    max_overflow = int(os.environ.get('DB_MAX_OVERFLOW',
+                                      max(share - pool_size, 0)))
+
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        # Connections dropped by the server (restarts, idle timeouts)
+        # are replaced before use instead of failing the request
+        'pool_pre_ping': True,
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    }
+
+
+def async_pool_size(workers=WEB_CONCURRENCY,
+                    max_connections=DB_MAX_CONNECTIONS):
+    ''' Returns the connections of the async pool of every database of a
+        worker in async mode: ASYNC_DB_POOL_SIZE, or half its share of
+        max_connections (its sync pools get the rest). '''
+
+    return int(os.environ.get('ASYNC_DB_POOL_SIZE',
+                              max(worker_share(workers, max_connections) // 2,
+                                  1)))
+
+
+def async_pool_options(database_url, mode=DB_POOL_MODE, size=None):
+    ''' @INPUTS
+        database_url: url of the database for the async driver
+        mode: 'queue' or 'external' (see DB_POOL_MODE)
+        size: connections of the pool (default: async_pool_size())
+
+        Returns the options of the asyncpg pool of the async endpoints
+        (see asgi.py).  Through an external pooler (pgbouncer in
+        transaction mode runs the statements of a connection on any
+        server connection) asyncpg prepares no statement it would reuse,
+        and keeps no idle connection.  SQLite (aiosqlite) has no pool. '''
+
+    if make_url(database_url).drivername.startswith('sqlite'):
+        return {}
+
+    if size is None:
+        size = async_pool_size()
+
+    if mode == 'external':
+        return {'min_size': 0, 'max_size': size, 'statement_cache_size': 0}
+
+    if mode != 'queue':
+        raise ValueError(f'Unknown DB_POOL_MODE: {mode}')
+
+    return {'min_size': 1, 'max_size': size}
+
+
+def pool_stats(engine):
+    ''' Returns the occupancy of the connection pool of engine, and the
+        checkout latency counters of a TimedQueuePool. '''
+
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            # Negative while the pool is not full yet
+            'overflow': pool.overflow(),
+            'max_overflow': pool._max_overflow
+        })
+
+    if isinstance(pool, TimedQueuePool):
+        stats.update(pool.stats.snapshot())
+
+    return stats
@@ -0,0 +1,193 @@
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import logging
+import os
+import re
+import time
+
+# Server-Timing and X-DB-* headers with the SQL statements of every
+# request (debugging only: the headers show the statements)
+SQL_PROFILE = os.environ.get('SQL_PROFILE', '').lower() in ('1', 'true')
+
+# Slowest statements shown in the headers
+SQL_PROFILE_TOP = int(os.environ.get('SQL_PROFILE_TOP', 3))
+
+# Statements slower than this are logged (parameters redacted), unset
+# for no slow query log
+SLOW_QUERY_SECONDS = os.environ.get('SLOW_QUERY_SECONDS')
+SLOW_QUERY_SECONDS = None if SLOW_QUERY_SECONDS is None \
+    else float(SLOW_QUERY_SECONDS)
+
+# Characters of a statement kept in the headers and the log
+STATEMENT_MAX_LENGTH = 200
+
+slow_query_log = logging.getLogger('gnss_api.slow_queries')
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def shorten(statement):
+    '''Returns statement on one line, cut at STATEMENT_MAX_LENGTH.'''
+
+    statement = re.sub(r'\s+', ' ', str(statement)).strip()
+
+    if len(statement) > STATEMENT_MAX_LENGTH:
+        statement = statement[:STATEMENT_MAX_LENGTH - 3] + '...'
+
+    return statement
+
+
+def redact(parameters, executemany=False):
+    ''' Returns the shape of the parameters of a statement without their
+        values (i.e. {'name': str}), which may be personal data. '''
+
+    if executemany:
+        return f'<{len(parameters)} parameter sets>'
+
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{name!r}: {type(value).__name__}'
+                               for name, value in parameters.items()) + '}'
+
+    if isinstance(parameters, (list, tuple)):
+        return '(' + ', '.join(type(value).__name__
+                               for value in parameters) + ')'
+
+    return '()'
+
+
+class RequestProfile:
+    ''' The statements of one request: their count, total time and the
+        SQL_PROFILE_TOP slowest ones. '''
+
+    def __init__(self, top=SQL_PROFILE_TOP):
+        '''Constructor for the RequestProfile class.'''
+
+        self.top = top
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest = []
+
+    def record(self, statement, seconds):
+        '''Adds a statement that ran for seconds.'''
+
+        self.count += 1
+        self.seconds += seconds
+
+        if len(self.slowest) < self.top or seconds > self.slowest[-1][0]:
+            self.slowest.append((seconds, shorten(statement)))
+            self.slowest.sort(key=lambda item: -item[0])
+            del self.slowest[self.top:]
+
+    def headers(self, total_seconds):
+        ''' Returns the Server-Timing (shown by the browser dev tools)
+            and X-DB-* headers of the profile, for a request that took
+            total_seconds. '''
+
+        headers = [
+            ('Server-Timing',
+             f'db;dur={self.seconds * 1000:.2f};desc="{self.count} queries"'
+             f', total;dur={total_seconds * 1000:.2f}'),
+            ('X-DB-Queries', str(self.count)),
+            ('X-DB-Time-Ms', f'{self.seconds * 1000:.2f}')
+        ]
+
+        for seconds, statement in self.slowest:
+            headers.append(('X-DB-Slowest',
+                            f'{seconds * 1000:.2f}ms {statement}'))
+
+        return headers
+
+
+def log_slow_query(statement, parameters, seconds, executemany=False,
+                   endpoint='-'):
+    '''Logs a statement slower than SLOW_QUERY_SECONDS.'''
+
+    if SLOW_QUERY_SECONDS is None or seconds < SLOW_QUERY_SECONDS:
+        return
+
+    slow_query_log.warning('%.1f ms %s %s params=%s', seconds * 1000,
+                           endpoint, shorten(statement),
+                           redact(parameters, executemany))
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def start_statement(conn, cursor, statement, parameters, context,
+                    executemany):
+    '''before_cursor_execute listener timing a statement.'''
+
+    conn.info.setdefault('profile_start', []).append(time.perf_counter())
+
+
+def end_statement(conn, cursor, statement, parameters, context,
+                  executemany):
+    ''' after_cursor_execute listener adding a statement to the profile
+        of the request, and to the slow query log. '''
+
+    seconds = time.perf_counter() - conn.info['profile_start'].pop()
+    endpoint = '-'
+
+    if has_request_context():
+        endpoint = request.path
+
+        if 'sql_profile' in g:
+            g.sql_profile.record(statement, seconds)
+
+    log_slow_query(statement, parameters, seconds, executemany, endpoint)
+
+
+def drop_statement(context):
+    ''' handle_error listener dropping the start of a statement that
+        raised (end_statement() is not called for it). '''
+
+    if context.connection is not None:
+        starts = context.connection.info.get('profile_start')
+
+        if starts:
+            starts.pop()
+
+
+def start_request():
+    '''before_request hook starting the profile of the request.'''
+
+    g.profile_start = time.perf_counter()
+    g.sql_profile = RequestProfile()
+
+
+def add_profile_headers(response):
+    ''' after_request hook adding the profile headers.  The statements of
+        a streamed body run after the headers are sent: only those run
+        before the first chunk are in them. '''
+
+    if 'sql_profile' in g:
+        total = time.perf_counter() - g.profile_start
+
+        for name, value in g.sql_profile.headers(total):
+            response.headers.add(name, value)
+
+    return response
+
+
+def profiling_enabled():
+    '''Whether the profiler or the slow query log is on.'''
+
+    return SQL_PROFILE or SLOW_QUERY_SECONDS is not None
+
+
+def setup_profiler(app):
+    ''' Profiles the SQL statements of app (see SQL_PROFILE and
+        SLOW_QUERY_SECONDS).  When both are off, nothing is registered,
+        so the statements run without any extra work. '''
+
+    if not profiling_enabled():
+        return
+
+    if not event.contains(Engine, 'before_cursor_execute', start_statement):
+        event.listen(Engine, 'before_cursor_execute', start_statement)
+        event.listen(Engine, 'after_cursor_execute', end_statement)
+        event.listen(Engine, 'handle_error', drop_statement)
+
+    if SQL_PROFILE:
+        app.before_request(start_request)
+        app.after_request(add_profile_headers)
@@ -0,0 +1,201 @@
+from collections import OrderedDict
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from functools import wraps
+from sqlalchemy import create_engine, orm
+import base64
+import binascii
+import json
+import os
+import random
+import threading
+import time
+
+from pool import engine_options
+
+# Read replicas of DATABASE_URL (space or comma separated urls), if any
+DATABASE_REPLICA_URLS = os.environ.get('DATABASE_REPLICA_URLS', '') \
+                          .replace(',', ' ').split()
+
+# Seconds a client reads from the primary after one of its writes, so it
+# sees its own writes even while the replicas lag behind
+REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+
+# Bearer token subjects in their sticky window (at most this many)
+REPLICA_STICKY_SUBJECTS = int(os.environ.get('REPLICA_STICKY_SUBJECTS',
+                                             10000))
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+class RoutingSession(SignallingSession):
+    ''' A session that runs the queries of read only endpoints (see
+        read_only()) on the replica chosen for the request, and all the
+        others (and anything it is about to write) on the primary. '''
+
+    def get_bind(self, mapper=None, clause=None):
+        '''Returns the engine of the next statement.'''
+
+        replica = g.get('replica') if has_request_context() else None
+
+        if replica is not None and not self._flushing:
+            return replica
+
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    '''Flask-SQLAlchemy with sessions routing reads to the replicas.'''
+
+    def create_session(self, options):
+        '''Returns the factory of the RoutingSession.'''
+
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+class StickySubjects:
+    ''' The time of the last write of the bearer token clients, by the
+        sub claim of their token: the sticky window of the clients that
+        do not keep the session cookie.  Per worker, bounded (the oldest
+        writers are dropped first) and safe to share between threads. '''
+
+    def __init__(self, max_size=REPLICA_STICKY_SUBJECTS):
+        '''Constructor for the StickySubjects class.'''
+
+        self.max_size = max_size
+
+        self._written_at = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sub):
+        '''Returns the time of the last write of sub, or None.'''
+
+        with self._lock:
+            return self._written_at.get(sub)
+
+    def put(self, sub, written_at):
+        '''Records a write of sub.'''
+
+        with self._lock:
+            self._written_at[sub] = written_at
+            self._written_at.move_to_end(sub)
+
+            # Drops the windows that are over, and the oldest if too many
+            while self._written_at:
+                oldest = next(iter(self._written_at.values()))
+
+                if written_at - oldest < REPLICA_STICKY_SECONDS and \
+                        len(self._written_at) <= self.max_size:
+                    break
+
+                self._written_at.popitem(last=False)
+
+
+sticky_subjects = StickySubjects()
+
+
+def token_subject(authorization):
+    ''' Returns the sub claim of the bearer token of an Authorization
+        header, or None.  Not verified: it only picks the db the request
+        reads from, and only verified writes (see remember_write())
+        start a window. '''
+
+    parts = authorization.split()
+
+    if len(parts) != 2 or parts[0].lower() != 'bearer':
+        return None
+
+    try:
+        claims = parts[1].split('.')[1]
+        payload = json.loads(base64.urlsafe_b64decode(
+            claims + '=' * (-len(claims) % 4)))
+    except (IndexError, ValueError, binascii.Error):
+        return None
+
+    sub = payload.get('sub') if isinstance(payload, dict) else None
+
+    return sub if isinstance(sub, str) else None
+
+
+def in_sticky_window(written_at):
+    '''Whether a write made at written_at (or None) was in the window.'''
+
+    return written_at is not None and \
+        time.time() - written_at < REPLICA_STICKY_SECONDS
+
+
+def subject_wrote_recently(authorization):
+    ''' Whether the bearer token of an Authorization header has a sub
+        that wrote in the sticky window.  Needs no request context, so
+        the async endpoints (see asgi.py) check it too. '''
+
+    sub = token_subject(authorization)
+
+    return sub is not None and in_sticky_window(sticky_subjects.get(sub))
+
+
+def wrote_recently():
+    ''' Whether the client of the request wrote in the sticky window,
+        known from its session cookie or the sub of its bearer token. '''
+
+    written_at = session.get('db_written_at')
+
+    if written_at is None:
+        return subject_wrote_recently(
+            request.headers.get('Authorization', ''))
+
+    return in_sticky_window(written_at)
+
+
+def read_only(f):
+    ''' Decorator of the endpoints that only read from the db: their
+        queries go to one random replica (the same one for the whole
+        request, so the ETag and the data agree), unless there are no
+        replicas or the client wrote in the last REPLICA_STICKY_SECONDS.
+        Put it right below @app.route. '''
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        replicas = current_app.extensions.get('replicas')
+
+        if replicas and not wrote_recently():
+            g.replica = random.choice(replicas)
+
+        return f(*args, **kwargs)
+
+    return wrapper
+
+
+def remember_write(response):
+    ''' after_request hook starting the sticky window of a client after
+        a successful write (kept in its Flask session cookie, and by this
+        worker for the sub of its bearer token). '''
+
+    if request.method in ('POST', 'PATCH', 'PUT', 'DELETE') and \
+            response.status_code < 400:
+        written_at = time.time()
+        session['db_written_at'] = written_at
+
+        sub = token_subject(request.headers.get('Authorization', ''))
+
+        if sub is not None:
+            sticky_subjects.put(sub, written_at)
+
+    return response
+
+
+def setup_replicas(app, replica_paths=DATABASE_REPLICA_URLS):
+    ''' Creates the engines of the read replicas of app (sized like the
+        primary, see pool.py) and tracks the writes of its clients.
+        Does nothing without replicas. '''
+
+    reserved = app.config.get('DB_POOL_RESERVED', 0)
+
+    app.extensions['replicas'] = [
+        create_engine(path, **engine_options(path, reserved=reserved))
+        for path in replica_paths]
+
+    if app.extensions['replicas']:
+        app.after_request(remember_write)
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+class ResponseCache:
+    ''' A bounded, per-worker LRU cache of serialized response bodies.
+
+        Every entry is tagged with the version of the data it was built
+        from (the ETag of the change versions of the tables it reads).
+        A lookup only hits if the entry is younger than ttl seconds and
+        its tag equals the current version, so a write committed by any
+        gunicorn worker (which bumps the version in the db) invalidates
+        the entries of all workers.  Writes of this worker also clear
+        the cache right away, see models.on_table_change(). '''
+
+    def __init__(self, max_entries=256, ttl=300, clock=time.monotonic):
+        '''Constructor for the ResponseCache class.'''
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        ''' Returns the cached (body, mimetype) of key if it was built
+            from the given version of the data, otherwise None. '''
+
+        if self.max_entries <= 0:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[0] != version or \
+                    self.clock() >= entry[1]:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return entry[2]
+
+    def put(self, key, version, body, mimetype):
+        '''Caches a serialized body built from the given data version.'''
+
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (version, self.clock() + self.ttl,
+                                  (body, mimetype))
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        '''Empties the cache.'''
+
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        '''Returns the size and the hit/miss counters of the cache.'''
+
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0
+            }
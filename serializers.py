@@ -0,0 +1,128 @@
+from flask import request, Response
+import json
+import os
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON encoder of all responses: 'orjson' (default when installed) or 'json'
+JSON_ENGINE = os.environ.get('JSON_ENGINE',
+                             'orjson' if orjson is not None else 'json')
+
+# Representations of the list endpoints, the first one is the default
+JSON = 'application/json'
+COLUMNAR = 'application/vnd.gnss-api.columnar+json'
+MSGPACK = 'application/msgpack'
+
+MIMETYPES = [JSON, COLUMNAR] + ([MSGPACK] if msgpack is not None else [])
+
+# Suffix of the ETag of each representation (see conditional.py)
+VARIANTS = {JSON: '', COLUMNAR: 'columnar', MSGPACK: 'msgpack'}
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def stdlib_dumps(obj):
+    ''' Returns obj as JSON bytes exactly like jsonify (sorted keys,
+        compact separators, non-ASCII characters escaped). '''
+
+    return json.dumps(obj, sort_keys=True, separators=(',', ':')).encode()
+
+
+def orjson_dumps(obj):
+    ''' Returns obj as JSON bytes encoded by orjson, byte for byte the
+        same as stdlib_dumps() except for floats outside 1e-4 <= |x| <
+        1e16 and non-finite ones (orjson writes 1.2e-05 as 0.000012,
+        1e+16 as 1e16 and NaN as null).  The rows have no floats, only
+        /health/db has some: looking for them would cost more than the
+        encoding of a page.  orjson writes non-ASCII characters as UTF-8
+        and rejects integers over 64 bits, those (rare) documents are
+        encoded by the stdlib instead. '''
+
+    try:
+        body = orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    except TypeError:
+        return stdlib_dumps(obj)
+
+    if not body.isascii():
+        return stdlib_dumps(obj)
+
+    return body
+
+
+JSON_ENGINES = {'json': stdlib_dumps}
+
+if orjson is not None:
+    JSON_ENGINES['orjson'] = orjson_dumps
+
+dumps = JSON_ENGINES[JSON_ENGINE]
+
+
+def json_response(obj, status=200, mimetype=None):
+    ''' @INPUTS
+        obj: document of the response (dict)
+        status: HTTP status code
+        mimetype: mimetype of the response, application/json by default
+
+        Drop-in replacement of jsonify: same bytes (with the trailing
+        newline), encoded by the JSON_ENGINE straight into the body. '''
+
+    return Response(dumps(obj) + b'\n', status=status,
+                    mimetype=mimetype or JSON)
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def negotiate():
+    ''' Returns the mimetype of the representation the Accept header of
+        the request prefers.  JSON without an Accept header, for */*,
+        or when none of the representations is acceptable (so existing
+        clients get the same response as before). '''
+
+    return request.accept_mimetypes.best_match(MIMETYPES, default=JSON)
+
+
+def columnar(rows):
+    ''' @INPUTS
+        rows: list of formatted rows (dicts with the same keys)
+
+        Returns the rows as a dict of columns, i.e.
+        {"id": [1, 2], "signal": ["L1C", "L5"]}, so every key name is
+        written once instead of once per row. '''
+
+    if not rows:
+        return {}
+
+    return {name: [row[name] for row in rows] for name in rows[0]}
+
+
+def list_response(result, key):
+    ''' @INPUTS
+        result: document of a list endpoint (dict)
+        key: name of the list of rows in result (i.e. 'signal')
+
+        Returns the response of a list endpoint in the negotiated
+        representation:
+        - application/json: result as is, see json_response()
+        - application/vnd.gnss-api.columnar+json: result with the rows
+          as columns, see columnar()
+        - application/msgpack: result as is, in MessagePack '''
+
+    mimetype = negotiate()
+
+    if mimetype == MSGPACK:
+        return Response(msgpack.packb(result, use_bin_type=True),
+                        mimetype=MSGPACK)
+
+    if mimetype == COLUMNAR:
+        return json_response(dict(result, **{key: columnar(result[key])}),
+                             mimetype=COLUMNAR)
+
+    return json_response(result)
@@ -0,0 +1,52 @@
+from flask import Response, stream_with_context
+import os
+
+from serializers import dumps
+
+# Rows fetched from the (server side) cursor at a time
+STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', 1000))
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def stream_list(key, query, batch_size=STREAM_BATCH_SIZE, fields=None):
+    ''' @INPUTS
+        key: name of the list in the response (i.e. 'signal')
+        query: SQLAlchemy query of model rows with a format() method
+        batch_size: rows fetched per round trip
+        fields: optional list of the columns to format (see fields.py)
+
+        Streams {"<key>": [...], "success": true} (same bytes as
+        json_response) while the rows are read in batches with yield_per, so
+        the worker never holds more than one batch in memory and the
+        first bytes go out before the query has finished.
+        Returns the streaming Response, or None if there are no rows. '''
+
+    rows = iter(query.yield_per(batch_size))
+
+    # Read ahead one row so an empty result can still become a 404
+    first = next(rows, None)
+
+    if first is None:
+        return None
+
+    def generate():
+        yield b'{"' + key.encode() + b'":[' + \
+            dumps(first.format(fields=fields))
+
+        chunk = []
+
+        for row in rows:
+            chunk.append(dumps(row.format(fields=fields)))
+
+            if len(chunk) == batch_size:
+                yield b',' + b','.join(chunk)
+                chunk = []
+
+        if chunk:
+            yield b',' + b','.join(chunk)
+
+        yield b'],"success":true}\n'
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/json')
@@ -0,0 +1,185 @@
+import asyncio
+import base64
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+from urllib.error import URLError
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.mkdtemp(), 'gnss.db'))
+os.environ.setdefault('APP_SECRET_KEY', 'test')
+os.environ.setdefault('CLIENT_ID', 'test')
+os.environ.setdefault('AUTH0_DOMAIN', 'example.auth0.com')
+os.environ.setdefault('ALGORITHMS', 'RS256,ES256')
+os.environ.setdefault('API_AUDIENCE', 'gnss')
+
+from sqlalchemy import create_engine
+
+import replicas
+from app import create_app
+from asgi import AsyncApi
+from models import database_path, db, Gnss
+from replicas import StickySubjects
+
+
+def asgi_get(app, path, headers={}):
+    '''Returns (status, headers, body) of a GET request to an ASGI app.'''
+
+    path, _, query = path.partition('?')
+    scope = {'type': 'http', 'asgi': {'version': '3.0'},
+             'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+             'path': path, 'raw_path': path.encode(), 'root_path': '',
+             'query_string': query.encode(),
+             'headers': [(name.lower().encode(), value.encode())
+                         for name, value in headers.items()],
+             'server': ('localhost', 80), 'client': ('127.0.0.1', 5000)}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    async def request():
+        await app(scope, receive, send)
+
+        return (messages[0]['status'],
+                {name.decode(): value.decode()
+                 for name, value in messages[0]['headers']},
+                b''.join(message.get('body', b'')
+                         for message in messages[1:]))
+
+    return request()
+
+
+@unittest.skipIf(database_path == 'sqlite://',
+                 'the async driver needs a database file or server')
+class AsgiTestCase(unittest.TestCase):
+    '''Class representing the suite of async serving mode test cases.'''
+
+    def setUp(self):
+        '''Defines the Flask app and its ASGI app with two gnss.'''
+
+        self.app = create_app()
+        self.client = self.app.test_client()
+        self.api = AsyncApi(self.app)
+
+        with self.app.app_context():
+            db.drop_all()
+            db.create_all()
+            Gnss(name='GPS', owner='USA', num_satellites=32,
+                 num_frequencies=3).insert()
+            Gnss(name='Galileo', owner='EU', num_satellites=36,
+                 num_frequencies=4).insert()
+
+    def get(self, *requests):
+        '''Returns the ASGI responses of (path, headers) requests.'''
+
+        async def run():
+            try:
+                return [await asgi_get(self.api, path, headers)
+                        for path, headers in requests]
+            finally:
+                await self.api.disconnect()
+
+        return asyncio.run(run())
+
+    # -----------------------------------------------------------------------------------------------------------
+
+    def test_same_responses_as_flask(self):
+        '''Tests that the async endpoints answer like the Flask app.'''
+
+        paths = ['/gnss', '/gnss?limit=1', '/gnss?fields=name,owner']
+        responses = self.get(*[(path, {}) for path in paths])
+
+        for path, (status, headers, body) in zip(paths, responses):
+            res = self.client.get(path)
+
+            self.assertEqual(status, res.status_code)
+            self.assertEqual(body, res.data)
+            self.assertEqual(headers['etag'], res.headers['ETag'])
+
+    def test_not_modified(self):
+        '''Tests the 304 of a request with a matching If-None-Match.'''
+
+        etag = self.client.get('/gnss').headers['ETag']
+
+        [(status, headers, body)] = self.get(
+            ('/gnss', {'If-None-Match': etag}))
+
+        self.assertEqual(status, 304)
+        self.assertEqual(body, b'')
+
+    def test_errors_are_delegated(self):
+        '''Tests that errors (RBAC included) come from the Flask app.'''
+
+        paths = ['/gnss-signals', '/gnss?limit=abc', '/gnss/9/signals']
+        responses = self.get(*[(path, {}) for path in paths])
+
+        for path, (status, headers, body) in zip(paths, responses):
+            res = self.client.get(path)
+
+            self.assertEqual(status, res.status_code)
+            self.assertEqual(body, res.data)
+
+    def test_read_your_writes(self):
+        '''Tests that a bearer token client that just wrote reads from the
+           primary, like with read_only().'''
+
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+
+        replica = 'sqlite:///' + os.path.join(folder, 'replica.db')
+        replica_engine = create_engine(replica)
+        db.Model.metadata.create_all(replica_engine)
+        replica_engine.execute(Gnss.__table__.insert(),
+                               name='GLONASS', owner='Russia',
+                               num_satellites=24, num_frequencies=2)
+        replica_engine.dispose()
+
+        self.api = AsyncApi(self.app, replica_urls=[replica])
+        self.addCleanup(setattr, replicas, 'sticky_subjects',
+                        replicas.sticky_subjects)
+        replicas.sticky_subjects = StickySubjects()
+
+        # As recorded by remember_write() after a write of the director
+        replicas.sticky_subjects.put('director', time.time())
+
+        def bearer(sub):
+            claims = base64.urlsafe_b64encode(
+                json.dumps({'sub': sub}).encode()).decode().rstrip('=')
+
+            return {'Authorization': f'Bearer e30.{claims}.x'}
+
+        (_, _, director), (_, _, client) = self.get(
+            ('/gnss?fields=name', bearer('director')),
+            ('/gnss?fields=name', bearer('client')))
+
+        self.assertEqual([gnss['name'] for gnss
+                          in json.loads(director)['gnss']], ['GPS', 'Galileo'])
+        self.assertEqual([gnss['name'] for gnss
+                          in json.loads(client)['gnss']], ['GLONASS'])
+
+    def test_verification_failures_are_delegated(self):
+        '''Tests a token that cannot be verified (JWKS unreachable).'''
+
+        headers = {'Authorization': 'Bearer token'}
+
+        with mock.patch('auth.verify_decode_jwt',
+                        side_effect=URLError('unreachable')), \
+                mock.patch('asgi.verify_decode_jwt',
+                           side_effect=URLError('unreachable')):
+            [(status, _, body)] = self.get(('/gnss-signals', headers))
+            res = self.client.get('/gnss-signals', headers=headers)
+
+        self.assertEqual(status, 401)
+        self.assertEqual(body, res.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
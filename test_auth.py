@@ -0,0 +1,171 @@
+import unittest
+import base64
+import json
+import os
+import subprocess
+import sys
+import time
+
+os.environ.setdefault('AUTH0_DOMAIN', 'example.auth0.com')
+os.environ.setdefault('ALGORITHMS', 'RS256,ES256')
+os.environ.setdefault('API_AUDIENCE', 'gnss')
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa, utils
+
+from auth import AuthError, VERIFIERS, ALGORITHM_LIST, API_AUDIENCE, \
+    AUTH0_DOMAIN
+
+
+def b64(data):
+    '''Encodes bytes as unpadded base64url.'''
+
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def b64int(number):
+    '''Encodes an integer as unpadded base64url.'''
+
+    return b64(number.to_bytes((number.bit_length() + 7) // 8, 'big'))
+
+
+class StaticKeyStore:
+    '''A JwksKeyStore stand-in holding fixed keys.'''
+
+    def __init__(self, keys):
+        self.keys = {key['kid']: key for key in keys}
+
+    def get_key(self, kid):
+        return self.keys.get(kid)
+
+
+class VerifierTestCase(unittest.TestCase):
+    '''Class representing the suite of JWT verifier test cases.'''
+
+    @classmethod
+    def setUpClass(cls):
+        '''Creates an RSA and an EC signing key with their JWKs.'''
+
+        cls.rsa_key = rsa.generate_private_key(public_exponent=65537,
+                                               key_size=2048)
+        cls.ec_key = ec.generate_private_key(ec.SECP256R1())
+
+        rsa_numbers = cls.rsa_key.public_key().public_numbers()
+        ec_numbers = cls.ec_key.public_key().public_numbers()
+
+        cls.store = StaticKeyStore([
+            {'kid': 'rsa', 'kty': 'RSA', 'use': 'sig',
+             'n': b64int(rsa_numbers.n), 'e': b64int(rsa_numbers.e)},
+            {'kid': 'ec', 'kty': 'EC', 'use': 'sig', 'crv': 'P-256',
+             'x': b64(ec_numbers.x.to_bytes(32, 'big')),
+             'y': b64(ec_numbers.y.to_bytes(32, 'big'))}])
+
+    def sign(self, claims, alg='RS256', kid=None):
+        '''Returns a signed token for the given claims.'''
+
+        if kid is None:
+            kid = 'rsa' if alg.startswith('RS') else 'ec'
+
+        header = {'alg': alg, 'typ': 'JWT', 'kid': kid}
+
+        signing_input = (b64(json.dumps(header).encode()) + '.' +
+                         b64(json.dumps(claims).encode())).encode()
+
+        if alg == 'RS256':
+            signature = self.rsa_key.sign(signing_input, padding.PKCS1v15(),
+                                          hashes.SHA256())
+        else:
+            r, s = utils.decode_dss_signature(
+                self.ec_key.sign(signing_input, ec.ECDSA(hashes.SHA256())))
+            signature = r.to_bytes(32, 'big') + s.to_bytes(32, 'big')
+
+        return signing_input.decode() + '.' + b64(signature)
+
+    def claims(self, **overrides):
+        '''Returns valid claims, with overrides applied.'''
+
+        claims = {'iss': f'https://{AUTH0_DOMAIN}/', 'aud': API_AUDIENCE,
+                  'exp': int(time.time()) + 60, 'iat': int(time.time()),
+                  'permissions': ['get:signals']}
+        claims.update(overrides)
+
+        return claims
+
+    def outcome(self, verifier, token):
+        '''Returns the payload or the (status, code) of the AuthError.'''
+
+        try:
+            return verifier.decode(token)
+        except AuthError as e:
+            return (e.status_code, e.error['code'])
+
+    # -----------------------------------------------------------------------------------------------------------
+
+    def test_backends_agree(self):
+        '''Tests that all backends give the same result for all cases.'''
+
+        good = self.sign(self.claims())
+        tokens = {
+            'rs256': good,
+            'es256': self.sign(self.claims(), alg='ES256'),
+            'expired': self.sign(self.claims(exp=int(time.time()) - 10)),
+            'audience': self.sign(self.claims(aud='other')),
+            'issuer': self.sign(self.claims(iss='https://evil/')),
+            'unknown_kid': self.sign(self.claims(), kid='other'),
+            'tampered': good[:-4] + ('AAAA' if good[-4:] != 'AAAA'
+                                     else 'BBBB'),
+            'garbage': 'not-a-token'}
+
+        expected = {
+            'expired': (401, 'token_expired'),
+            'audience': (401, 'invalid_claims'),
+            'issuer': (401, 'invalid_claims'),
+            'unknown_kid': (400, 'invalid_header'),
+            'tampered': (400, 'invalid_header'),
+            'garbage': (400, 'invalid_header')}
+
+        for name, backend in VERIFIERS.items():
+            verifier = backend(self.store, ALGORITHM_LIST, API_AUDIENCE,
+                               f'https://{AUTH0_DOMAIN}/')
+
+            for case, token in tokens.items():
+                with self.subTest(backend=name, case=case):
+                    result = self.outcome(verifier, token)
+
+                    if case in expected:
+                        self.assertEqual(result, expected[case])
+                    else:
+                        self.assertEqual(result['permissions'],
+                                         ['get:signals'])
+
+    def test_key_objects_are_reused(self):
+        '''Tests that a JWK is turned into a key object only once.'''
+
+        verifier = VERIFIERS['cryptography'](
+            self.store, ALGORITHM_LIST, API_AUDIENCE,
+            f'https://{AUTH0_DOMAIN}/')
+        token = self.sign(self.claims())
+
+        verifier.decode(token)
+        key = verifier._keys[('rsa', 'RS256')][1]
+        verifier.decode(token)
+
+        self.assertIs(verifier._keys[('rsa', 'RS256')][1], key)
+
+    def test_unknown_backend_fails_at_import(self):
+        '''Tests that a JWT_BACKEND typo stops the boot.'''
+
+        result = subprocess.run(
+            [sys.executable, '-c', 'import auth'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=dict(os.environ, JWT_BACKEND='cryptograhpy'),
+            stderr=subprocess.PIPE)
+
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn(b'JWT_BACKEND must be one of', result.stderr)
+
+    # -----------------------------------------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    unittest.main()
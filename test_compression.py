@@ -0,0 +1,113 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask import Flask, Response
+
+import compression
+
+
+class CompressionTestCase(unittest.TestCase):
+    '''Class representing the suite of response compression test cases.'''
+
+    def setUp(self):
+        '''Defines a bare app with compression and its static folder.'''
+
+        self.static_folder = tempfile.mkdtemp()
+        self.css = b'body { color: black; }\n' * 100
+
+        with open(os.path.join(self.static_folder, 'styles.css'), 'wb') as f:
+            f.write(self.css)
+
+        self.app = Flask(__name__, static_folder=self.static_folder,
+                         static_url_path='/static')
+        compression.setup_compression(self.app)
+
+        self.body = b'{"signal":[' + b'{"id":1,"signal":"L1C"},' * 100 + \
+            b'{"id":2,"signal":"L5"}],"success":true}\n'
+
+        @self.app.route('/large')
+        def large():
+            response = Response(self.body, mimetype='application/json')
+            response.set_etag('signal.1')
+            return response
+
+        @self.app.route('/small')
+        def small():
+            return Response(b'{"success":true}\n',
+                            mimetype='application/json')
+
+        @self.app.route('/stream')
+        def stream():
+            return Response(iter([self.body[:100], self.body[100:]]),
+                            mimetype='application/json')
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        '''Removes the temporary static folder.'''
+
+        shutil.rmtree(self.static_folder)
+
+    # -----------------------------------------------------------------------------------------------------------
+
+    def test_large_response(self):
+        '''Tests that a large body is gzipped with a weak ETag.'''
+
+        res = self.client.get('/large', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.data), self.body)
+        self.assertEqual(res.headers['ETag'], 'W/"signal.1"')
+        self.assertIn('Accept-Encoding', res.headers['Vary'])
+
+    def test_small_or_not_accepted(self):
+        '''Tests that small bodies and identity clients are not compressed.'''
+
+        res = self.client.get('/small', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', res.headers)
+
+        res = self.client.get('/missing', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(res.status_code, 404)
+        self.assertNotIn('Content-Encoding', res.headers)
+
+        res = self.client.get('/large')
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertEqual(res.data, self.body)
+
+    def test_streamed_response(self):
+        '''Tests that a streamed body is compressed chunk by chunk.'''
+
+        res = self.client.get('/stream', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', res.headers)
+        self.assertEqual(gzip.decompress(res.data), self.body)
+
+    def test_precompressed_static(self):
+        '''Tests that static files are served from their .gz copy.'''
+
+        written = compression.precompress(self.static_folder)
+        path = os.path.join(self.static_folder, 'styles.css.gz')
+
+        self.assertIn(path, written)
+
+        res = self.client.get('/static/styles.css',
+                              headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(res.mimetype, 'text/css')
+        self.assertEqual(gzip.decompress(res.data), self.css)
+        res.close()
+
+        res = self.client.get('/static/styles.css')
+
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertEqual(res.data, self.css)
+        res.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
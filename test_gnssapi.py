@@ -1,27 +1,113 @@
-import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
+import os
+import unittest
+
+# db must exist first!  "createdb -U postgres gnss_test"
+TEST_DATABASE_URL = os.environ.get(
+    'TEST_DATABASE_URL', 'postgres://postgres@localhost:5432/gnss_test')
+
+os.environ.setdefault('DATABASE_URL', TEST_DATABASE_URL)
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import scoped_session
 
 from app import create_app
-from models import setup_db, Gnss, Signal
+from models import db, search_filter, Gnss, Signal
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+def worker_database_url(database_url=TEST_DATABASE_URL):
+    ''' Returns the database of this test process.  Under pytest-xdist
+        (pytest -n auto), every worker gets its own database (e.g.
+        gnss_test_gw0, gnss_test_gw1), created if it does not exist. '''
+
+    worker = os.environ.get('PYTEST_XDIST_WORKER')
+    url = make_url(database_url)
+
+    if worker is None or not url.database:
+        return database_url
+
+    if url.get_backend_name() == 'sqlite':
+        root, extension = os.path.splitext(url.database)
+        url.database = f'{root}_{worker}{extension}'
+
+        return str(url)
+
+    name = f'{url.database}_{worker}'
+
+    # Databases are created from the maintenance database, outside of
+    # a transaction
+    url.database = 'postgres'
+    server = create_engine(url, isolation_level='AUTOCOMMIT')
+
+    with server.connect() as connection:
+        if connection.scalar(text('SELECT 1 FROM pg_database '
+                                  'WHERE datname = :name'),
+                             name=name) is None:
+            connection.execute(f'CREATE DATABASE "{name}"')
+
+    server.dispose()
+    url.database = name
+
+    return str(url)
+
+
+def enable_sqlite_savepoints(engine):
+    ''' Lets SQLAlchemy begin the transactions of SQLite connections
+        instead of pysqlite (which does not begin one before a
+        SAVEPOINT), so the tests can also run on a SQLite file. '''
+
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def begin(connection):
+        connection.execute('BEGIN')
+
+
+class SavepointScopedSession(scoped_session):
+    ''' The sessions of a test, each inside a SAVEPOINT (see make_session).
+        Closing or removing one (at the end of every request) rolls back
+        its SAVEPOINT first, as closing a session of the app rolls back
+        its transaction (Session.close() leaves a SAVEPOINT open). '''
+
+    def close(self):
+        '''Rolls back and closes the current session.'''
+
+        if self.registry.has():
+            self.registry().rollback()
+            self.registry().close()
+
+    def remove(self):
+        '''Rolls back and discards the current session.'''
+
+        self.close()
+        super().remove()
+
+# -----------------------------------------------------------------------------------------------------------
 
 
 class GnssTestCase(unittest.TestCase):
     '''Class representing the suite of GNSS API test cases.'''
 
-    def add_gnss_to_db(self):
+    @staticmethod
+    def add_gnss_to_db():
         '''Populates the db with some GNSS data.'''
 
         gnss1 = Gnss(name='GPS', owner='USA',
                      num_satellites=32, num_frequencies=3)
         gnss2 = Gnss(name='Galileo', owner='EU',
                      num_satellites=36, num_frequencies=4)
-        self.db.session.add(gnss1)
-        self.db.session.add(gnss2)
+        db.session.add(gnss1)
+        db.session.add(gnss2)
 
-        self.db.session.commit()
+        db.session.commit()
 
-    def add_gnss_signals_to_db(self):
+    @staticmethod
+    def add_gnss_signals_to_db():
         '''Populates the db with some GNSS signal data.'''
 
         signal1 = Signal(signal='L1 C/A', gnss_id=1)
@@ -33,20 +119,50 @@ class GnssTestCase(unittest.TestCase):
         signal7 = Signal(signal='E5A', gnss_id=2)
         signal8 = Signal(signal='E5B', gnss_id=2)
         signal9 = Signal(signal='E5AltBOC', gnss_id=2)
-        self.db.session.add(signal1)
-        self.db.session.add(signal2)
-        self.db.session.add(signal3)
-        self.db.session.add(signal4)
-        self.db.session.add(signal5)
-        self.db.session.add(signal6)
-        self.db.session.add(signal7)
-        self.db.session.add(signal8)
-        self.db.session.add(signal9)
-
-        self.db.session.commit()
+        db.session.add(signal1)
+        db.session.add(signal2)
+        db.session.add(signal3)
+        db.session.add(signal4)
+        db.session.add(signal5)
+        db.session.add(signal6)
+        db.session.add(signal7)
+        db.session.add(signal8)
+        db.session.add(signal9)
+
+        db.session.commit()
+
+    @classmethod
+    def setUpClass(cls):
+        ''' Initializes the app, and creates the schema and the test
+            data once for all the tests (of this process). '''
+
+        cls.app = create_app(
+            {'SQLALCHEMY_DATABASE_URI': worker_database_url()})
+        cls.engine = db.get_engine(cls.app)
+
+        if cls.engine.dialect.name == 'sqlite':
+            enable_sqlite_savepoints(cls.engine)
+
+        # Binds the app to the current testing context
+        with cls.app.app_context():
+            db.drop_all()
+            db.create_all()
+
+            # Populate the db for proper unit testing
+            cls.add_gnss_to_db()
+            cls.add_gnss_signals_to_db()
+
+            db.session.remove()
+
+    @classmethod
+    def tearDownClass(cls):
+        '''Closes the connections of the app.'''
+
+        cls.engine.dispose()
 
     def setUp(self):
-        '''Defines the test case variables and initializes the app.'''
+        ''' Defines the test case variables, and starts the transaction
+            of the test. '''
 
         # Capture these bearer tokens after logging in
         # (will be displayed on the page)
@@ -57,32 +173,46 @@ class GnssTestCase(unittest.TestCase):
         self.director_auth_header = {
             'Authorization': self.director_bearer_token}
 
-        self.app = create_app()
         self.client = self.app.test_client
-        # db must exist first!  "createdb -U postgres gnss_test"
-        self.database_name = "gnss_test"
-        self.database_path = "postgres://postgres@localhost:5432/" \
-                             f"{self.database_name}"
-
-        db = setup_db(self.app, self.database_path)
-        db.drop_all()
-        db.create_all()
 
-        # Binds the app to the current testing context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
+        # The test runs in a transaction rolled back by tearDown, on one
+        # connection shared by all the sessions of the test
+        self.connection = self.engine.connect()
+        self.transaction = self.connection.begin()
 
-            self.db.drop_all()
-            self.db.create_all()
+        self.app_session = db.session
+        db.session = SavepointScopedSession(self.make_session)
 
-            # Populate the db for proper unit testing
-            self.add_gnss_to_db()
-            self.add_gnss_signals_to_db()
+        # Pages cached by the previous test may show its rolled back rows
+        self.app.extensions['gnss_cache'].clear()
 
     def tearDown(self):
-        '''Executes after each test.'''
-        pass
+        '''Rolls back everything the test wrote.'''
+
+        db.session.remove()
+        db.session = self.app_session
+
+        self.transaction.rollback()
+        self.connection.close()
+
+    def make_session(self):
+        ''' Returns a new session of the app (one per request) on the
+            connection of the test, inside a SAVEPOINT: the commits and
+            rollbacks of the endpoints end the SAVEPOINT, and a new one
+            is started right away. '''
+
+        session = self.app_session.session_factory(bind=self.connection,
+                                                   binds={})
+        session.begin_nested()
+
+        @event.listens_for(session, 'after_transaction_end')
+        def restart_savepoint(session, transaction):
+            if transaction.nested and not transaction.parent.nested:
+                # Expires the objects like a commit of the session does
+                session.expire_all()
+                session.begin_nested()
+
+        return session
 
     # -----------------------------------------------------------------------------------------------------------
 
@@ -153,6 +283,21 @@ class GnssTestCase(unittest.TestCase):
         res = self.client().post('/loggedout')
         self.assertEqual(res.status_code, 405)
 
+    def test_health_db(self):
+        '''Tests the health check for the pool and cache metrics.'''
+
+        self.client().get('/gnss')
+        self.client().get('/gnss')
+
+        res = self.client().get('/health/db')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertIn('pool', data['pool'])
+        self.assertGreaterEqual(data['caches']['gnss']['hits'], 1)
+        self.assertIn('evictions', data['caches']['token'])
+
     # -----------------------------------------------------------------------------------------------------------
 
     def test_get_request_gnss(self):
@@ -185,6 +330,126 @@ class GnssTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(len(data))
 
+    def test_get_request_gnss_not_modified(self):
+        '''Test gnss endpoint answering If-None-Match with a 304.'''
+
+        res = self.client().get('/gnss')
+        etag = res.headers['ETag']
+
+        res = self.client().get('/gnss', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    def test_get_request_gnss_etag_changes(self):
+        '''Test gnss endpoint ETag changing after a PATCH (director user).'''
+
+        etag = self.client().get('/gnss').headers['ETag']
+
+        self.client().patch('/gnss/1', json={'owner': 'America'},
+                            headers=self.director_auth_header)
+        res = self.client().get('/gnss', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_get_request_gnss_cached(self):
+        '''Test gnss endpoint serving the cached catalog until a change
+        (director user).'''
+
+        self.client().get('/gnss')
+        res = self.client().get('/gnss')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+
+        self.client().patch('/gnss/1', json={'owner': 'America'},
+                            headers=self.director_auth_header)
+        res = self.client().get('/gnss')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertEqual(data['gnss'][0]['owner'], 'America')
+
+    def test_get_request_gnss_fields(self):
+        '''Test gnss endpoint with a sparse fieldset (?fields=).'''
+
+        res = self.client().get('/gnss?fields=id,name')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['gnss'][0], {'id': 1, 'name': 'GPS'})
+
+    def test_get_request_gnss_fields_400(self):
+        '''Test gnss endpoint for bad request (unknown field).'''
+
+        res = self.client().get('/gnss?fields=id,password')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_get_request_gnss_expand_signals(self):
+        '''Test gnss?expand=signals endpoint for success (client user).'''
+
+        res = self.client().get('/gnss?expand=signals',
+                                headers=self.client_auth_header)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['gnss'][0]['signals']), 5)
+
+    def test_get_request_gnss_expand_signals_unauthorized(self):
+        '''Test gnss?expand=signals endpoint for unauthorized (no token).'''
+
+        res = self.client().get('/gnss?expand=signals')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(data['success'], False)
+
+    def test_get_request_gnss_expand_signals_bad_token(self):
+        '''Test gnss?expand=signals endpoint answering a token that
+        cannot be verified like gnss-signals does (401).'''
+
+        headers = {'Authorization': 'Bearer garbage'}
+
+        for url in ('/gnss?expand=signals', '/gnss-signals'):
+            res = self.client().get(url, headers=headers)
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 401)
+            self.assertEqual(data['message'], 'Unauthorized.')
+
+    def test_get_request_gnss_expand_signals_query_count(self):
+        '''Test gnss?expand=signals endpoint for a constant number of
+        queries as the number of gnss grows (no query per gnss).'''
+
+        counts = []
+
+        for name in ('GLONASS', 'BeiDou'):
+            with self.app.app_context():
+                Gnss(name=name, owner='Other',
+                     num_satellites=24, num_frequencies=3).insert()
+                engine = db.get_engine(self.app)
+
+            statements = []
+
+            def count(conn, cursor, statement, *args):
+                statements.append(statement)
+
+            event.listen(engine, 'before_cursor_execute', count)
+            res = self.client().get('/gnss?expand=signals',
+                                    headers=self.client_auth_header)
+            event.remove(engine, 'before_cursor_execute', count)
+
+            self.assertEqual(res.status_code, 200)
+            counts.append(len(statements))
+
+        self.assertEqual(counts[0], counts[1])
+
     def test_patch_request_gnss(self):
         '''Tests the gnss endpoint a different method (PATCH).'''
 
@@ -239,6 +504,182 @@ class GnssTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertTrue(len(data))
 
+    def test_get_request_gnss_paginated(self):
+        '''Test gnss endpoint paging through all GNSS with a cursor.'''
+
+        res = self.client().get('/gnss?limit=1')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['gnss']), 1)
+        self.assertTrue(data['next_cursor'])
+
+        res = self.client().get('/gnss?limit=1&cursor=' +
+                                data['next_cursor'])
+        next_data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(next_data['gnss']), 1)
+        self.assertGreater(next_data['gnss'][0]['id'],
+                           data['gnss'][0]['id'])
+        self.assertIsNone(next_data['next_cursor'])
+
+    def test_get_request_gnss_signals_paginated(self):
+        '''Test gnss-signals endpoint paging (client user).'''
+
+        ids = []
+        cursor = ''
+
+        while cursor is not None:
+            res = self.client().get(f'/gnss-signals?limit=4&cursor={cursor}'
+                                    if cursor else '/gnss-signals?limit=4',
+                                    headers=self.client_auth_header)
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertLessEqual(len(data['signal']), 4)
+
+            ids += [signal['id'] for signal in data['signal']]
+            cursor = data['next_cursor']
+
+        self.assertEqual(len(ids), 9)
+        self.assertEqual(ids, sorted(set(ids)))
+
+    def test_get_request_gnss_signals_stream(self):
+        '''Test gnss-signals endpoint streaming all signals (client user).'''
+
+        res = self.client().get('/gnss-signals?stream=true',
+                                headers=self.client_auth_header)
+
+        # Before res.data, which buffers the body
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.is_streamed)
+
+        chunks = list(res.response)
+        data = json.loads(b''.join(chunks))
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['signal']), 9)
+
+    def test_get_request_gnss_signals_columnar(self):
+        '''Test gnss-signals endpoint for the columnar JSON format.'''
+
+        headers = dict(self.client_auth_header,
+                       Accept='application/vnd.gnss-api.columnar+json')
+        res = self.client().get('/gnss-signals', headers=headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype,
+                         'application/vnd.gnss-api.columnar+json')
+        self.assertEqual(data['signal']['id'], list(range(1, 10)))
+        self.assertEqual(len(data['signal']['signal']), 9)
+
+    def test_get_request_gnss_signals_bad_cursor(self):
+        '''Test gnss-signals endpoint for bad request (malformed cursor).'''
+
+        res = self.client().get('/gnss-signals?cursor=notacursor',
+                                headers=self.client_auth_header)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    # -----------------------------------------------------------------------------------------------------------
+
+    def test_get_signals_of_gnss_client(self):
+        '''Test gnss/<gnss_id>/signals endpoint for success (client user).'''
+
+        res = self.client().get('/gnss/2/signals',
+                                headers=self.client_auth_header)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['signal']), 4)
+        self.assertTrue(all(signal['gnss_id'] == 2
+                            for signal in data['signal']))
+
+    def test_get_signals_of_gnss(self):
+        '''Test gnss/<gnss_id>/signals endpoint for unauthorized
+        (normal user).'''
+
+        res = self.client().get('/gnss/2/signals')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(data['success'], False)
+
+    def test_get_signals_of_gnss_404(self):
+        '''Test gnss/<gnss_id>/signals endpoint for a missing gnss.'''
+
+        res = self.client().get('/gnss/1000/signals',
+                                headers=self.client_auth_header)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+    # -----------------------------------------------------------------------------------------------------------
+
+    def test_search_gnss(self):
+        '''Test gnss/search endpoint for success (case-insensitive).'''
+
+        res = self.client().get('/gnss/search?q=gal&match=prefix')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(all(gnss['name'].lower().startswith('gal')
+                            for gnss in data['gnss']))
+
+    def test_search_gnss_prefix_is_literal(self):
+        '''Test gnss/search prefix search for no match on a wildcard.'''
+
+        res = self.client().get('/gnss/search?q=%25&match=prefix')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+    def test_search_gnss_prefix_uses_index(self):
+        '''Test that the prefix search is served by the lower() indexes.'''
+
+        if self.engine.dialect.name != 'sqlite':
+            self.skipTest('plain lower() indexes are SQLite only')
+
+        with self.app.app_context():
+            query = Gnss.query.filter(search_filter(Gnss, 'Gal', 'prefix'))
+            statement = query.statement.compile(
+                dialect=self.engine.dialect,
+                compile_kwargs={'literal_binds': True})
+            plan = self.connection.execute(
+                text(f'EXPLAIN QUERY PLAN {statement}')).fetchall()
+
+        self.assertTrue(any('ix_gnss_name_lower' in row[-1] for row in plan))
+
+    def test_search_gnss_400(self):
+        '''Test gnss/search endpoint for bad request (no q).'''
+
+        res = self.client().get('/gnss/search?match=prefix')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_search_gnss_signals_client(self):
+        '''Test gnss-signals/search endpoint for success (client user).'''
+
+        res = self.client().get('/gnss-signals/search?q=l1',
+                                headers=self.client_auth_header)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(all('l1' in signal['signal'].lower()
+                            for signal in data['signal']))
+
     # -----------------------------------------------------------------------------------------------------------
 
     def test_post_gnss(self):
@@ -313,6 +754,63 @@ class GnssTestCase(unittest.TestCase):
 
     # -----------------------------------------------------------------------------------------------------------
 
+    def test_post_gnss_batch_director(self):
+        '''Test gnss/batch endpoint (POST request) for success
+        (director user).'''
+
+        res = self.client().post('/gnss/batch',
+                                 json=[{'name': 'Beidou',
+                                        'owner': 'China',
+                                        'num_satellites': 35,
+                                        'num_frequencies': 5},
+                                       {'name': 'GLONASS',
+                                        'owner': 'Russia',
+                                        'num_satellites': 24,
+                                        'num_frequencies': 2}],
+                                 headers=self.director_auth_header)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual([gnss['name'] for gnss in data['gnss']],
+                         ['Beidou', 'GLONASS'])
+        self.assertEqual([result['id'] for result in data['results']],
+                         [gnss['id'] for gnss in data['gnss']])
+
+    def test_post_gnss_batch_422(self):
+        '''Test gnss/batch endpoint (POST request) rejecting the whole
+        batch for one invalid item (director user).'''
+
+        res = self.client().post('/gnss/batch',
+                                 json=[{'name': 'Beidou',
+                                        'owner': 'China',
+                                        'num_satellites': 35,
+                                        'num_frequencies': 5},
+                                       {'name': 'GPS',
+                                        'owner': 'USA',
+                                        'num_satellites': 32,
+                                        'num_frequencies': 3}],
+                                 headers=self.director_auth_header)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+        self.assertEqual([result['success'] for result in data['results']],
+                         [True, False])
+        self.assertEqual(len(Gnss.query.all()), 2)
+
+    def test_post_gnss_signals_batch_client(self):
+        '''Test gnss-signals/batch endpoint (POST request) for
+        unauthorized (client user).'''
+
+        res = self.client().post('/gnss-signals/batch',
+                                 json=[{'signal': 'B1', 'gnss_id': 2}],
+                                 headers=self.client_auth_header)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(data['success'], False)
+
     def test_post_gnss_signals(self):
         '''Test gnss-signals endpoint (POST request) for
         unauthorized (normal user).'''
@@ -629,6 +1127,59 @@ class GnssTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertTrue(len(data))
 
+    def test_patch_gnss_signals_batch_director(self):
+        '''Test gnss-signals/batch endpoint (PATCH request) moving all
+        signals of a gnss (director user).'''
+
+        res = self.client().patch('/gnss-signals/batch',
+                                  json={'filter': {'gnss_id': 2},
+                                        'changes': {'gnss_id': 1}},
+                                  headers=self.director_auth_header)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['signal']), 4)
+        self.assertTrue(all(signal['gnss_id'] == 1
+                            for signal in data['signal']))
+
+    def test_patch_gnss_signals_batch_client(self):
+        '''Test gnss-signals/batch endpoint (PATCH request) for
+        unauthorized (client user).'''
+
+        res = self.client().patch('/gnss-signals/batch',
+                                  json={'ids': [1, 2],
+                                        'changes': {'signal': 'X'}},
+                                  headers=self.client_auth_header)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(data['success'], False)
+
+    def test_delete_gnss_signals_batch_director(self):
+        '''Test gnss-signals/batch endpoint (DELETE request) for
+        success (director user).'''
+
+        res = self.client().delete('/gnss-signals/batch',
+                                   json={'ids': [1, 2, 100]},
+                                   headers=self.director_auth_header)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['delete'], [1, 2])
+        self.assertEqual(len(Signal.query.all()), 7)
+
+    def test_delete_gnss_batch_400(self):
+        '''Test gnss/batch endpoint (DELETE request) for bad request
+        (no ids or filter, director user).'''
+
+        res = self.client().delete('/gnss/batch', json={},
+                                   headers=self.director_auth_header)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
     def test_delete_gnss_signals_404(self):
         '''Test gnss-signals/<signal_id> endpoint (DELETE request) for
         ID not found (director user).'''
@@ -0,0 +1,134 @@
+import unittest
+import json
+import os
+import tempfile
+
+from jwks import JwksKeyStore, parse_max_age
+
+
+class FakeClock:
+    '''A monotonic clock that only moves when told to.'''
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeResponse:
+    '''Minimal stand-in for the object returned by urlopen.'''
+
+    def __init__(self, body, headers):
+        self.body = body
+        self.headers = headers
+
+    def read(self):
+        return self.body
+
+    def close(self):
+        pass
+
+
+class JwksKeyStoreTestCase(unittest.TestCase):
+    '''Class representing the suite of JWKS key store test cases.'''
+
+    def setUp(self):
+        '''Defines a stub JWKS server that can be switched off.'''
+
+        self.clock = FakeClock()
+        self.fetches = 0
+        self.down = False
+        self.kids = ['key1']
+        self.headers = {'Cache-Control': 'public, max-age=300'}
+
+        def opener(url, timeout=None):
+            self.fetches += 1
+            if self.down:
+                raise OSError('IdP unavailable')
+            body = json.dumps({'keys': [{'kid': kid, 'kty': 'RSA'}
+                                        for kid in self.kids]})
+            return FakeResponse(body.encode(), self.headers)
+
+        self.store = JwksKeyStore('https://example/.well-known/jwks.json',
+                                  min_refetch_interval=30, max_stale=600,
+                                  opener=opener, clock=self.clock)
+
+    # -----------------------------------------------------------------------------------------------------------
+
+    def test_parse_max_age(self):
+        '''Tests the Cache-Control parsing.'''
+
+        self.assertEqual(parse_max_age('public, max-age=300'), 300)
+        self.assertEqual(parse_max_age('max-age=300, s-maxage=60'), 60)
+        self.assertEqual(parse_max_age('no-cache'), 0)
+        self.assertIsNone(parse_max_age('public'))
+        self.assertIsNone(parse_max_age(None))
+
+    def test_keys_are_cached(self):
+        '''Tests that the document is fetched once within its TTL.'''
+
+        for i in range(10):
+            self.assertEqual(self.store.get_key('key1')['kid'], 'key1')
+
+        self.assertEqual(self.fetches, 1)
+
+    def test_ttl_honors_cache_control(self):
+        '''Tests that the document is refetched once max-age passed.'''
+
+        self.store.get_key('key1')
+        self.clock.now += 301
+        self.store.get_key('key1')
+
+        self.assertEqual(self.fetches, 2)
+
+    def test_unknown_kid_refetch_is_rate_limited(self):
+        '''Tests that unknown kids refetch, but not on every request.'''
+
+        self.store.get_key('key1')
+        self.clock.now += 31
+        self.kids = ['key1', 'key2']
+
+        self.assertIsNotNone(self.store.get_key('key2'))
+        self.assertIsNone(self.store.get_key('key3'))
+        self.assertIsNone(self.store.get_key('key3'))
+        self.assertEqual(self.fetches, 2)
+
+    def test_stale_keys_served_during_outage(self):
+        '''Tests that the last good keys survive a failed refresh.'''
+
+        self.store.get_key('key1')
+        self.down = True
+        self.clock.now += 301
+
+        self.assertEqual(self.store.get_key('key1')['kid'], 'key1')
+
+        self.clock.now += 600
+        with self.assertRaises(RuntimeError):
+            self.store.get_key('key1')
+
+    def test_first_fetch_failure_raises(self):
+        '''Tests that there is nothing to fall back on at first.'''
+
+        self.down = True
+
+        with self.assertRaises(OSError):
+            self.store.get_key('key1')
+
+    def test_local_jwks_file(self):
+        '''Tests loading the keys from a local file url.'''
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'jwks.json')
+            with open(path, 'w') as f:
+                json.dump({'keys': [{'kid': 'local', 'kty': 'RSA'}]}, f)
+
+            store = JwksKeyStore('file://' + path)
+
+            self.assertEqual(store.get_key('local')['kid'], 'local')
+
+    # -----------------------------------------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    unittest.main()
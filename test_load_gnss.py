@@ -0,0 +1,123 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.mkdtemp(), 'gnss.db'))
+
+from flask import Flask
+
+from load_gnss import load
+from models import db, get_table_versions, Gnss, Signal
+
+
+class LoadGnssTestCase(unittest.TestCase):
+    '''Class representing the suite of bulk loader test cases.'''
+
+    def setUp(self):
+        '''Defines an app on an empty database, and the data files.'''
+
+        self.folder = tempfile.mkdtemp()
+
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + \
+            os.path.join(self.folder, 'gnss.db')
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(self.app)
+
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+
+        self.gnss = self.write('gnss.csv',
+                               'name,owner,num_satellites,num_frequencies\n'
+                               'GPS,USA,32,3\n'
+                               'Galileo,EU,36,4\n')
+        self.signals = self.write('signals.jsonl', '\n'.join(json.dumps(row)
+                                  for row in [
+                                      {'signal': 'L1C', 'gnss': 'GPS'},
+                                      {'signal': 'L5', 'gnss': 'GPS'},
+                                      {'signal': 'E1', 'gnss': 'Galileo'},
+                                      {'signal': 'L1C', 'gnss': 'GPS'},
+                                      {'signal': 'B1I', 'gnss': 'BeiDou'}]))
+
+    def tearDown(self):
+        '''Removes the database and the files.'''
+
+        db.session.remove()
+        db.get_engine(self.app).dispose()
+        self.context.pop()
+        shutil.rmtree(self.folder)
+
+    def write(self, name, text):
+        '''Writes a data file and returns its path.'''
+
+        path = os.path.join(self.folder, name)
+
+        with open(path, 'w') as f:
+            f.write(text)
+
+        return path
+
+    # -----------------------------------------------------------------------------------------------------------
+
+    def test_load(self):
+        '''Tests a load, with gnss_id resolved by name.'''
+
+        stats = load(self.gnss, self.signals, quiet=True)
+
+        self.assertEqual(stats['gnss'], {'inserted': 2, 'updated': 0})
+        self.assertEqual(stats['signals'], {'inserted': 3, 'skipped': 1,
+                                            'unknown_gnss': 1})
+        gps = Gnss.query.filter_by(name='GPS').one()
+        self.assertEqual([(s.signal, s.gnss_id) for s in Signal.query
+                          .order_by(Signal.id)],
+                         [('L1C', gps.id), ('L5', gps.id),
+                          ('E1', gps.id + 1)])
+        self.assertEqual(get_table_versions('gnss', 'signal'),
+                         {'gnss': 1, 'signal': 1})
+
+    def test_load_is_idempotent(self):
+        '''Tests that loading the same files again changes nothing.'''
+
+        load(self.gnss, self.signals, quiet=True)
+        stats = load(self.gnss, self.signals, quiet=True)
+
+        self.assertEqual(stats['gnss'], {'inserted': 0, 'updated': 0})
+        self.assertEqual(stats['signals']['inserted'], 0)
+        self.assertEqual(Signal.query.count(), 3)
+        self.assertEqual(get_table_versions('gnss', 'signal'),
+                         {'gnss': 1, 'signal': 1})
+
+    def test_update_gnss(self):
+        '''Tests that a gnss of the file updates the one in the db.'''
+
+        load(self.gnss, quiet=True)
+        gnss = self.write('gnss.json', json.dumps([
+            {'name': 'GPS', 'owner': 'USA', 'num_satellites': 31,
+             'num_frequencies': 3}]))
+
+        stats = load(gnss, quiet=True)
+
+        self.assertEqual(stats['gnss'], {'inserted': 0, 'updated': 1})
+        self.assertEqual(Gnss.query.filter_by(name='GPS').one()
+                         .num_satellites, 31)
+
+    def test_invalid_row_loads_nothing(self):
+        '''Tests that a bad row fails the whole load.'''
+
+        signals = self.write('signals.csv', 'signal,gnss\n'
+                                            'L1C,GPS\n'
+                                            'far too long signal name,GPS\n')
+
+        with self.assertRaisesRegex(ValueError, 'signals.csv row 2'):
+            load(self.gnss, signals, quiet=True)
+
+        self.assertEqual(Gnss.query.count(), 0)
+        self.assertEqual(Signal.query.count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
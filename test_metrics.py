@@ -0,0 +1,104 @@
+import os
+import unittest
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from flask import Flask
+from sqlalchemy.exc import DBAPIError
+from prometheus_client import REGISTRY
+
+from metrics import setup_metrics
+from models import db, Gnss
+
+
+def sample(name, **labels):
+    '''Returns the current value of a metric sample (0 if missing).'''
+
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class MetricsTestCase(unittest.TestCase):
+    '''Class representing the suite of metrics test cases.'''
+
+    def setUp(self):
+        '''Defines an app with an endpoint running two queries.'''
+
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(self.app)
+        setup_metrics(self.app)
+
+        with self.app.app_context():
+            db.create_all()
+
+        @self.app.route('/gnss/<int:gnss_id>')
+        def gnss(gnss_id):
+            Gnss.query.count()
+            Gnss.query.get(gnss_id)
+            return 'x' * 500
+
+        self.client = self.app.test_client()
+
+    # -----------------------------------------------------------------------------------------------------------
+
+    def test_request_metrics(self):
+        '''Tests the latency, size and query metrics of a route.'''
+
+        labels = {'endpoint': '/gnss/<int:gnss_id>', 'method': 'GET'}
+        requests = sample('gnss_api_request_duration_seconds_count',
+                          status='200', **labels)
+        size = sample('gnss_api_response_size_bytes_sum', **labels)
+        queries = sample('gnss_api_db_queries_per_request_sum', **labels)
+
+        self.client.get('/gnss/1')
+        self.client.get('/gnss/2')
+
+        self.assertEqual(sample('gnss_api_request_duration_seconds_count',
+                                status='200', **labels), requests + 2)
+        self.assertEqual(sample('gnss_api_response_size_bytes_sum',
+                                **labels), size + 1000)
+        self.assertEqual(sample('gnss_api_db_queries_per_request_sum',
+                                **labels), queries + 4)
+
+    def test_unmatched_urls_share_a_label(self):
+        '''Tests that 404s do not create a time series per url.'''
+
+        labels = {'endpoint': '<unmatched>', 'method': 'GET',
+                  'status': '404'}
+        count = sample('gnss_api_request_duration_seconds_count', **labels)
+
+        self.client.get('/nope/1')
+        self.client.get('/nope/2')
+
+        self.assertEqual(sample('gnss_api_request_duration_seconds_count',
+                                **labels), count + 2)
+
+    def test_metrics_endpoint(self):
+        '''Tests the Prometheus text format of GET /metrics.'''
+
+        self.client.get('/gnss/1')
+        res = self.client.get('/metrics')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'gnss_api_request_duration_seconds_bucket{',
+                      res.data)
+        self.assertIn(b'gnss_api_jwt_verify_duration_seconds', res.data)
+
+
+    def test_failed_queries_are_not_kept(self):
+        '''Tests that statements that raise leave no start time behind.'''
+
+        with self.app.app_context():
+            with db.engine.connect() as connection:
+                for _ in range(3):
+                    with self.assertRaises(DBAPIError):
+                        connection.execute('SELECT * FROM missing')
+
+                connection.execute('SELECT 1')
+
+                self.assertEqual(connection.info['query_start'], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import sqlite3
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import NullPool
+
+from pool import (
+    TimedQueuePool,
+    async_pool_options,
+    async_pool_size,
+    engine_options,
+    pool_stats
+)
+
+
+def connect():
+    '''Opens a connection usable from any thread.'''
+
+    return sqlite3.connect(':memory:', check_same_thread=False)
+
+
+class PoolTestCase(unittest.TestCase):
+    '''Class representing the suite of connection pool test cases.'''
+
+    def test_engine_options_sizing(self):
+        '''Tests that the workers share the connections of the database.'''
+
+        options = engine_options('postgres://localhost/gnss', 'queue',
+                                 workers=4, threads=2, max_connections=20)
+
+        self.assertIs(options['poolclass'], TimedQueuePool)
+        self.assertEqual(options['pool_size'], 2)
+        self.assertEqual(options['max_overflow'], 3)
+        self.assertTrue(options['pool_pre_ping'])
+
+    def test_engine_options_modes(self):
+        '''Tests the external pooler mode, sqlite and unknown modes.'''
+
+        self.assertEqual(engine_options('postgres://localhost/gnss',
+                                        'external'),
+                         {'poolclass': NullPool})
+        self.assertEqual(engine_options('sqlite:////tmp/gnss.db'), {})
+
+        with self.assertRaises(ValueError):
+            engine_options('postgres://localhost/gnss', 'bouncer')
+
+    def test_async_pool_shares_the_budget(self):
+        '''Tests that the sync and async pools of a worker share its
+           connections in async mode.'''
+
+        size = async_pool_size(workers=4, max_connections=20)
+        options = engine_options('postgres://localhost/gnss', 'queue',
+                                 workers=4, threads=2, max_connections=20,
+                                 reserved=size)
+
+        self.assertEqual(size, 2)
+        self.assertEqual(options['pool_size'] + options['max_overflow'] +
+                         size, 5)
+        self.assertEqual(async_pool_options('postgresql://localhost/gnss',
+                                            'queue', size),
+                         {'min_size': 1, 'max_size': 2})
+
+    def test_async_pool_options_modes(self):
+        '''Tests the async pool through an external pooler, and sqlite.'''
+
+        options = async_pool_options('postgresql://localhost/gnss',
+                                     'external', 2)
+
+        self.assertEqual(options['statement_cache_size'], 0)
+        self.assertEqual(options['min_size'], 0)
+        self.assertEqual(async_pool_options('sqlite:////tmp/gnss.db'), {})
+
+        with self.assertRaises(ValueError):
+            async_pool_options('postgresql://localhost/gnss', 'bouncer', 2)
+
+    def test_checkout_metrics(self):
+        '''Tests the checkout, occupancy and timeout counters.'''
+
+        engine = create_engine('sqlite://', creator=connect,
+                               poolclass=TimedQueuePool, pool_size=1,
+                               max_overflow=0, pool_timeout=0.05)
+
+        connection = engine.connect()
+        stats = pool_stats(engine)
+
+        self.assertEqual(stats['checked_out'], 1)
+        self.assertEqual(stats['checkouts'], 1)
+
+        with self.assertRaises(TimeoutError):
+            engine.connect()
+
+        connection.close()
+        engine.dispose()
+        stats = pool_stats(engine)
+
+        # The counters survive the pool being recreated
+        self.assertEqual(stats['checked_out'], 0)
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertGreaterEqual(stats['wait_seconds_max'], 0.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import unittest
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from flask import Flask
+from sqlalchemy.exc import DBAPIError
+
+import profiler
+from models import db, Gnss
+from profiler import RequestProfile, redact, setup_profiler
+
+
+class ProfilerTestCase(unittest.TestCase):
+    '''Class representing the suite of SQL profiler test cases.'''
+
+    def setUp(self):
+        '''Defines an app profiled with a 0 slow query threshold.'''
+
+        self.settings = (profiler.SQL_PROFILE, profiler.SLOW_QUERY_SECONDS)
+        profiler.SQL_PROFILE = True
+        profiler.SLOW_QUERY_SECONDS = 0.0
+
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(self.app)
+        setup_profiler(self.app)
+
+        with self.app.app_context():
+            db.create_all()
+
+        @self.app.route('/gnss')
+        def gnss():
+            Gnss.query.filter_by(name='secret name').count()
+            return 'ok'
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        '''Restores the settings of the profiler.'''
+
+        profiler.SQL_PROFILE, profiler.SLOW_QUERY_SECONDS = self.settings
+
+    # -----------------------------------------------------------------------------------------------------------
+
+    def test_profile_headers(self):
+        '''Tests the Server-Timing and X-DB-* headers of a request.'''
+
+        res = self.client.get('/gnss')
+
+        self.assertEqual(res.headers['X-DB-Queries'], '1')
+        self.assertIn('db;dur=', res.headers['Server-Timing'])
+        self.assertIn('SELECT count(*)', res.headers['X-DB-Slowest'])
+
+    def test_slow_query_log_redacts_parameters(self):
+        '''Tests that slow statements are logged without their values.'''
+
+        with self.assertLogs('gnss_api.slow_queries') as logs:
+            self.client.get('/gnss')
+
+        self.assertIn('/gnss SELECT count(*)', logs.output[0])
+        self.assertIn('params=(str)', logs.output[0])
+        self.assertNotIn('secret name', logs.output[0])
+
+    def test_slowest_statements(self):
+        '''Tests that a profile keeps the slowest statements in order.'''
+
+        profile = RequestProfile(top=2)
+
+        for seconds, statement in [(1, 'a'), (3, 'b'), (2, 'c'), (0, 'd')]:
+            profile.record(statement, seconds)
+
+        self.assertEqual(profile.count, 4)
+        self.assertEqual(profile.seconds, 6)
+        self.assertEqual(profile.slowest, [(3, 'b'), (2, 'c')])
+        self.assertEqual(redact({'id': 1}), "{'id': int}")
+        self.assertEqual(redact([(1,), (2,)], executemany=True),
+                         '<2 parameter sets>')
+
+
+    def test_failed_statements_are_not_kept(self):
+        '''Tests that statements that raise leave no start time behind.'''
+
+        with self.app.app_context():
+            with db.engine.connect() as connection:
+                for _ in range(3):
+                    with self.assertRaises(DBAPIError):
+                        connection.execute('SELECT * FROM missing')
+
+                connection.execute('SELECT 1')
+
+                self.assertEqual(connection.info['profile_start'], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import base64
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from flask import Flask
+from sqlalchemy import create_engine
+
+import replicas
+from models import db, Gnss
+from replicas import read_only, setup_replicas, StickySubjects
+
+
+def bearer(sub):
+    '''Returns the Authorization header of a (unsigned) token of sub.'''
+
+    claims = base64.urlsafe_b64encode(json.dumps({'sub': sub}).encode())
+
+    return {'Authorization': f'Bearer e30.{claims.decode().rstrip("=")}.x'}
+
+
+class ReplicasTestCase(unittest.TestCase):
+    '''Class representing the suite of read replica routing test cases.'''
+
+    def setUp(self):
+        '''Defines an app on a primary and a replica SQLite database.'''
+
+        self.folder = tempfile.mkdtemp()
+        primary = 'sqlite:///' + os.path.join(self.folder, 'primary.db')
+        replica = 'sqlite:///' + os.path.join(self.folder, 'replica.db')
+
+        self.app = Flask(__name__)
+        self.app.secret_key = 'test'
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = primary
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(self.app)
+        setup_replicas(self.app, [replica])
+        replicas.sticky_subjects = StickySubjects()
+
+        # The same schema, with a different gnss in each database
+        with self.app.app_context():
+            db.create_all()
+            db.session.add(Gnss(name='GPS', owner='USA',
+                                num_satellites=32, num_frequencies=3))
+            db.session.commit()
+
+        replica_engine = create_engine(replica)
+        db.Model.metadata.create_all(replica_engine)
+        replica_engine.execute(Gnss.__table__.insert(),
+                               name='Galileo', owner='EU',
+                               num_satellites=36, num_frequencies=4)
+        replica_engine.dispose()
+
+        @self.app.route('/name')
+        @read_only
+        def name():
+            return Gnss.query.first().name
+
+        @self.app.route('/gnss', methods=['POST'])
+        def create():
+            Gnss(name='GLONASS', owner='Russia',
+                 num_satellites=24, num_frequencies=2).insert()
+            return 'created'
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        '''Removes the databases.'''
+
+        for engine in self.app.extensions['replicas']:
+            engine.dispose()
+
+        shutil.rmtree(self.folder)
+
+    # -----------------------------------------------------------------------------------------------------------
+
+    def test_reads_go_to_the_replica(self):
+        '''Tests that read only endpoints query the replica.'''
+
+        self.assertEqual(self.client.get('/name').data, b'Galileo')
+
+    def test_read_your_writes(self):
+        '''Tests that a client reads from the primary after a write.'''
+
+        self.client.post('/gnss')
+
+        self.assertEqual(self.client.get('/name').data, b'GPS')
+
+        # Another client (no session cookie) still uses the replica
+        self.assertEqual(self.app.test_client().get('/name').data,
+                         b'Galileo')
+
+    def test_read_your_writes_bearer(self):
+        '''Tests the sticky window of a client without the session cookie.'''
+
+        self.app.test_client().post('/gnss', headers=bearer('director'))
+
+        self.assertEqual(self.app.test_client().get(
+            '/name', headers=bearer('director')).data, b'GPS')
+
+        # Other tokens, or none, still use the replica
+        self.assertEqual(self.app.test_client().get(
+            '/name', headers=bearer('client')).data, b'Galileo')
+        self.assertEqual(self.app.test_client().get(
+            '/name', headers={'Authorization': 'Bearer garbage'}).data,
+            b'Galileo')
+
+    def test_sticky_subjects_are_bounded(self):
+        '''Tests that only the latest writers are remembered.'''
+
+        sticky_subjects = StickySubjects(max_size=2)
+
+        for sub in ('a', 'b', 'c'):
+            sticky_subjects.put(sub, 100.0)
+
+        self.assertIsNone(sticky_subjects.get('a'))
+        self.assertEqual(sticky_subjects.get('c'), 100.0)
+
+        # Windows that are over are dropped by the next write
+        sticky_subjects.put('d', 100.0 + replicas.REPLICA_STICKY_SECONDS)
+
+        self.assertIsNone(sticky_subjects.get('c'))
+
+    def test_sticky_window_ends(self):
+        '''Tests that the client is back on the replica after the window.'''
+
+        sticky_seconds = replicas.REPLICA_STICKY_SECONDS
+        replicas.REPLICA_STICKY_SECONDS = 0
+
+        try:
+            self.client.post('/gnss')
+            self.assertEqual(self.client.get('/name').data, b'Galileo')
+        finally:
+            replicas.REPLICA_STICKY_SECONDS = sticky_seconds
+
+    def test_no_replicas(self):
+        '''Tests that everything goes to the primary without replicas.'''
+
+        self.app.extensions['replicas'] = []
+
+        self.assertEqual(self.client.get('/name').data, b'GPS')
+
+
+if __name__ == "__main__":
+    unittest.main()
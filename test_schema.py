@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.mkdtemp(), 'gnss.db'))
+
+from alembic.script import ScriptDirectory
+from flask import Flask
+from sqlalchemy import event, select
+
+from models import (
+    db,
+    check_schema,
+    get_schema_revision,
+    SCHEMA_REVISION,
+    Gnss,
+    TableVersion
+)
+
+
+class SchemaTestCase(unittest.TestCase):
+    '''Class representing the suite of schema revision test cases.'''
+
+    def setUp(self):
+        '''Defines an app on an empty database.'''
+
+        self.folder = tempfile.mkdtemp()
+
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + \
+            os.path.join(self.folder, 'gnss.db')
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(self.app)
+
+        self.engine = db.get_engine(self.app)
+
+    def tearDown(self):
+        '''Removes the database.'''
+
+        self.engine.dispose()
+        shutil.rmtree(self.folder)
+
+    def statements(self):
+        '''Returns the statements run by check_schema.'''
+
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(self.engine, 'before_cursor_execute', record)
+        check_schema(self.app)
+        event.remove(self.engine, 'before_cursor_execute', record)
+
+        return statements
+
+    # -----------------------------------------------------------------------------------------------------------
+
+    def test_schema_revision_is_migrations_head(self):
+        '''Tests that SCHEMA_REVISION is the head of the migrations.'''
+
+        folder = os.path.join(os.path.dirname(__file__), 'migrations')
+
+        self.assertEqual(ScriptDirectory(folder).get_current_head(),
+                         SCHEMA_REVISION)
+
+    def test_empty_db_is_created_and_stamped(self):
+        '''Tests the first boot on an empty db, then the next ones.'''
+
+        check_schema(self.app)
+
+        self.assertEqual(get_schema_revision(self.engine), SCHEMA_REVISION)
+        self.assertTrue(self.engine.has_table(Gnss.__tablename__))
+        self.assertEqual(len(self.statements()), 1)
+
+    def test_table_versions_are_seeded(self):
+        '''Tests that a new db has the rows the writes bump.'''
+
+        check_schema(self.app)
+
+        table = TableVersion.__table__
+
+        self.assertEqual(dict(self.engine.execute(
+            select([table.c.name, table.c.version])).fetchall()),
+            {'gnss': 0, 'signal': 0})
+
+    def test_db_without_revision_is_not_stamped(self):
+        '''Tests that tables made by create_all alone get no revision,
+           and a warning to stamp them.'''
+
+        with self.app.app_context():
+            db.create_all()
+
+        with self.assertLogs(self.app.logger, 'WARNING') as logs:
+            check_schema(self.app)
+
+        self.assertIsNone(get_schema_revision(self.engine))
+        self.assertIn('flask db stamp head', logs.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
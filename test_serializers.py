@@ -0,0 +1,78 @@
+import unittest
+
+from flask import Flask, jsonify
+
+import serializers
+
+
+class SerializersTestCase(unittest.TestCase):
+    '''Class representing the suite of response serializer test cases.'''
+
+    def setUp(self):
+        '''Defines a bare app to compare with jsonify.'''
+
+        self.app = Flask(__name__)
+
+    def jsonify_bytes(self, obj):
+        '''Returns the body jsonify makes of obj.'''
+
+        with self.app.test_request_context():
+            return jsonify(obj).get_data()
+
+    # -----------------------------------------------------------------------------------------------------------
+
+    def test_engines_match_jsonify(self):
+        '''Tests that every JSON engine writes the same bytes as jsonify.'''
+
+        documents = [
+            {'success': True, 'signal': [{'id': 1, 'signal': 'L1 C/A',
+                                          'gnss_id': 1}],
+             'next_cursor': None},
+            {'success': True, 'gnss': [{'name': 'Galileo',
+                                        'owner': 'Européen'}]},
+            {'success': False, 'error': 422, 'message': 'Not processable',
+             'errors': ['"name" \\ "owner"\t\n', 2 ** 70]},
+            {'success': True, 'ping_seconds': 0.0012,
+             'pool': {'wait_seconds_max': 1e15 + 0.5, 'wait_seconds_avg': 0.0},
+             'caches': [{'hit_ratio': 0.75}]}
+        ]
+
+        for name, dumps in serializers.JSON_ENGINES.items():
+            for document in documents:
+                with self.subTest(engine=name, document=document):
+                    self.assertEqual(dumps(document) + b'\n',
+                                     self.jsonify_bytes(document))
+
+    def test_engines_floats(self):
+        '''Tests the floats orjson writes unlike the stdlib.'''
+
+        if 'orjson' not in serializers.JSON_ENGINES:
+            self.skipTest('orjson is not installed')
+
+        self.assertEqual(serializers.orjson_dumps([1.2e-05, 1e16]),
+                         b'[0.000012,1e16]')
+        self.assertEqual(serializers.stdlib_dumps([1.2e-05, 1e16]),
+                         b'[1.2e-05,1e+16]')
+
+    def test_json_response(self):
+        '''Tests the status and mimetype of json_response.'''
+
+        with self.app.test_request_context():
+            response = serializers.json_response({'success': False}, 404)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.mimetype, 'application/json')
+        self.assertEqual(response.get_data(), b'{"success":false}\n')
+
+    def test_columnar(self):
+        '''Tests that rows become one list per field.'''
+
+        rows = [{'id': 1, 'signal': 'L1C'}, {'id': 2, 'signal': 'L5'}]
+
+        self.assertEqual(serializers.columnar(rows),
+                         {'id': [1, 2], 'signal': ['L1C', 'L5']})
+        self.assertEqual(serializers.columnar([]), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import threading
+
+from token_cache import TokenCache
+
+
+class FakeClock:
+    '''A wall clock that only moves when told to.'''
+
+    def __init__(self):
+        self.now = 1600000000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    '''Class representing the suite of verified token cache test cases.'''
+
+    def setUp(self):
+        '''Defines a small cache with a controllable clock.'''
+
+        self.clock = FakeClock()
+        self.cache = TokenCache(max_size=2, clock=self.clock)
+        self.exp = int(self.clock.now) + 60
+
+    # -----------------------------------------------------------------------------------------------------------
+
+    def test_hit_and_miss(self):
+        '''Tests that a cached token is a hit, others are misses.'''
+
+        payload = {'exp': self.exp, 'permissions': ['get:signals']}
+
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.put('a', payload)
+
+        self.assertEqual(self.cache.get('a'), payload)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_entry_lives_until_exp(self):
+        '''Tests that an entry expires with the token, not before.'''
+
+        self.cache.put('a', {'exp': self.exp})
+
+        self.clock.now = self.exp
+        self.assertIsNotNone(self.cache.get('a'))
+
+        self.clock.now = self.exp + 1
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_token_without_exp_not_cached(self):
+        '''Tests that tokens without an exp claim are not cached.'''
+
+        self.cache.put('a', {'sub': 'x'})
+
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_lru_eviction(self):
+        '''Tests that the least recently used entry is evicted.'''
+
+        self.cache.put('a', {'exp': self.exp})
+        self.cache.put('b', {'exp': self.exp})
+        self.cache.get('a')
+        self.cache.put('c', {'exp': self.exp})
+
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_evict_and_revoke(self):
+        '''Tests explicit eviction and revocation.'''
+
+        self.cache.put('a', {'exp': self.exp})
+        self.cache.put('b', {'exp': self.exp})
+
+        self.assertTrue(self.cache.evict('a'))
+        self.assertIsNone(self.cache.get('a'))
+        self.assertFalse(self.cache.is_revoked('a'))
+
+        self.cache.revoke('b')
+        self.cache.put('b', {'exp': self.exp})
+        self.assertIsNone(self.cache.get('b'))
+        self.assertTrue(self.cache.is_revoked('b'))
+
+        self.clock.now = self.exp + 1
+        self.cache.evict_expired()
+        self.assertFalse(self.cache.is_revoked('b'))
+
+    def test_concurrent_access(self):
+        '''Tests that concurrent puts and gets keep the counters exact.'''
+
+        cache = TokenCache(max_size=64, clock=self.clock)
+
+        def worker(n):
+            for i in range(500):
+                token = f'{n}-{i % 100}'
+                if cache.get(token) is None:
+                    cache.put(token, {'exp': self.exp})
+
+        threads = [threading.Thread(target=worker, args=(n,))
+                   for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'] + stats['misses'], 2000)
+        self.assertLessEqual(stats['size'], 64)
+
+    # -----------------------------------------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    unittest.main()
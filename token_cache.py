@@ -0,0 +1,173 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_SIZE = 1024
+
+# How long a revocation is remembered when the token's exp is unknown
+REVOCATION_TTL = 86400
+
+# -----------------------------------------------------------------------------------------------------------
+
+
+class TokenCache:
+    ''' A bounded LRU cache of verified JWT payloads.
+
+        Entries are keyed by the SHA-256 of the token (the token itself
+        is never stored) and live until the token's exp claim, so a hit
+        is exactly as valid as a fresh verification.  Only successful
+        verifications are cached: a token that fails is verified in full
+        every time and raises the same AuthError as without the cache.
+        Revoked tokens are remembered until they expire so they can be
+        rejected even though their signature is valid.
+        Safe to share between threads. '''
+
+    def __init__(self, max_size=DEFAULT_SIZE, clock=time.time):
+        '''Constructor for the TokenCache class.'''
+
+        self.max_size = max_size
+        self.clock = clock
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._revoked = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token):
+        '''Returns the cache key of a token.'''
+
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def _now(self):
+        '''Whole seconds, like the exp check of jose.'''
+
+        return int(self.clock())
+
+    def get(self, token):
+        ''' Returns the cached payload of a token, or None if the token
+            is not cached (or expired, or revoked). '''
+
+        if self.max_size <= 0:
+            return None
+
+        key = self.key(token)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            payload, exp = entry
+
+            # Same boundary as jose: expired once exp < now
+            if exp < self._now():
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return payload
+
+    def put(self, token, payload):
+        ''' Caches the verified payload of a token until its exp claim.
+            Tokens without exp, or revoked tokens, are not cached. '''
+
+        if self.max_size <= 0:
+            return
+
+        exp = payload.get('exp')
+
+        if not isinstance(exp, int) or isinstance(exp, bool):
+            return
+
+        key = self.key(token)
+
+        with self._lock:
+            if key in self._revoked:
+                return
+
+            self._entries[key] = (payload, exp)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def evict(self, token):
+        '''Removes a token from the cache, returns True if it was cached.'''
+
+        with self._lock:
+            return self._entries.pop(self.key(token), None) is not None
+
+    def revoke(self, token):
+        ''' Removes a token from the cache and marks it as revoked,
+            see is_revoked(). '''
+
+        key = self.key(token)
+
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            exp = entry[1] if entry else self._now() + REVOCATION_TTL
+
+            self._revoked[key] = exp
+
+    def is_revoked(self, token):
+        '''Whether a token was revoked (works with the cache disabled).'''
+
+        if not self._revoked:
+            return False
+
+        with self._lock:
+            return self.key(token) in self._revoked
+
+    def evict_expired(self):
+        ''' Removes all expired entries (and revocations of expired
+            tokens), returns how many entries were removed. '''
+
+        now = self._now()
+
+        with self._lock:
+            expired = [key for key, (payload, exp) in self._entries.items()
+                       if exp < now]
+
+            for key in expired:
+                del self._entries[key]
+
+            for key in [key for key, exp in self._revoked.items()
+                        if exp < now]:
+                del self._revoked[key]
+
+            self.evictions += len(expired)
+
+        return len(expired)
+
+    def clear(self):
+        '''Empties the cache (revocations are kept).'''
+
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        '''Returns the size and the hit/miss counters of the cache.'''
+
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0
+            }